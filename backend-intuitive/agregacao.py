@@ -0,0 +1,100 @@
+import math
+import pandas as pd
+from limpeza import centavos_para_texto
+
+# Uma linha por CNPJ/trimestre no consolidado (a de maior valor, Item 1.3)
+CHAVE_CONSOLIDADO = ['cnpj', 'ano', 'trimestre']
+# Agrupamento das estatísticas de despesas_agregadas.csv (Item 2.3)
+CHAVE_AGREGADO = ['razao_social', 'uf']
+COLUNAS = CHAVE_CONSOLIDADO + CHAVE_AGREGADO + ['valor_centavos']
+
+
+class AgregadorIncremental:
+    """
+    Consolidação e agregação das despesas trimestre a trimestre, sem manter os DataFrames de todos os trimestres.
+    Cada DataFrame recebido em `adicionar` é reduzido ao maior valor por CNPJ/trimestre e descartado.
+    Por razão social/UF ficam só quantidade, soma (centavos exatos), média e M2 (Welford/Chan),
+    então a memória cresce com o número de operadoras x trimestres do consolidado, não com as linhas dos arquivos.
+    """
+
+    def __init__(self):
+        self._maximos = pd.DataFrame(columns=COLUNAS)
+        self._estatisticas = {}  # (razao_social, uf) -> [quantidade, soma, media, m2]
+
+    def _combinar(self, valores, sinal):
+        """Junta (sinal=1) ou retira (sinal=-1) um lote de valores das estatísticas de cada grupo."""
+        if valores.empty:
+            return
+        grupos = valores.groupby(CHAVE_AGREGADO, observed=True)['valor_centavos']
+        lote = pd.DataFrame({'n': grupos.count(), 'soma': grupos.sum(), 'media': grupos.mean(),
+                             'm2': grupos.var(ddof=0) * grupos.count()})
+
+        for chave, n_b, soma_b, media_b, m2_b in lote.itertuples(name=None):
+            n_a, soma_a, media_a, m2_a = self._estatisticas.get(chave, (0, 0, 0.0, 0.0))
+            if sinal > 0:
+                n = n_a + n_b
+                delta = media_b - media_a
+                self._estatisticas[chave] = [n, soma_a + int(soma_b), media_a + delta * n_b / n,
+                                             m2_a + m2_b + delta * delta * n_a * n_b / n]
+                continue
+
+            # Inverso da combinação: valor de um trimestre que foi substituído por um maior
+            n = n_a - n_b
+            if n <= 0:
+                self._estatisticas.pop(chave, None)
+                continue
+            media = (n_a * media_a - n_b * media_b) / n
+            delta = media_b - media
+            self._estatisticas[chave] = [n, soma_a - int(soma_b), media,
+                                         max(m2_a - m2_b - delta * delta * n * n_b / n_a, 0.0)]
+
+    def adicionar(self, df):
+        """
+        Incorpora as despesas de um arquivo/trimestre. Se o mesmo CNPJ/trimestre já tinha chegado antes,
+        vale o maior valor e as estatísticas são corrigidas. Retorna a quantidade de CNPJ/trimestres novos ou atualizados.
+        """
+        if df is None or df.empty:
+            return 0
+
+        # Maior valor por CNPJ/trimestre dentro do lote (mesma regra do sort + drop_duplicates)
+        lote = (df[COLUNAS].sort_values('valor_centavos', ascending=False, kind='stable')
+                .drop_duplicates(subset=CHAVE_CONSOLIDADO, keep='first'))
+
+        comparacao = lote.merge(self._maximos, on=CHAVE_CONSOLIDADO, how='left', suffixes=('', '_anterior'))
+        anterior = comparacao['valor_centavos_anterior']
+        novos = anterior.isna()
+        maiores = ~novos & (comparacao['valor_centavos'] > anterior.fillna(0))
+
+        anteriores = comparacao.loc[maiores, [f'{c}_anterior' for c in CHAVE_AGREGADO + ['valor_centavos']]]
+        anteriores.columns = CHAVE_AGREGADO + ['valor_centavos']
+        entradas = comparacao.loc[novos | maiores, COLUNAS]
+
+        self._combinar(anteriores, -1)
+        self._combinar(entradas, 1)
+
+        if not entradas.empty:
+            base = self._maximos if not self._maximos.empty else None
+            self._maximos = (pd.concat([entradas, base], ignore_index=True)
+                             .drop_duplicates(subset=CHAVE_CONSOLIDADO, keep='first'))
+        return len(entradas)
+
+    def consolidado(self):
+        """Maior valor por CNPJ/trimestre, do maior para o menor, com o valor em texto (consolidado_despesas.csv)."""
+        df = self._maximos.sort_values('valor_centavos', ascending=False).reset_index(drop=True)
+        df['valor_limpo'] = centavos_para_texto(df['valor_centavos'].astype('int64'))
+        return df
+
+    def agregado(self):
+        """Total, média e desvio padrão (amostral, como o pandas) por razão social/UF, em reais, do maior total para o menor."""
+        linhas = []
+        for (razao_social, uf), (n, soma, media, m2) in self._estatisticas.items():
+            linhas.append({
+                'razao_social': razao_social,
+                'uf': uf,
+                'total_despesas': soma / 100,
+                'media_trimestral': media / 100,
+                'desvio_padrao': math.sqrt(m2 / (n - 1)) / 100 if n > 1 else float('nan'),
+            })
+        df = pd.DataFrame(linhas, columns=['razao_social', 'uf', 'total_despesas', 'media_trimestral', 'desvio_padrao'])
+        # ascending=False já que foi solicitado ordem decrescente (item 2.3)
+        return df.sort_values(by='total_despesas', ascending=False).reset_index(drop=True)
@@ -0,0 +1,54 @@
+import time
+from sqlalchemy import text
+
+# Views materializadas lidas pelas queries de /api/estatisticas. O custo da agregação fica na carga do ETL,
+# a API lê só o resumo (poucos milhares de linhas) independente do tamanho do histórico.
+VIEWS_AGREGADAS = {
+    # Total por operadora e trimestre, base das queries de crescimento e de consistência
+    'mv_despesas_operadora_trimestre': (
+        """
+        SELECT reg_ans, ano, trimestre, periodo, SUM(vl_saldo_final) AS total
+        FROM despesas_consolidadas
+        GROUP BY reg_ans, ano, trimestre, periodo
+        """,
+        [
+            "CREATE UNIQUE INDEX IF NOT EXISTS uq_mv_despesas_operadora_trimestre "
+            "ON mv_despesas_operadora_trimestre (reg_ans, ano, trimestre)",
+            # Leitura só dos períodos pedidos (crescimento entre dois trimestres, intervalo do /api/estatisticas)
+            "CREATE INDEX IF NOT EXISTS ix_mv_despesas_periodo "
+            "ON mv_despesas_operadora_trimestre (periodo, reg_ans) INCLUDE (total)",
+        ],
+    ),
+    # Total por UF, calculado a partir da view anterior (precisa ser atualizada depois dela)
+    'mv_despesas_uf': (
+        """
+        SELECT o.uf, SUM(m.total) AS despesa_total, COUNT(DISTINCT m.reg_ans) AS qtd_operadoras
+        FROM mv_despesas_operadora_trimestre m
+        JOIN operadoras_ativas o ON m.reg_ans = o.registro_ans
+        GROUP BY o.uf
+        """,
+        ["CREATE UNIQUE INDEX IF NOT EXISTS uq_mv_despesas_uf ON mv_despesas_uf (uf)"],
+    ),
+}
+
+
+def criar_agregados(engine):
+    """Cria as views materializadas (já populadas) e os índices, incluindo os únicos usados no REFRESH CONCURRENTLY."""
+    with engine.begin() as conn:
+        for nome, (consulta, indices) in VIEWS_AGREGADAS.items():
+            conn.execute(text(f"CREATE MATERIALIZED VIEW IF NOT EXISTS {nome} AS {consulta}"))
+            for indice in indices:
+                conn.execute(text(indice))
+
+
+def atualizar_agregados(engine):
+    """
+    Atualiza as views ao final de uma carga do ETL, na ordem de dependência.
+    CONCURRENTLY mantém a API lendo a versão anterior enquanto a nova é calculada.
+    """
+    inicio = time.perf_counter()
+    with engine.connect() as conn:
+        conn = conn.execution_options(isolation_level='AUTOCOMMIT')
+        for nome in VIEWS_AGREGADAS:
+            conn.execute(text(f"REFRESH MATERIALIZED VIEW CONCURRENTLY {nome}"))
+    print(f"Views agregadas atualizadas em {time.perf_counter() - inicio:.2f}s")
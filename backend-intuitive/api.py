@@ -1,60 +1,119 @@
 import os
-from flask import Flask, request, jsonify
+import time
+import hashlib
+from functools import wraps
+from flask import Flask, Response, request, jsonify, make_response
 from flask_cors import CORS
-from repository import OperadoraRepository
+from repository import OperadoraRepository, chave_periodo
+from cache import RepositorioCache
+from database import engine
+from metricas import estado_pools, metricas_json, metricas_prometheus
+from sqlalchemy import text
 
 # Inicialização do Flask
 app = Flask(__name__)
 CORS(app) # Habilita CORS para o frontend (Vue.js) acessar
 
-# Instância do repositório
-repo = OperadoraRepository()
+# Instância do repositório, com cache invalidado pela versão dos dados publicada pelo ETL
+repo = RepositorioCache(OperadoraRepository())
+
+def resposta_condicional(rota):
+    """
+    Adiciona ETag/Last-Modified a partir da versão dos dados. Se o navegador já tem a versão atual
+    (If-None-Match / If-Modified-Since) devolve 304 sem consultar o repositório.
+    Se a versão não pôde ser lida a resposta sai sem ETag, o navegador não guarda nada dela.
+    """
+    @wraps(rota)
+    def wrapper(*args, **kwargs):
+        dados = repo.versao()
+        if dados is None:
+            return make_response(rota(*args, **kwargs))
+        versao, atualizado_em = dados
+        etag = hashlib.sha1(f"{versao}:{request.full_path}".encode()).hexdigest()
+        if atualizado_em is not None:
+            atualizado_em = atualizado_em.replace(microsecond=0)
+
+        if request.if_none_match:
+            nao_modificado = request.if_none_match.contains(etag)
+        else:
+            nao_modificado = (atualizado_em is not None and request.if_modified_since is not None
+                              and atualizado_em <= request.if_modified_since)
+
+        resposta = Response(status=304) if nao_modificado else make_response(rota(*args, **kwargs))
+        if resposta.status_code in (200, 304):
+            resposta.set_etag(etag)
+            if atualizado_em is not None:
+                resposta.last_modified = atualizado_em
+            # O navegador guarda a resposta mas sempre revalida com o servidor
+            resposta.headers['Cache-Control'] = 'no-cache'
+        return resposta
+    return wrapper
 
 @app.route('/api/operadoras', methods=['GET'])
+@resposta_condicional
 def listar_operadoras():
     """
     Lista todas as operadoras com paginação e busca.
-    Params: page (int), limit (int), search (str)
+    Params: page (int), limit (int), search (str), cursor (str, opcional - next_cursor da página anterior)
     """
     try:
         page = int(request.args.get('page', 1))
         limit = int(request.args.get('limit', 10))
         search = request.args.get('search', None)
+        cursor = request.args.get('cursor', None)
         
-        resultado = repo.get_todas_operadoras(page, limit, search)
+        resultado = repo.get_todas_operadoras(page, limit, search, cursor)
         
         # Estrutura de resposta com metadados (item 4.2)
         return jsonify(resultado)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 @app.route('/api/operadoras/<cnpj>', methods=['GET'])
+@resposta_condicional
 def detalhes_operadora(cnpj):
     """Retorna detalhes cadastrais de uma operadora"""
-    operadora = repo.get_operadora_detalhes(cnpj)
+    try:
+        operadora = repo.get_operadora_detalhes(cnpj)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
     if operadora:
         return jsonify(operadora)
     return jsonify({"message": "Operadora não encontrada"}), 404
 
 @app.route('/api/operadoras/<cnpj>/despesas', methods=['GET'])
+@resposta_condicional
 def despesas_operadora(cnpj):
     """Retorna histórico de despesas"""
-    despesas = repo.get_despesas_historico(cnpj)
+    try:
+        despesas = repo.get_despesas_historico(cnpj)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
     return jsonify(despesas) # Retorna lista vazia [] se não houver dados (Status 200 OK) 
 
 @app.route('/api/estatisticas', methods=['GET'])
+@resposta_condicional
 def estatisticas_gerais():
     """
     Retorna estatísticas agregadas:
     - Top 5 operadoras com maiores despesas (Total) - Requisito da rota
     - Top 5 operadoras com maior crescimento - Requisito da Query 1
     - Operadoras consistentemente acima da média.
+    Params: inicio, fim (opcionais, formato 3T2025) - intervalo analisado, padrão do primeiro ao último trimestre carregado
     """
+    try:
+        inicio = chave_periodo(request.args['inicio']) if request.args.get('inicio') else None
+        fim = chave_periodo(request.args['fim']) if request.args.get('fim') else None
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
     try:
         # Reutilizando as queries analíticas já existentes no seu repository
-        top_crescimento = repo.get_maior_crescimento()
-        top_uf = repo.get_despesas_por_uf()
-        consistencia = repo.get_operadoras_acima_media()
+        top_crescimento = repo.get_maior_crescimento(inicio, fim)
+        top_uf = repo.get_despesas_por_uf(inicio, fim)
+        consistencia = repo.get_operadoras_acima_media(inicio, fim)
         
         # Para "Top 5 Maiores Despesas Totais" (diferente de crescimento), 
         
@@ -67,6 +126,25 @@ def estatisticas_gerais():
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@app.route('/api/health', methods=['GET'])
+def saude():
+    """Banco acessível (SELECT 1 pelo pool) e estado das conexões. 503 se o banco não responde."""
+    inicio = time.perf_counter()
+    try:
+        with engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+    except Exception as e:
+        return jsonify({"status": "erro", "banco": str(e), "pools": estado_pools()}), 503
+    return jsonify({"status": "ok", "latencia_banco_ms": round((time.perf_counter() - inicio) * 1000, 2),
+                    "pools": estado_pools()})
+
+@app.route('/api/metrics', methods=['GET'])
+def metricas():
+    """Espera por conexão, conexões em uso/livres e latência por consulta. Texto do Prometheus ou ?formato=json."""
+    if request.args.get('formato') == 'json':
+        return jsonify(metricas_json())
+    return Response(metricas_prometheus(), mimetype='text/plain; version=0.0.4')
+
 if __name__ == '__main__':
     # Roda o servidor na porta 5000
     print("Iniciando API Intuitive Care...")
@@ -0,0 +1,178 @@
+import os
+import time
+import asyncio
+import hashlib
+import contextlib
+from datetime import timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from functools import wraps
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import JSONResponse, PlainTextResponse, Response
+from starlette.routing import Route
+from sqlalchemy import text
+from database import criar_engine_async
+from repository import chave_periodo
+from repository_async import OperadoraRepositoryAsync
+from cache import RepositorioCacheAsync
+from metricas import estado_pools, metricas_json, metricas_prometheus
+
+# Modo ASGI da API (uvicorn): mesmas rotas e respostas do api.py, com asyncpg e pool de conexões.
+# Cada requisição espera o banco sem ocupar uma thread, então a vazão acompanha o número de conexões do pool.
+engine_async = criar_engine_async()
+repo = RepositorioCacheAsync(OperadoraRepositoryAsync(engine_async), engine_async)
+
+def _etag_confere(cabecalho, etag):
+    """If-None-Match pode trazer várias ETags (fracas ou não) ou '*'."""
+    for valor in cabecalho.split(','):
+        valor = valor.strip()
+        if valor == '*' or valor.removeprefix('W/').strip('"') == etag:
+            return True
+    return False
+
+def _data_http(valor):
+    try:
+        return parsedate_to_datetime(valor)
+    except (TypeError, ValueError):
+        return None
+
+def resposta_condicional(rota):
+    """ETag/Last-Modified pela versão dos dados e 304 sem consultar o repositório, como no api.py."""
+    @wraps(rota)
+    async def wrapper(request):
+        dados = await repo.versao()
+        if dados is None:
+            return await rota(request)
+        versao, atualizado_em = dados
+        full_path = f"{request.url.path}?{request.url.query}"
+        etag = hashlib.sha1(f"{versao}:{full_path}".encode()).hexdigest()
+        if atualizado_em is not None:
+            atualizado_em = atualizado_em.replace(microsecond=0)
+
+        if request.headers.get('if-none-match'):
+            nao_modificado = _etag_confere(request.headers['if-none-match'], etag)
+        else:
+            desde = _data_http(request.headers.get('if-modified-since'))
+            nao_modificado = atualizado_em is not None and desde is not None and atualizado_em <= desde
+
+        resposta = Response(status_code=304) if nao_modificado else await rota(request)
+        if resposta.status_code in (200, 304):
+            resposta.headers['ETag'] = f'"{etag}"'
+            if atualizado_em is not None:
+                resposta.headers['Last-Modified'] = format_datetime(atualizado_em.astimezone(timezone.utc), usegmt=True)
+            # O navegador guarda a resposta mas sempre revalida com o servidor
+            resposta.headers['Cache-Control'] = 'no-cache'
+        return resposta
+    return wrapper
+
+@resposta_condicional
+async def listar_operadoras(request):
+    """
+    Lista todas as operadoras com paginação e busca.
+    Params: page (int), limit (int), search (str), cursor (str, opcional - next_cursor da página anterior)
+    """
+    try:
+        page = int(request.query_params.get('page', 1))
+        limit = int(request.query_params.get('limit', 10))
+        search = request.query_params.get('search', None)
+        cursor = request.query_params.get('cursor', None)
+
+        resultado = await repo.get_todas_operadoras(page, limit, search, cursor)
+        return JSONResponse(resultado)
+    except ValueError as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+    except Exception as e:
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+@resposta_condicional
+async def detalhes_operadora(request):
+    """Retorna detalhes cadastrais de uma operadora"""
+    try:
+        operadora = await repo.get_operadora_detalhes(request.path_params['cnpj'])
+    except Exception as e:
+        return JSONResponse({"error": str(e)}, status_code=500)
+    if operadora:
+        return JSONResponse(operadora)
+    return JSONResponse({"message": "Operadora não encontrada"}, status_code=404)
+
+@resposta_condicional
+async def despesas_operadora(request):
+    """Retorna histórico de despesas"""
+    try:
+        despesas = await repo.get_despesas_historico(request.path_params['cnpj'])
+    except Exception as e:
+        return JSONResponse({"error": str(e)}, status_code=500)
+    return JSONResponse(despesas)
+
+@resposta_condicional
+async def estatisticas_gerais(request):
+    """
+    Estatísticas agregadas (ver api.py). As três queries rodam ao mesmo tempo, cada uma na sua conexão do pool.
+    Params: inicio, fim (opcionais, formato 3T2025)
+    """
+    try:
+        inicio = chave_periodo(request.query_params['inicio']) if request.query_params.get('inicio') else None
+        fim = chave_periodo(request.query_params['fim']) if request.query_params.get('fim') else None
+    except ValueError as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+
+    try:
+        top_crescimento, top_uf, consistencia = await asyncio.gather(
+            repo.get_maior_crescimento(inicio, fim),
+            repo.get_despesas_por_uf(inicio, fim),
+            repo.get_operadoras_acima_media(inicio, fim),
+        )
+
+        return JSONResponse({
+            "top_crescimento": top_crescimento,
+            "distribuicao_uf": top_uf,
+            "consistencia": consistencia,
+            "mensagem": "Estatísticas geradas com sucesso."
+        })
+    except Exception as e:
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+async def saude(request):
+    """Banco acessível (SELECT 1 pelo pool) e estado das conexões. 503 se o banco não responde."""
+    inicio = time.perf_counter()
+    try:
+        async with engine_async.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+    except Exception as e:
+        return JSONResponse({"status": "erro", "banco": str(e), "pools": estado_pools()}, status_code=503)
+    return JSONResponse({"status": "ok", "latencia_banco_ms": round((time.perf_counter() - inicio) * 1000, 2),
+                         "pools": estado_pools()})
+
+async def metricas(request):
+    """Espera por conexão, conexões em uso/livres e latência por consulta. Texto do Prometheus ou ?formato=json."""
+    if request.query_params.get('formato') == 'json':
+        return JSONResponse(metricas_json())
+    return PlainTextResponse(metricas_prometheus(), media_type='text/plain; version=0.0.4')
+
+@contextlib.asynccontextmanager
+async def ciclo_de_vida(app):
+    yield
+    # Fecha as conexões do pool ao desligar o servidor
+    await engine_async.dispose()
+
+app = Starlette(
+    routes=[
+        Route('/api/operadoras', listar_operadoras, methods=['GET']),
+        Route('/api/operadoras/{cnpj}', detalhes_operadora, methods=['GET']),
+        Route('/api/operadoras/{cnpj}/despesas', despesas_operadora, methods=['GET']),
+        Route('/api/estatisticas', estatisticas_gerais, methods=['GET']),
+        Route('/api/health', saude, methods=['GET']),
+        Route('/api/metrics', metricas, methods=['GET']),
+    ],
+    # Habilita CORS para o frontend (Vue.js) acessar
+    middleware=[Middleware(CORSMiddleware, allow_origins=['*'])],
+    lifespan=ciclo_de_vida,
+)
+
+if __name__ == '__main__':
+    import uvicorn
+    # Mesma porta da API Flask, um processo por worker (ASYNC_WORKERS) e cada um com seu pool de conexões
+    print("Iniciando API Intuitive Care (ASGI)...")
+    uvicorn.run("api_async:app", host=os.getenv('API_HOST', '127.0.0.1'), port=5000,
+                workers=int(os.getenv('ASYNC_WORKERS', '1')))
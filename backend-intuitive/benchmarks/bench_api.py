@@ -0,0 +1,331 @@
+"""
+Teste de carga da API: popula um banco separado com um conjunto sintético (operadoras + despesas trimestrais),
+sobe a API (Flask do api.py ou ASGI do api_async.py) em outro processo e dispara requisições concorrentes
+com uma mistura parecida com o uso do dashboard: primeira página, páginas profundas (OFFSET), paginação por cursor,
+busca por nome/CNPJ, detalhes e despesas de CNPJs "quentes" (distribuição de Zipf) e estatísticas.
+Mostra por rota p50/p95/p99, requisições por segundo e erros. Serve para validar com números cada mudança de
+cache ou índice no OperadoraRepository.
+
+Uso:
+  python benchmarks/bench_api.py --operadoras 5000 --duracao 30 --concorrencia 16
+  python benchmarks/bench_api.py --servidor asgi --sem-cache
+  python benchmarks/bench_api.py --url http://localhost:5000 --sem-popular    # API já rodando
+O banco padrão é intuitive_care_bench (criado se não existir), nunca o da aplicação.
+"""
+import argparse
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+import requests
+
+PASTA_BACKEND = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PASTA_BACKEND))
+from benchmarks.fixtures_ans import cnpjs_validos, UFS, MODALIDADES  # noqa: E402
+
+PALAVRAS = ['UNIMED', 'SAUDE', 'ASSISTENCIA', 'MEDICA', 'ODONTO', 'VIDA', 'PLANO', 'HOSPITAL', 'CLINICA',
+            'COOPERATIVA', 'PAULISTA', 'MINEIRA', 'CARIOCA', 'NORDESTE', 'SUL', 'BRASIL', 'SEGURADORA', 'BEM']
+# Rota -> peso na mistura padrão
+MISTURA_PADRAO = {
+    'listar': 15, 'listar_pagina_profunda': 10, 'listar_cursor': 10, 'busca': 20,
+    'detalhes': 10, 'despesas': 20, 'estatisticas': 10, 'estatisticas_periodo': 5,
+}
+
+
+def ler_argumentos():
+    usuario = os.getenv('POSTGRES_USER', 'postgres')
+    senha = os.getenv('POSTGRES_PASSWORD', 'password')
+    host = os.getenv('DB_HOST', 'localhost')
+    parser = argparse.ArgumentParser(description="Teste de carga da API")
+    parser.add_argument('--banco', default=f"postgresql://{usuario}:{senha}@{host}:5432/intuitive_care_bench")
+    parser.add_argument('--operadoras', type=int, default=5000)
+    parser.add_argument('--trimestres', type=int, default=8, help="trimestres de despesas por operadora")
+    parser.add_argument('--contas', type=int, default=20, help="contas 411 por operadora e trimestre")
+    parser.add_argument('--sem-popular', action='store_true', help="usa os dados que já estão no banco")
+    parser.add_argument('--servidor', choices=['flask', 'asgi'], default='flask')
+    parser.add_argument('--url', help="API já em execução (não sobe servidor nem popula o banco)")
+    parser.add_argument('--sem-cache', action='store_true', help="desliga o cache do repositório no servidor")
+    parser.add_argument('--duracao', type=float, default=20, help="segundos de carga medidos")
+    parser.add_argument('--aquecimento', type=float, default=3, help="segundos de carga antes de medir")
+    parser.add_argument('--concorrencia', type=int, default=16, help="clientes simultâneos")
+    parser.add_argument('--mistura', help="pesos por rota, ex: busca=30,despesas=30,estatisticas=10")
+    parser.add_argument('--revalidar', type=float, default=0.0,
+                        help="fração das requisições repetidas que mandam If-None-Match (navegador revalidando)")
+    parser.add_argument('--semente', type=int, default=42)
+    parser.add_argument('--saida', help="grava o resultado em JSON")
+    return parser.parse_args()
+
+
+def _criar_banco(url):
+    """Cria o banco de benchmark no servidor Postgres, se ainda não existir."""
+    from sqlalchemy import create_engine, text
+    base, nome = url.rsplit('/', 1)
+    engine = create_engine(f"{base}/postgres", isolation_level='AUTOCOMMIT')
+    with engine.connect() as conn:
+        if not conn.execute(text("SELECT 1 FROM pg_database WHERE datname = :n"), {"n": nome}).scalar():
+            conn.execute(text(f'CREATE DATABASE "{nome}"'))
+    engine.dispose()
+
+
+def popular(args):
+    """Apaga e recria as tabelas do banco de benchmark com `operadoras` x `trimestres` x `contas` despesas."""
+    import pandas as pd
+    from sqlalchemy import text
+    from database import engine, criar_tabelas
+    from bulk_loader import copiar_dataframe
+    from migracoes import garantir_particoes_despesas
+    from agregados import atualizar_agregados
+    from cache import incrementar_versao_dados
+
+    with engine.begin() as conn:
+        conn.execute(text("DROP TABLE IF EXISTS despesas_consolidadas, operadoras_ativas, migracoes_schema CASCADE"))
+    criar_tabelas()
+
+    rng = np.random.default_rng(args.semente)
+    n = args.operadoras
+    registros = [f"{300000 + i:06d}" for i in range(n)]
+    nomes = [' '.join(rng.choice(PALAVRAS, 3, replace=False)) + f" {i:05d} LTDA" for i in range(n)]
+    operadoras = pd.DataFrame({
+        'registro_ans': registros,
+        'cnpj': cnpjs_validos(rng.integers(0, 10, size=(n, 12))),
+        'razao_social': nomes,
+        'modalidade': rng.choice(MODALIDADES, n),
+        'uf': rng.choice(UFS, n),
+    })
+    copiar_dataframe(operadoras, 'operadoras_ativas', modo='replace')
+
+    # Trimestres mais recentes primeiro, atravessando anos (mais de uma partição de despesas)
+    periodos = [(2025 - i // 4, 4 - i % 4) for i in range(args.trimestres)]
+    garantir_particoes_despesas(engine, {ano for ano, _ in periodos})
+    contas = [f"411{c:05d}" for c in range(args.contas)]
+    for ano, trimestre in periodos:
+        linhas = n * len(contas)
+        valores = rng.lognormal(11, 2, linhas) / 100
+        copiar_dataframe(pd.DataFrame({
+            'reg_ans': np.repeat(registros, len(contas)),
+            'cd_conta_contabil': np.tile(contas, n),
+            'vl_saldo_final': np.round(valores, 2),
+            'ano': ano,
+            'trimestre': trimestre,
+        }), 'despesas_consolidadas')
+
+    with engine.begin() as conn:
+        conn.execute(text("ANALYZE"))
+    atualizar_agregados(engine)
+    incrementar_versao_dados()
+    return periodos
+
+
+def _porta_livre():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def subir_servidor(args):
+    """API em outro processo (o gerador de carga não disputa o GIL com ela). Retorna (processo, url)."""
+    porta = _porta_livre()
+    env = dict(os.environ, DATABASE_URL=args.banco, DB_PAPEL='api')
+    if args.sem_cache:
+        env['CACHE_MAX_ITENS'] = '0'
+    if args.servidor == 'asgi':
+        comando = [sys.executable, '-m', 'uvicorn', 'api_async:app', '--port', str(porta), '--log-level', 'warning']
+    else:
+        comando = [sys.executable, '-c', "import api; from werkzeug.serving import run_simple; "
+                   f"run_simple('127.0.0.1', {porta}, api.app, threaded=True)"]
+    processo = subprocess.Popen(comando, cwd=PASTA_BACKEND, env=env,
+                                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    url = f"http://127.0.0.1:{porta}"
+    limite = time.monotonic() + 30
+    while time.monotonic() < limite:
+        try:
+            if requests.get(f"{url}/api/health", timeout=1).status_code == 200:
+                return processo, url
+        except requests.RequestException:
+            pass
+        if processo.poll() is not None:
+            break
+        time.sleep(0.2)
+    processo.terminate()
+    raise SystemExit("A API não subiu, confira a conexão com o banco de benchmark.")
+
+
+class Cenario:
+    """Gera as requisições de cada rota a partir do que existe no banco (CNPJs, total de operadoras, períodos)."""
+
+    def __init__(self, url, semente):
+        self.url = url
+        primeira = requests.get(f"{url}/api/operadoras", params={"limit": 100}).json()
+        self.total = primeira['total']
+        self.cnpjs = [o['cnpj'] for o in primeira['data']]
+        # Mais CNPJs a partir de páginas espalhadas pela base
+        for pagina in range(2, 2 + min(20, max(self.total // 100 - 1, 0))):
+            dados = requests.get(f"{url}/api/operadoras", params={"limit": 100, "page": pagina * 3}).json()['data']
+            self.cnpjs += [o['cnpj'] for o in dados]
+        if not self.cnpjs:
+            raise SystemExit("Banco sem operadoras, rode sem --sem-popular.")
+        self.termos = PALAVRAS + [c[:5] for c in self.cnpjs[:20]]
+        # Zipf (s=1.1): poucos CNPJs concentram a maior parte dos acessos, como operadoras grandes no dashboard
+        random.Random(semente).shuffle(self.cnpjs)
+        self.pesos_cnpj = list(np.cumsum(1 / np.arange(1, len(self.cnpjs) + 1) ** 1.1))
+
+    def requisicao(self, rota, rng, cursor):
+        """(caminho, parâmetros) de uma requisição da `rota`."""
+        if rota == 'listar':
+            return "/api/operadoras", {"page": 1, "limit": 10}
+        if rota == 'listar_pagina_profunda':
+            return "/api/operadoras", {"page": rng.randint(max(self.total // 20, 1), max(self.total // 10, 1)), "limit": 10}
+        if rota == 'listar_cursor':
+            return "/api/operadoras", {"limit": 10, **({"cursor": cursor} if cursor else {})}
+        if rota == 'busca':
+            return "/api/operadoras", {"search": rng.choice(self.termos), "limit": 10}
+        if rota in ('detalhes', 'despesas'):
+            cnpj = rng.choices(self.cnpjs, cum_weights=self.pesos_cnpj)[0]
+            return (f"/api/operadoras/{cnpj}" + ("/despesas" if rota == 'despesas' else "")), {}
+        if rota == 'estatisticas':
+            return "/api/estatisticas", {}
+        return "/api/estatisticas", {"inicio": "1T2025", "fim": "4T2025"}
+
+
+def percentil(valores, p):
+    if not valores:
+        return None
+    ordenados = sorted(valores)
+    return ordenados[min(int(round(p / 100 * (len(ordenados) - 1))), len(ordenados) - 1)]
+
+
+def gerar_carga(cenario, mistura, args):
+    """Clientes em threads (sessão keep-alive cada), durante aquecimento + duração. Retorna as medições da janela medida."""
+    rotas, pesos = zip(*mistura.items())
+    medicoes = {rota: {"latencias": [], "erros": 0, "nao_modificado": 0} for rota in rotas}
+    lock = threading.Lock()
+    inicio_medicao = time.monotonic() + args.aquecimento
+    fim = inicio_medicao + args.duracao
+
+    def cliente(indice):
+        rng = random.Random(args.semente + indice)
+        sessao = requests.Session()
+        cursor, etags = None, {}
+        while True:
+            agora = time.monotonic()
+            if agora >= fim:
+                break
+            rota = rng.choices(rotas, pesos)[0]
+            caminho, params = cenario.requisicao(rota, rng, cursor)
+            chave = (caminho, tuple(sorted(params.items())))
+            cabecalhos = {}
+            if chave in etags and rng.random() < args.revalidar:
+                cabecalhos['If-None-Match'] = etags[chave]
+
+            inicio = time.perf_counter()
+            try:
+                resposta = sessao.get(cenario.url + caminho, params=params, headers=cabecalhos, timeout=30)
+                ok = resposta.status_code in (200, 304, 404)
+            except requests.RequestException:
+                resposta, ok = None, False
+            latencia = time.perf_counter() - inicio
+
+            if resposta is not None and resposta.status_code == 200:
+                if 'ETag' in resposta.headers:
+                    etags[chave] = resposta.headers['ETag']
+                if rota == 'listar_cursor':
+                    # Segue a paginação até o fim e recomeça
+                    cursor = resposta.json().get('next_cursor')
+
+            if agora >= inicio_medicao:
+                with lock:
+                    medicao = medicoes[rota]
+                    medicao["latencias"].append(latencia)
+                    medicao["erros"] += not ok
+                    medicao["nao_modificado"] += resposta is not None and resposta.status_code == 304
+        sessao.close()
+
+    threads = [threading.Thread(target=cliente, args=(i,)) for i in range(args.concorrencia)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return medicoes
+
+
+def resumir(medicoes, duracao):
+    resultado = {}
+    todas = []
+    for rota, medicao in medicoes.items():
+        latencias = medicao["latencias"]
+        todas += latencias
+        resultado[rota] = {
+            "requisicoes": len(latencias),
+            "rps": round(len(latencias) / duracao, 1),
+            "erros": medicao["erros"],
+            "nao_modificado": medicao["nao_modificado"],
+            **{f"p{p}_ms": round(percentil(latencias, p) * 1000, 2) if latencias else None for p in (50, 95, 99)},
+        }
+    resultado["total"] = {
+        "requisicoes": len(todas),
+        "rps": round(len(todas) / duracao, 1),
+        "erros": sum(m["erros"] for m in medicoes.values()),
+        "nao_modificado": sum(m["nao_modificado"] for m in medicoes.values()),
+        **{f"p{p}_ms": round(percentil(todas, p) * 1000, 2) if todas else None for p in (50, 95, 99)},
+    }
+    return resultado
+
+
+def imprimir(resultado):
+    print(f"\n{'Rota':<24}{'Req':>8}{'RPS':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'Erros':>7}{'304':>6}")
+    for rota, r in resultado.items():
+        if rota == 'total':
+            print("-" * 81)
+        print(f"{rota:<24}{r['requisicoes']:>8}{r['rps']:>9}{r['p50_ms'] or 0:>9}{r['p95_ms'] or 0:>9}"
+              f"{r['p99_ms'] or 0:>9}{r['erros']:>7}{r['nao_modificado']:>6}")
+
+
+def main():
+    args = ler_argumentos()
+    mistura = dict(MISTURA_PADRAO)
+    if args.mistura:
+        mistura = {rota: float(peso) for rota, peso in (item.split('=') for item in args.mistura.split(','))}
+        desconhecidas = set(mistura) - set(MISTURA_PADRAO)
+        if desconhecidas:
+            raise SystemExit(f"Rotas desconhecidas na mistura: {', '.join(sorted(desconhecidas))}")
+
+    processo = None
+    if args.url:
+        url = args.url.rstrip('/')
+    else:
+        if not args.sem_popular:
+            _criar_banco(args.banco)
+            # Antes de qualquer import que carregue database.py
+            os.environ['DATABASE_URL'] = args.banco
+            os.environ['DB_PAPEL'] = 'etl'
+            inicio = time.perf_counter()
+            popular(args)
+            print(f"Banco populado em {time.perf_counter() - inicio:.1f}s: {args.operadoras} operadoras, "
+                  f"{args.operadoras * args.trimestres * args.contas} despesas")
+        processo, url = subir_servidor(args)
+
+    try:
+        cenario = Cenario(url, args.semente)
+        print(f"Carga em {url}: {args.concorrencia} clientes, {args.aquecimento:g}s de aquecimento + {args.duracao:g}s medidos")
+        resultado = resumir(gerar_carga(cenario, mistura, args), args.duracao)
+    finally:
+        if processo is not None:
+            processo.terminate()
+            processo.wait()
+
+    imprimir(resultado)
+    if args.saida:
+        with open(args.saida, 'w', encoding='utf-8') as f:
+            json.dump({"parametros": vars(args), "mistura": mistura, "rotas": resultado}, f, ensure_ascii=False, indent=2)
+    return 1 if resultado["total"]["erros"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,84 @@
+"""
+Micro-benchmark da limpeza de valores e validação de CNPJ.
+Compara o caminho antigo (apply linha a linha com Decimal e validate_docbr) com o vetorizado do limpeza.py.
+
+Uso: python benchmarks/bench_limpeza.py --linhas 500000 --operadoras 1200
+"""
+import argparse
+import random
+import re
+import sys
+import time
+from decimal import Decimal
+from pathlib import Path
+
+import pandas as pd
+from validate_docbr import CNPJ
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from limpeza import valores_para_centavos, validar_cnpjs  # noqa: E402
+
+
+def limpar_valor_apply(serie):
+    """Implementação original do etl_process (Decimal por linha)."""
+    def limpar_valor(val):
+        try:
+            return Decimal(str(val).replace(',', '.'))
+        except Exception:
+            return Decimal('0.00')
+    return serie.apply(limpar_valor)
+
+
+def validar_cnpj_apply(serie):
+    """Implementação original do etl_process (regex + validate_docbr por linha)."""
+    validador = CNPJ()
+
+    def validar_cnpj_limpo(valor):
+        if pd.isna(valor):
+            return False
+        return validador.validate(re.sub(r'\D', '', str(valor)))
+    return serie.apply(validar_cnpj_limpo)
+
+
+def gerar_dados(linhas, operadoras, seed=42):
+    rnd = random.Random(seed)
+    gerador = CNPJ()
+    cnpjs = [gerador.generate(mask=rnd.random() < 0.5) for _ in range(operadoras)]
+    # Uma parte dos CNPJs é inválida de propósito
+    cnpjs += [f"{rnd.randrange(10**13, 10**14)}" for _ in range(operadoras // 10)]
+
+    valores = pd.Series([f"{rnd.randint(-1000, 10**8)},{rnd.randint(0, 99):02d}" for _ in range(linhas)])
+    coluna_cnpj = pd.Series([rnd.choice(cnpjs) for _ in range(linhas)])
+    return valores, coluna_cnpj
+
+
+def medir(nome, funcao, serie):
+    inicio = time.perf_counter()
+    resultado = funcao(serie)
+    duracao = time.perf_counter() - inicio
+    print(f"{nome:<28} {duracao:8.3f}s  {len(serie) / duracao:>14,.0f} linhas/s")
+    return resultado, duracao
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--linhas', type=int, default=500_000)
+    parser.add_argument('--operadoras', type=int, default=1_200)
+    args = parser.parse_args()
+
+    valores, cnpjs = gerar_dados(args.linhas, args.operadoras)
+    print(f"{args.linhas:,} linhas, {cnpjs.nunique():,} CNPJs distintos\n")
+
+    antigo, t_antigo = medir('valor: apply + Decimal', limpar_valor_apply, valores)
+    novo, t_novo = medir('valor: vetorizado (centavos)', valores_para_centavos, valores)
+    assert (antigo * 100).astype('int64').equals(novo), "Resultados de valor divergentes"
+    print(f"{'':<28} {t_antigo / t_novo:8.1f}x\n")
+
+    antigo, t_antigo = medir('cnpj: apply + validate_docbr', validar_cnpj_apply, cnpjs)
+    novo, t_novo = medir('cnpj: lote + cache', validar_cnpjs, cnpjs)
+    assert antigo.astype(bool).equals(novo), "Resultados de CNPJ divergentes"
+    print(f"{'':<28} {t_antigo / t_novo:8.1f}x")
+
+
+if __name__ == '__main__':
+    main()
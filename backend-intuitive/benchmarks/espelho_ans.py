@@ -0,0 +1,168 @@
+"""
+Servidor HTTP local que imita o FTP de dados abertos da ANS, para testar o ETL e o downloader sem rede.
+Serve uma pasta com o mesmo layout do FTP (operadoras_de_plano_de_saude_ativas/, demonstracoes_contabeis/<ano>/)
+com índice de diretório, ETag/Last-Modified, 304 (If-None-Match/If-Modified-Since) e Range/If-Range (206).
+Com --cortar-apos a primeira resposta de cada arquivo é interrompida depois de N bytes, para exercitar a retomada.
+Com --fixtures a pasta é montada a partir dos arquivos sintéticos (fixtures_ans.py), um ZIP por trimestre.
+
+Uso:
+  python benchmarks/espelho_ans.py --fixtures --escala 0.2 --porta 8765
+  ANS_BASE_URL=http://localhost:8765/ python main.py
+"""
+import argparse
+import email.utils
+import hashlib
+import html
+import io
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import zipfile
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from benchmarks.fixtures_ans import gerar_conjunto  # noqa: E402
+
+
+def montar_espelho(destino, escala, trimestres, fixtures):
+    """Pasta no layout do FTP da ANS com o cadastro e um ZIP por trimestre sintético."""
+    cadastro, arquivos = gerar_conjunto(fixtures, escala, trimestres)
+    pasta_cadastro = Path(destino) / 'operadoras_de_plano_de_saude_ativas'
+    pasta_cadastro.mkdir(parents=True, exist_ok=True)
+    alvo = pasta_cadastro / 'Relatorio_cadop.csv'
+    if not alvo.exists():
+        shutil.copyfile(cadastro, alvo)
+    for nome, caminho, _ in arquivos:
+        ano = nome[2:6]
+        pasta_ano = Path(destino) / 'demonstracoes_contabeis' / ano
+        pasta_ano.mkdir(parents=True, exist_ok=True)
+        zip_trimestre = pasta_ano / f"{Path(nome).stem}.zip"
+        if not zip_trimestre.exists():
+            with zipfile.ZipFile(zip_trimestre, 'w', zipfile.ZIP_DEFLATED) as zf:
+                zf.write(caminho, nome)
+    return destino
+
+
+class EspelhoANS(SimpleHTTPRequestHandler):
+    """Arquivos estáticos com validação condicional e faixas de bytes, como o Apache do FTP da ANS."""
+
+    cortar_apos = None
+    _cortados = set()
+    _lock = threading.Lock()
+
+    def log_message(self, *args):
+        pass
+
+    def _etag(self, estado):
+        return '"' + hashlib.md5(f"{estado.st_mtime_ns}-{estado.st_size}".encode()).hexdigest() + '"'
+
+    def send_head(self):
+        caminho = self.translate_path(self.path)
+        if os.path.isdir(caminho):
+            return super().send_head()
+        try:
+            arquivo = open(caminho, 'rb')
+        except OSError:
+            self.send_error(404, "Arquivo não encontrado")
+            return None
+
+        estado = os.fstat(arquivo.fileno())
+        etag = self._etag(estado)
+        modificado = email.utils.formatdate(estado.st_mtime, usegmt=True)
+        tamanho = estado.st_size
+
+        if self.headers.get('If-None-Match') == etag or (
+                'If-None-Match' not in self.headers and self.headers.get('If-Modified-Since') == modificado):
+            arquivo.close()
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Last-Modified', modificado)
+            self.end_headers()
+            return None
+
+        inicio = 0
+        faixa = self.headers.get('Range')
+        if_range = self.headers.get('If-Range')
+        if faixa and faixa.startswith('bytes=') and if_range in (None, etag, modificado):
+            inicio = int(faixa[6:].split('-')[0] or 0)
+            if inicio >= tamanho:
+                arquivo.close()
+                self.send_response(416)
+                self.send_header('Content-Range', f"bytes */{tamanho}")
+                self.end_headers()
+                return None
+            arquivo.seek(inicio)
+            self.send_response(206)
+            self.send_header('Content-Range', f"bytes {inicio}-{tamanho - 1}/{tamanho}")
+        else:
+            self.send_response(200)
+        self.send_header('Content-Type', self.guess_type(caminho))
+        self.send_header('Content-Length', str(tamanho - inicio))
+        self.send_header('ETag', etag)
+        self.send_header('Last-Modified', modificado)
+        self.send_header('Accept-Ranges', 'bytes')
+        self.end_headers()
+        return arquivo
+
+    def copyfile(self, origem, destino):
+        limite = self.cortar_apos
+        with self._lock:
+            cortar = limite is not None and self.path not in self._cortados
+            if cortar:
+                self._cortados.add(self.path)
+        if not cortar:
+            return super().copyfile(origem, destino)
+        # Simula a conexão caindo no meio da transferência
+        destino.write(origem.read(limite))
+        destino.flush()
+        self.close_connection = True
+        self.connection.shutdown(2)
+
+    def list_directory(self, path):
+        # Índice no formato do Apache (nome, data e tamanho depois do link), como o crawler espera
+        linhas = ['<html><body><pre><a href="?C=N;O=D">Name</a>', '<a href="../">Parent Directory</a>']
+        for nome in sorted(os.listdir(path)):
+            completo = os.path.join(path, nome)
+            estado = os.stat(completo)
+            data = time.strftime('%Y-%m-%d %H:%M', time.gmtime(estado.st_mtime))
+            href = nome + ('/' if os.path.isdir(completo) else '')
+            tamanho = '-' if os.path.isdir(completo) else f"{estado.st_size / 1024:.0f}K"
+            linhas.append(f'<a href="{html.escape(href)}">{html.escape(href)}</a>  {data}  {tamanho}')
+        corpo = ('\n'.join(linhas) + '</pre></body></html>').encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(corpo)))
+        self.end_headers()
+        return io.BytesIO(corpo)
+
+
+def servir(pasta, porta=8765, cortar_apos=None, em_segundo_plano=False):
+    """Sobe o espelho em `porta`. Com `em_segundo_plano` roda numa thread e retorna o servidor (use .shutdown())."""
+    manipulador = type('Espelho', (EspelhoANS,), {'cortar_apos': cortar_apos, '_cortados': set()})
+    servidor = ThreadingHTTPServer(('localhost', porta), lambda *a: manipulador(*a, directory=str(pasta)))
+    if em_segundo_plano:
+        threading.Thread(target=servidor.serve_forever, daemon=True).start()
+        return servidor
+    print(f"Espelho da ANS em http://localhost:{porta}/ servindo {pasta}")
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        servidor.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Espelho local do FTP da ANS")
+    parser.add_argument('--pasta', default=os.path.join(tempfile.gettempdir(), 'espelho_ans'))
+    parser.add_argument('--porta', type=int, default=8765)
+    parser.add_argument('--fixtures', action='store_true', help="monta a pasta com os arquivos sintéticos")
+    parser.add_argument('--escala', type=float, default=0.2)
+    parser.add_argument('--trimestres', type=int, default=3)
+    parser.add_argument('--cortar-apos', type=int, help="interrompe a primeira resposta de cada arquivo após N bytes")
+    args = parser.parse_args()
+    if args.fixtures:
+        montar_espelho(args.pasta, args.escala, args.trimestres, os.path.join(tempfile.gettempdir(), 'fixtures_ans'))
+    servir(args.pasta, args.porta, args.cortar_apos)
@@ -0,0 +1,171 @@
+"""
+Arquivos sintéticos no formato dos dados abertos da ANS, para benchmarks sem depender do FTP.
+- Cadastro de operadoras ativas (Relatorio_cadop.csv): CNPJs com dígitos verificadores válidos e alguns inválidos.
+- Demonstrações contábeis trimestrais (1T2025.csv...): plano de contas com a fração de linhas 411 de um trimestre real,
+  valores com vírgula decimal (negativos e zerados inclusos), operadoras fora do cadastro e encodings variados.
+Tudo determinístico pela semente, os arquivos são gerados em blocos (memória constante em qualquer escala).
+
+Uso: python benchmarks/fixtures_ans.py --escala 5 --trimestres 3 --destino /tmp/fixtures_ans
+"""
+import argparse
+import csv
+import os
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+# Ordem de grandeza de um trimestre real das demonstrações contábeis (~60MB de CSV)
+LINHAS_TRIMESTRE_REAL = 700_000
+OPERADORAS_REAL = 1_100
+# Linhas com conta iniciada em 411 num trimestre real
+FRACAO_411 = 0.30
+LINHAS_POR_BLOCO = 100_000
+# Os arquivos da ANS já vieram em UTF-8, UTF-8 com BOM e Latin-1 dependendo do ano
+ENCODINGS = ('utf-8', 'latin1', 'utf-8-sig')
+
+
+def _plano_de_contas(prefixos, quantidade, semente):
+    """Códigos contábeis de 3 a 9 dígitos abaixo dos `prefixos`, como os níveis do plano de contas da ANS."""
+    rng = np.random.default_rng(semente)
+    contas = set(prefixos)
+    while len(contas) < quantidade:
+        prefixo = prefixos[rng.integers(len(prefixos))]
+        contas.add(prefixo + ''.join(map(str, rng.integers(1, 10, rng.integers(1, 7)))))
+    return np.array(sorted(contas))
+
+
+CONTAS_411 = _plano_de_contas(['411'], 300, 1)
+CONTAS_OUTRAS = _plano_de_contas(['1', '2', '3', '31', '41', '412', '42', '43', '44', '46', '47', '49'], 700, 2)
+DESCRICOES = np.array(['EVENTOS/SINISTROS CONHECIDOS OU AVISADOS DE ASSISTÊNCIA À SAÚDE',
+                       'CONTRAPRESTAÇÕES EFETIVAS DE OPERAÇÕES DE PLANOS DE ASSISTÊNCIA À SAÚDE',
+                       'DESPESAS ADMINISTRATIVAS', 'PROVISÕES TÉCNICAS DE OPERAÇÕES DE ASSISTÊNCIA À SAÚDE',
+                       'APLICAÇÕES FINANCEIRAS', 'OUTRAS DESPESAS OPERACIONAIS'])
+UFS = np.array(['SP', 'RJ', 'MG', 'RS', 'PR', 'SC', 'BA', 'PE', 'CE', 'GO', 'DF', 'ES', 'PA', 'AM', 'MT'])
+MODALIDADES = np.array(['Medicina de Grupo', 'Cooperativa Médica', 'Odontologia de Grupo', 'Autogestão',
+                        'Seguradora Especializada em Saúde', 'Filantropia'])
+
+
+def cnpjs_validos(raizes):
+    """CNPJs com dígitos verificadores corretos a partir de raízes de 12 dígitos (matriz numpy de dígitos)."""
+    pesos_1 = np.array([5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2])
+    pesos_2 = np.array([6, 5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2])
+    resto = (raizes @ pesos_1) % 11
+    d1 = np.where(resto < 2, 0, 11 - resto)
+    com_d1 = np.column_stack([raizes, d1])
+    resto = (com_d1 @ pesos_2) % 11
+    d2 = np.where(resto < 2, 0, 11 - resto)
+    digitos = np.column_stack([com_d1, d2])
+    return [''.join(map(str, linha)) for linha in digitos]
+
+
+def registros_ans(operadoras):
+    """Registros ANS (6 dígitos) das operadoras sintéticas, sempre os mesmos para a mesma quantidade."""
+    return np.array([f"{300000 + i * 7:06d}" for i in range(operadoras)])
+
+
+def gerar_cadastro(caminho, operadoras=OPERADORAS_REAL, semente=42, fracao_cnpj_invalido=0.02):
+    """Relatorio_cadop.csv com o cabeçalho do arquivo real (só as colunas usadas e algumas a mais)."""
+    rng = np.random.default_rng(semente)
+    cnpjs = cnpjs_validos(rng.integers(0, 10, size=(operadoras, 12)))
+    invalidos = rng.random(operadoras) < fracao_cnpj_invalido
+    cnpjs = [c[:-1] + str((int(c[-1]) + 1) % 10) if ruim else c for c, ruim in zip(cnpjs, invalidos)]
+
+    df = pd.DataFrame({
+        'REGISTRO_OPERADORA': registros_ans(operadoras),
+        'CNPJ': cnpjs,
+        'Razao_Social': [f"OPERADORA SINTÉTICA {i:05d} SAÚDE LTDA" for i in range(operadoras)],
+        'Nome_Fantasia': [f"SINTÉTICA {i}" for i in range(operadoras)],
+        'Modalidade': rng.choice(MODALIDADES, operadoras),
+        'Cidade': 'São Paulo',
+        'UF': rng.choice(UFS, operadoras),
+        'Data_Registro_ANS': '2001-01-01',
+    })
+    df.to_csv(caminho, sep=';', index=False, encoding='utf-8-sig', quoting=csv.QUOTE_ALL)
+    return caminho
+
+
+def _bloco_demonstracoes(rng, linhas, registros, ano, trimestre, fracao_411, fracao_orfas):
+    # Algumas operadoras com mais lançamentos que outras, como no arquivo real
+    pesos = rng.pareto(1.5, len(registros)) + 1
+    reg_ans = rng.choice(registros, linhas, p=pesos / pesos.sum())
+    orfas = rng.random(linhas) < fracao_orfas
+    reg_ans = np.where(orfas, '999999', reg_ans)
+
+    e_411 = rng.random(linhas) < fracao_411
+    contas = np.where(e_411, rng.choice(CONTAS_411, linhas), rng.choice(CONTAS_OUTRAS, linhas))
+
+    centavos = (rng.lognormal(11, 2.5, linhas)).astype(np.int64)
+    sinal = rng.random(linhas)
+    centavos = np.where(sinal < 0.03, -centavos, np.where(sinal < 0.06, 0, centavos))
+    absolutos = pd.Series(np.abs(centavos))
+    valores = ((absolutos // 100).astype(str) + ',' + (absolutos % 100).astype(str).str.zfill(2))
+    valores = valores.where(centavos >= 0, '-' + valores)
+
+    return pd.DataFrame({
+        'DATA': f"{ano}-{(trimestre - 1) * 3 + 1:02d}-01",
+        'REG_ANS': reg_ans,
+        'CD_CONTA_CONTABIL': contas,
+        'DESCRICAO': rng.choice(DESCRICOES, linhas),
+        'VL_SALDO_INICIAL': valores.values,
+        'VL_SALDO_FINAL': valores.values,
+    })
+
+
+def gerar_trimestre(caminho, linhas, operadoras=OPERADORAS_REAL, ano=2025, trimestre=1, encoding='utf-8',
+                    semente=42, fracao_411=FRACAO_411, fracao_orfas=0.05):
+    """Demonstrações contábeis de um trimestre (mesmo cabeçalho e aspas do arquivo da ANS), escritas em blocos."""
+    rng = np.random.default_rng(semente + ano * 10 + trimestre)
+    registros = registros_ans(operadoras)
+    escritas = 0
+    with open(caminho, 'w', encoding=encoding, errors='replace', newline='') as f:
+        while escritas < linhas:
+            tamanho = min(LINHAS_POR_BLOCO, linhas - escritas)
+            bloco = _bloco_demonstracoes(rng, tamanho, registros, ano, trimestre, fracao_411, fracao_orfas)
+            bloco.to_csv(f, sep=';', index=False, header=escritas == 0, quoting=csv.QUOTE_ALL)
+            escritas += tamanho
+    return caminho
+
+
+def gerar_conjunto(destino, escala=1.0, trimestres=3, linhas_trimestre=LINHAS_TRIMESTRE_REAL,
+                   operadoras=OPERADORAS_REAL, semente=42):
+    """
+    Cadastro + `trimestres` arquivos de demonstrações com `escala` x o tamanho de um trimestre real.
+    Reaproveita os arquivos se já existirem com os mesmos parâmetros (o nome da pasta inclui todos eles).
+    Retorna (caminho_cadastro, [(nome_arquivo, caminho, encoding)]).
+    """
+    linhas = int(linhas_trimestre * escala)
+    pasta = Path(destino) / f"escala{escala:g}_linhas{linhas}_ops{operadoras}_sem{semente}"
+    pasta.mkdir(parents=True, exist_ok=True)
+
+    cadastro = pasta / 'Relatorio_cadop.csv'
+    if not cadastro.exists():
+        gerar_cadastro(cadastro, operadoras, semente)
+
+    arquivos = []
+    for i in range(trimestres):
+        trimestre, ano = 4 - i % 4, 2025 - i // 4
+        encoding = ENCODINGS[i % len(ENCODINGS)]
+        caminho = pasta / f"{trimestre}T{ano}.csv"
+        if not caminho.exists():
+            temporario = pasta / f".{caminho.name}.tmp"
+            gerar_trimestre(temporario, linhas, operadoras, ano, trimestre, encoding, semente)
+            os.replace(temporario, caminho)
+        arquivos.append((caminho.name, str(caminho), encoding))
+    return str(cadastro), arquivos
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Gera arquivos sintéticos da ANS")
+    parser.add_argument('--escala', type=float, default=1.0, help="tamanho de cada trimestre em relação a um real (1 a 50)")
+    parser.add_argument('--trimestres', type=int, default=3)
+    parser.add_argument('--linhas-trimestre', type=int, default=LINHAS_TRIMESTRE_REAL)
+    parser.add_argument('--operadoras', type=int, default=OPERADORAS_REAL)
+    parser.add_argument('--semente', type=int, default=42)
+    parser.add_argument('--destino', default='fixtures_ans')
+    args = parser.parse_args()
+    cadastro, arquivos = gerar_conjunto(args.destino, args.escala, args.trimestres, args.linhas_trimestre,
+                                        args.operadoras, args.semente)
+    print(f"Cadastro: {cadastro}")
+    for nome, caminho, encoding in arquivos:
+        print(f"{nome}: {caminho} ({encoding}, {os.path.getsize(caminho) / 1e6:.0f} MB)")
@@ -0,0 +1,108 @@
+import io
+import time
+from sqlalchemy import text
+from database import engine
+
+# Linhas serializadas por vez no buffer do COPY, limita a memória usada pelo CSV intermediário
+LINHAS_POR_BLOCO = 50000
+
+
+def _nomes(colunas):
+    return ', '.join(f'"{c}"' for c in colunas)
+
+
+def _carregar_to_sql(df, tabela, modo, chaves, escopo):
+    """Caminho para bancos sem COPY (ex: SQLite nos testes locais), mesma semântica dos modos do COPY."""
+    with engine.begin() as conn:
+        if modo == 'replace':
+            conn.execute(text(f'DELETE FROM {tabela}'))
+        elif modo == 'upsert':
+            # Sem ON CONFLICT portável: apaga o escopo (ou as chaves) que está chegando e insere de novo
+            colunas = escopo or chaves
+            condicao = ' AND '.join(f'"{c}" = :{c}' for c in colunas)
+            for valores in df[colunas].drop_duplicates().to_dict('records'):
+                conn.execute(text(f'DELETE FROM {tabela} WHERE {condicao}'), valores)
+        df.to_sql(tabela, con=conn, if_exists='append', index=False, chunksize=1000)
+
+
+def _sql_upsert(tabela, staging, colunas, chaves, escopo):
+    """Comandos do modo upsert: limpa o que saiu do escopo recarregado e atualiza/insere pela chave natural."""
+    comandos = []
+    if escopo:
+        # Linhas do mesmo escopo (ex: mesmo trimestre) que não vieram na nova versão do arquivo
+        comandos.append(f"""
+            DELETE FROM {tabela} t
+            WHERE ({_nomes(escopo)}) IN (SELECT DISTINCT {_nomes(escopo)} FROM {staging})
+              AND NOT EXISTS (
+                  SELECT 1 FROM {staging} s WHERE {' AND '.join(f's."{c}" = t."{c}"' for c in chaves)}
+              )
+        """)
+    atualizar = [c for c in colunas if c not in chaves]
+    conflito = (f"DO UPDATE SET {', '.join(f'{_nomes([c])} = EXCLUDED.{_nomes([c])}' for c in atualizar)}"
+                if atualizar else "DO NOTHING")
+    comandos.append(f"""
+        INSERT INTO {tabela} ({_nomes(colunas)}) SELECT {_nomes(colunas)} FROM {staging}
+        ON CONFLICT ({_nomes(chaves)}) {conflito}
+    """)
+    return comandos
+
+
+def _copiar_blocos(cursor, df, staging, colunas):
+    """Envia o DataFrame para a tabela de staging via COPY FROM STDIN, em blocos de CSV."""
+    comando = f"COPY {staging} ({_nomes(colunas)}) FROM STDIN WITH (FORMAT csv, NULL '\\N')"
+    for inicio in range(0, len(df), LINHAS_POR_BLOCO):
+        buffer = io.StringIO()
+        df.iloc[inicio:inicio + LINHAS_POR_BLOCO].to_csv(buffer, index=False, header=False, na_rep='\\N')
+        buffer.seek(0)
+        cursor.copy_expert(comando, buffer)
+
+
+def copiar_dataframe(df, tabela, modo='append', chaves=None, escopo=None):
+    """
+    Carga em massa via COPY FROM STDIN, substituindo os INSERTs do to_sql.
+    Os dados entram primeiro numa tabela temporária (sem WAL) e vão para a tabela final num único INSERT ... SELECT,
+    tudo na mesma transação: ou o arquivo inteiro entra ou nada entra.
+    modo: 'append' adiciona as linhas, 'replace' troca todo o conteúdo da tabela (sem recriar o schema),
+    'upsert' atualiza pelas `chaves` (índice único) e, se informado `escopo` (ex: ano/trimestre),
+    remove as linhas desse escopo que não vieram na carga. Rodar a mesma carga duas vezes não duplica nada.
+    Retorna a quantidade de linhas carregadas.
+    """
+    if modo == 'upsert' and not chaves:
+        raise ValueError("O modo upsert precisa das colunas da chave natural")
+
+    if df.empty:
+        return 0
+
+    inicio = time.perf_counter()
+    colunas = list(df.columns)
+
+    if engine.dialect.name != 'postgresql':
+        _carregar_to_sql(df, tabela, modo, chaves, escopo)
+    else:
+        staging = f"staging_{tabela}"
+        conn = engine.raw_connection()
+        try:
+            cursor = conn.cursor()
+            # Mesmos tipos das colunas de destino, sem constraints e descartada no commit
+            cursor.execute(f"CREATE TEMP TABLE {staging} ON COMMIT DROP AS "
+                           f"SELECT {_nomes(colunas)} FROM {tabela} WITH NO DATA")
+            _copiar_blocos(cursor, df, staging, colunas)
+
+            if modo == 'upsert':
+                for comando in _sql_upsert(tabela, staging, colunas, chaves, escopo):
+                    cursor.execute(comando)
+            else:
+                if modo == 'replace':
+                    # DELETE em vez de TRUNCATE para não bloquear a leitura da API durante a carga
+                    cursor.execute(f"DELETE FROM {tabela}")
+                cursor.execute(f"INSERT INTO {tabela} ({_nomes(colunas)}) SELECT {_nomes(colunas)} FROM {staging}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    duracao = time.perf_counter() - inicio
+    print(f"Carga {tabela}: {len(df)} linhas em {duracao:.2f}s ({len(df) / max(duracao, 1e-9):,.0f} linhas/s)")
+    return len(df)
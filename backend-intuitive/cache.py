@@ -0,0 +1,205 @@
+import asyncio
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from sqlalchemy import text
+from database import engine
+
+CACHE_MAX_ITENS = int(os.getenv('CACHE_MAX_ITENS', '1024'))
+CACHE_TTL = int(os.getenv('CACHE_TTL', '300'))  # segundos
+# De quanto em quanto tempo a API confere no banco se o ETL publicou uma versão nova dos dados
+CACHE_INTERVALO_VERSAO = float(os.getenv('CACHE_INTERVALO_VERSAO', '5'))
+CACHE_REDIS_URL = os.getenv('CACHE_REDIS_URL')
+
+
+def ler_versao_dados():
+    """
+    Versão atual dos dados (token incrementado pelo ETL) e quando mudou. (0, None) se o ETL ainda não rodou.
+    None se a leitura falhou: sem versão não dá para montar chave de cache nem ETag.
+    """
+    try:
+        with engine.connect() as conn:
+            row = conn.execute(text("SELECT versao, atualizado_em FROM versao_dados WHERE id = 1")).fetchone()
+    except Exception as e:
+        print(f"Aviso: não foi possível ler a versão dos dados: {e}")
+        return None
+    return (row.versao, row.atualizado_em) if row else (0, None)
+
+
+def incrementar_versao_dados():
+    """Chamado pelo ETL depois de uma carga concluída, invalida o cache de todas as instâncias da API."""
+    with engine.begin() as conn:
+        conn.execute(text("""
+            INSERT INTO versao_dados (id, versao, atualizado_em) VALUES (1, 1, CURRENT_TIMESTAMP)
+            ON CONFLICT (id) DO UPDATE SET versao = versao_dados.versao + 1, atualizado_em = CURRENT_TIMESTAMP
+        """))
+
+
+class CacheLRU:
+    """Cache em memória do processo, com limite de itens (descarta o menos usado) e tempo de vida por item."""
+
+    def __init__(self, max_itens=CACHE_MAX_ITENS, ttl=CACHE_TTL):
+        self.max_itens = max_itens
+        self.ttl = ttl
+        self._itens = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, chave):
+        """Retorna (encontrado, valor)."""
+        with self._lock:
+            item = self._itens.get(chave)
+            if item is None:
+                return False, None
+            expira_em, valor = item
+            if expira_em < time.monotonic():
+                del self._itens[chave]
+                return False, None
+            self._itens.move_to_end(chave)
+            return True, valor
+
+    def set(self, chave, valor):
+        with self._lock:
+            self._itens[chave] = (time.monotonic() + self.ttl, valor)
+            self._itens.move_to_end(chave)
+            while len(self._itens) > self.max_itens:
+                self._itens.popitem(last=False)
+
+    def limpar(self):
+        with self._lock:
+            self._itens.clear()
+
+
+class CacheRedis:
+    """Backend opcional compartilhado entre réplicas da API. Precisa do pacote `redis` instalado."""
+
+    def __init__(self, url, ttl=CACHE_TTL, prefixo='intuitive:'):
+        import redis
+        self.cliente = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self.prefixo = prefixo
+
+    def get(self, chave):
+        dados = self.cliente.get(self.prefixo + chave)
+        if dados is None:
+            return False, None
+        return True, pickle.loads(dados)
+
+    def set(self, chave, valor):
+        self.cliente.setex(self.prefixo + chave, self.ttl, pickle.dumps(valor))
+
+    def limpar(self):
+        for chave in self.cliente.scan_iter(self.prefixo + '*'):
+            self.cliente.delete(chave)
+
+
+def criar_backend():
+    """Redis se CACHE_REDIS_URL estiver configurado (e o pacote instalado), senão LRU em memória."""
+    if CACHE_REDIS_URL:
+        try:
+            return CacheRedis(CACHE_REDIS_URL)
+        except ImportError:
+            print("Aviso: CACHE_REDIS_URL definido mas o pacote redis não está instalado, usando cache em memória.")
+    return CacheLRU()
+
+
+class RepositorioCache:
+    """
+    Envolve o OperadoraRepository: cada método público é cacheado pela combinação (versão dos dados, método, argumentos).
+    Quando o ETL incrementa a versão as chaves antigas deixam de ser usadas e saem pelo LRU/TTL.
+    Erros do repositório sobem para a rota e nada é guardado. Sem versão (falha ao ler) a chamada vai direto ao banco.
+    """
+
+    def __init__(self, repo, backend=None, intervalo_versao=CACHE_INTERVALO_VERSAO):
+        self.repo = repo
+        self.backend = backend or criar_backend()
+        self.intervalo_versao = intervalo_versao
+        self._versao = None
+        self._versao_lida_em = None
+        self._lock = threading.Lock()
+
+    def _guardar_versao(self, versao, agora):
+        # Uma falha não fica guardada, a próxima requisição tenta ler de novo
+        self._versao = versao
+        self._versao_lida_em = agora if versao is not None else None
+        return versao
+
+    def versao(self):
+        """
+        (versão, atualizado_em) dos dados, relida do banco no máximo a cada `intervalo_versao` segundos.
+        None se não foi possível ler a versão.
+        """
+        with self._lock:
+            agora = time.monotonic()
+            if self._versao_lida_em is None or agora - self._versao_lida_em >= self.intervalo_versao:
+                return self._guardar_versao(ler_versao_dados(), agora)
+            return self._versao
+
+    def __getattr__(self, nome):
+        atributo = getattr(self.repo, nome)
+        if nome.startswith('_') or not callable(atributo):
+            return atributo
+
+        def com_cache(*args, **kwargs):
+            versao = self.versao()
+            if versao is None:
+                return atributo(*args, **kwargs)
+            chave = f"{versao[0]}:{nome}:{args!r}:{sorted(kwargs.items())!r}"
+            encontrado, valor = self.backend.get(chave)
+            if encontrado:
+                return valor
+            valor = atributo(*args, **kwargs)
+            self.backend.set(chave, valor)
+            return valor
+
+        return com_cache
+
+
+async def ler_versao_dados_async(engine_async):
+    """Mesmo que ler_versao_dados, pela engine assíncrona da API ASGI."""
+    try:
+        async with engine_async.connect() as conn:
+            row = (await conn.execute(text("SELECT versao, atualizado_em FROM versao_dados WHERE id = 1"))).fetchone()
+    except Exception as e:
+        print(f"Aviso: não foi possível ler a versão dos dados: {e}")
+        return None
+    return (row.versao, row.atualizado_em) if row else (0, None)
+
+
+class RepositorioCacheAsync(RepositorioCache):
+    """Versão do RepositorioCache para o OperadoraRepositoryAsync: mesma chave e backend, métodos com await."""
+
+    def __init__(self, repo, engine_async, backend=None, intervalo_versao=CACHE_INTERVALO_VERSAO):
+        super().__init__(repo, backend, intervalo_versao)
+        self.engine_async = engine_async
+        self._lock_async = None
+
+    async def versao(self):
+        # Lock criado dentro do loop de eventos do servidor (no Python 3.9 ele fica preso ao loop da criação)
+        if self._lock_async is None:
+            self._lock_async = asyncio.Lock()
+        async with self._lock_async:
+            agora = time.monotonic()
+            if self._versao_lida_em is None or agora - self._versao_lida_em >= self.intervalo_versao:
+                return self._guardar_versao(await ler_versao_dados_async(self.engine_async), agora)
+            return self._versao
+
+    def __getattr__(self, nome):
+        atributo = getattr(self.repo, nome)
+        if nome.startswith('_') or not callable(atributo):
+            return atributo
+
+        async def com_cache(*args, **kwargs):
+            versao = await self.versao()
+            if versao is None:
+                return await atributo(*args, **kwargs)
+            chave = f"{versao[0]}:{nome}:{args!r}:{sorted(kwargs.items())!r}"
+            encontrado, valor = self.backend.get(chave)
+            if encontrado:
+                return valor
+            valor = await atributo(*args, **kwargs)
+            self.backend.set(chave, valor)
+            return valor
+
+        return com_cache
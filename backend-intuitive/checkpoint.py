@@ -0,0 +1,66 @@
+import json
+import os
+from datetime import datetime
+
+# Progresso da carga em andamento, para retomar depois de uma falha sem refazer os trimestres já gravados
+CAMINHO_CHECKPOINT = os.getenv('ETL_CHECKPOINT', 'etl_checkpoint.json')
+
+
+class Checkpoint:
+    """
+    Arquivos (URLs) já carregados no banco pela execução atual, gravados em JSON a cada trimestre concluído.
+    Só é retomado por uma execução com os mesmos `parametros` (intervalo/quantidade de trimestres e origem),
+    outra configuração começa do zero. Ao final com sucesso o arquivo é removido.
+    """
+
+    def __init__(self, caminho=CAMINHO_CHECKPOINT, parametros=None, retomar=True):
+        self.caminho = caminho
+        self.parametros = parametros or {}
+        self.concluidos = {}
+
+        if retomar and os.path.exists(caminho):
+            try:
+                with open(caminho, encoding='utf-8') as f:
+                    dados = json.load(f)
+                if dados.get('parametros') == self.parametros:
+                    self.concluidos = dados.get('concluidos', {})
+                    print(f"Retomando execução anterior: {len(self.concluidos)} arquivos já concluídos ({caminho})")
+                else:
+                    print("Checkpoint de outra configuração encontrado, começando do zero.")
+            except (OSError, ValueError) as e:
+                print(f"Aviso: checkpoint ilegível, começando do zero: {e}")
+
+    def concluido(self, url):
+        """Registro do arquivo (linhas, ano, trimestre) se ele já foi carregado nesta execução, senão None."""
+        return self.concluidos.get(url)
+
+    def marcar(self, url, linhas, ano=None, trimestre=None):
+        """
+        Registra o arquivo como carregado e grava o checkpoint (arquivo temporário + os.replace, nunca fica pela metade).
+        Se a gravação falhar o erro sobe e o arquivo também não fica marcado em memória: disco e memória
+        continuam dizendo a mesma coisa, e a próxima execução carrega esse arquivo de novo (a carga é um upsert).
+        """
+        concluidos = dict(self.concluidos)
+        concluidos[url] = {
+            "linhas": int(linhas),
+            "ano": int(ano) if ano is not None else None,
+            "trimestre": int(trimestre) if trimestre is not None else None,
+            "concluido_em": datetime.now().isoformat(timespec='seconds'),
+        }
+        temporario = f"{self.caminho}.tmp"
+        try:
+            with open(temporario, 'w', encoding='utf-8') as f:
+                json.dump({"parametros": self.parametros, "concluidos": concluidos}, f, ensure_ascii=False, indent=2)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temporario, self.caminho)
+        except BaseException:
+            if os.path.exists(temporario):
+                os.remove(temporario)
+            raise
+        self.concluidos = concluidos
+
+    def finalizar(self):
+        """Execução concluída: a próxima começa do zero (o manifesto continua evitando downloads repetidos)."""
+        if os.path.exists(self.caminho):
+            os.remove(self.caminho)
@@ -0,0 +1,142 @@
+import re
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from html.parser import HTMLParser
+from typing import NamedTuple, Optional
+from urllib.parse import urljoin
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+TIMEOUT_LISTAGEM = 30
+MAX_CONEXOES = 8
+
+# Colunas de data/tamanho do índice Apache: "2025-06-10 14:31  42M" ou "10-Jun-2025 14:31  42M"
+PADRAO_DATA = re.compile(r'(\d{4}-\d{2}-\d{2} \d{2}:\d{2}|\d{2}-[A-Za-z]{3}-\d{4} \d{2}:\d{2})')
+PADRAO_TAMANHO = re.compile(r'(\d+(?:\.\d+)?)([KMGT]?)\s*$')
+# Nome dos arquivos trimestrais da ANS (ex: 3T2025.zip)
+PADRAO_TRIMESTRE = re.compile(r'(\d)T(\d{4})', re.IGNORECASE)
+
+MULTIPLICADORES = {'': 1, 'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3, 'T': 1024 ** 4}
+
+
+class ArquivoANS(NamedTuple):
+    """Arquivo trimestral listado no diretório de demonstrações contábeis"""
+    ano: int
+    trimestre: Optional[int]
+    url: str
+    tamanho: Optional[int]  # Aproximado, o índice Apache arredonda (ex: 42M)
+    modificado: Optional[datetime]
+
+
+class _ParserIndice(HTMLParser):
+    """Lê os <a href> do índice e o texto que vem depois de cada link (data e tamanho)."""
+
+    def __init__(self):
+        super().__init__()
+        self.entradas = []  # [href, texto_seguinte]
+        self._dentro_link = False
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'a':
+            href = dict(attrs).get('href')
+            if href:
+                self.entradas.append([href, ''])
+                self._dentro_link = True
+
+    def handle_endtag(self, tag):
+        if tag == 'a':
+            self._dentro_link = False
+
+    def handle_data(self, data):
+        if self.entradas and not self._dentro_link:
+            self.entradas[-1][1] += data
+
+
+def _converter_data(texto):
+    for formato in ('%Y-%m-%d %H:%M', '%d-%b-%Y %H:%M'):
+        try:
+            return datetime.strptime(texto, formato)
+        except ValueError:
+            continue
+    return None
+
+
+def _converter_tamanho(texto):
+    encontrado = PADRAO_TAMANHO.search(texto.strip())
+    if not encontrado:
+        return None
+    return int(float(encontrado.group(1)) * MULTIPLICADORES[encontrado.group(2).upper()])
+
+
+def criar_sessao(max_conexoes=MAX_CONEXOES):
+    """Sessão HTTP com keep-alive, pool de conexões e retry para erros temporários do servidor da ANS."""
+    sessao = requests.Session()
+    retry = Retry(total=3, backoff_factor=0.5, status_forcelist=(429, 500, 502, 503, 504))
+    adapter = HTTPAdapter(pool_connections=max_conexoes, pool_maxsize=max_conexoes, max_retries=retry)
+    sessao.mount('http://', adapter)
+    sessao.mount('https://', adapter)
+    return sessao
+
+
+def listar_diretorio(sessao, url):
+    """
+    Lista um diretório no formato de índice Apache.
+    Retorna dicionários com url absoluta, nome, modificado e tamanho. Ignora ordenação e diretório pai.
+    """
+    resposta = sessao.get(url, timeout=TIMEOUT_LISTAGEM)
+    resposta.raise_for_status()
+
+    parser = _ParserIndice()
+    parser.feed(resposta.text)
+
+    itens = []
+    for href, texto in parser.entradas:
+        # Links de ordenação (?C=N;O=D) e o diretório pai
+        if href.startswith('?') or href.startswith('/') or href.startswith('..'):
+            continue
+        data = PADRAO_DATA.search(texto)
+        itens.append({
+            "url": urljoin(url, href),
+            "nome": href.rstrip('/').split('/')[-1],
+            "modificado": _converter_data(data.group(1)) if data else None,
+            "tamanho": _converter_tamanho(texto[data.end():]) if data else None,
+        })
+    return itens
+
+
+def descobrir_cadastro(base_url, sessao):
+    """URL do CSV de operadoras ativas, buscando pela extensão já que os nomes são inconsistentes."""
+    itens = listar_diretorio(sessao, urljoin(base_url, 'operadoras_de_plano_de_saude_ativas/'))
+    csvs = [item['url'] for item in itens if item['nome'].lower().endswith('.csv')]
+    if not csvs:
+        raise RuntimeError("Cadastro de operadoras não encontrado no diretório da ANS")
+    return csvs[0]
+
+
+def descobrir_trimestres(base_url, sessao, max_workers=MAX_CONEXOES):
+    """
+    Lista os ZIPs de demonstrações contábeis de todos os anos, do mais recente para o mais antigo.
+    Os diretórios dos anos são buscados em paralelo pela mesma sessão.
+    """
+    raiz = urljoin(base_url, 'demonstracoes_contabeis/')
+    anos = [item for item in listar_diretorio(sessao, raiz) if re.fullmatch(r'\d{4}', item['nome'])]
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        listagens = list(executor.map(lambda item: listar_diretorio(sessao, item['url']), anos))
+
+    arquivos = []
+    for diretorio, itens in zip(anos, listagens):
+        for item in itens:
+            if not item['nome'].lower().endswith('.zip'):
+                continue
+            periodo = PADRAO_TRIMESTRE.search(item['nome'])
+            arquivos.append(ArquivoANS(
+                ano=int(periodo.group(2)) if periodo else int(diretorio['nome']),
+                trimestre=int(periodo.group(1)) if periodo else None,
+                url=item['url'],
+                tamanho=item['tamanho'],
+                modificado=item['modificado'],
+            ))
+
+    return sorted(arquivos, key=lambda a: (a.ano, a.trimestre or 0, a.url), reverse=True)
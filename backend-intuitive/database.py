@@ -1,9 +1,12 @@
 import os
 from dotenv import load_dotenv # para rodar localmente
-from sqlalchemy import create_engine, Column, String, Integer, Numeric
+from sqlalchemy import create_engine, Column, Computed, String, Integer, BigInteger, Numeric, DateTime, Index
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from typing import Any
+from agregados import criar_agregados
+from migracoes import aplicar_migracoes
+from metricas import classe_pool, instrumentar_engine
 
 load_dotenv() # Carrega as variáveis do arquivo .env local
 
@@ -12,12 +15,65 @@ DB_PASS = os.getenv('POSTGRES_PASSWORD', 'password') # Sua senha local
 DB_HOST = os.getenv('DB_HOST', 'localhost') # No Docker será 'db'
 DB_NAME = os.getenv('POSTGRES_DB', 'intuitive_care')
 
-DATABASE_URL = f"postgresql://{DB_USER}:{DB_PASS}@{DB_HOST}:5432/{DB_NAME}"
+# DATABASE_URL completo substitui as variáveis acima (ex: sqlite:///bench.db nos benchmarks)
+DATABASE_URL = os.getenv('DATABASE_URL') or f"postgresql://{DB_USER}:{DB_PASS}@{DB_HOST}:5432/{DB_NAME}"
 
-engine = create_engine(DATABASE_URL)
+# Pool por papel do processo: a API atende muitas consultas curtas, o ETL poucas conexões com cargas longas.
+# Cada valor pode ser sobrescrito por variável de ambiente, ex: DB_API_POOL_SIZE, DB_ETL_STATEMENT_TIMEOUT_MS.
+POOL_PADRAO = {
+    'api': {'pool_size': 10, 'max_overflow': 10, 'pool_timeout': 10, 'pool_recycle': 1800, 'statement_timeout_ms': 15000},
+    'etl': {'pool_size': 4, 'max_overflow': 2, 'pool_timeout': 60, 'pool_recycle': 3600, 'statement_timeout_ms': 0},
+}
+# main.py define 'etl' antes de importar este módulo, o resto (api.py, api_async.py) usa 'api'
+DB_PAPEL = os.getenv('DB_PAPEL', 'api')
+
+def config_pool(papel=DB_PAPEL):
+    """Configuração do pool do papel, com as variáveis DB_<PAPEL>_<OPCAO> por cima dos padrões."""
+    config = dict(POOL_PADRAO.get(papel, POOL_PADRAO['api']))
+    for opcao, valor in config.items():
+        config[opcao] = type(valor)(os.getenv(f"DB_{papel.upper()}_{opcao.upper()}", valor))
+    return config
+
+def criar_engine(papel=DB_PAPEL):
+    """Engine síncrona (psycopg2) com pool dimensionado para o papel e métricas de pool/consultas (metricas.py)."""
+    if not DATABASE_URL.startswith('postgresql'):
+        # SQLite e afins: pool e statement_timeout padrão do SQLAlchemy, só as métricas de consulta
+        return instrumentar_engine(create_engine(DATABASE_URL), papel)
+    config = config_pool(papel)
+    engine = create_engine(
+        DATABASE_URL,
+        poolclass=classe_pool(papel),
+        pool_size=config['pool_size'],
+        max_overflow=config['max_overflow'],
+        pool_timeout=config['pool_timeout'],
+        pool_recycle=config['pool_recycle'],
+        pool_pre_ping=True, # Descarta conexões derrubadas pelo banco antes de entregar
+        # 0 = sem limite. Na API uma consulta travada não segura a conexão para sempre
+        connect_args={'options': f"-c statement_timeout={config['statement_timeout_ms']}"},
+    )
+    return instrumentar_engine(engine, papel)
+
+engine = criar_engine()
 # Criação da Sessão (Para realizar as operações na DB)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+def criar_engine_async(papel='api'):
+    """Engine com asyncpg para o servidor ASGI. Criada sob demanda para o ETL e a API Flask não dependerem do asyncpg."""
+    from sqlalchemy.ext.asyncio import create_async_engine
+    from sqlalchemy.pool import AsyncAdaptedQueuePool
+    config = config_pool(papel)
+    engine_async = create_async_engine(
+        DATABASE_URL.replace("postgresql://", "postgresql+asyncpg://", 1),
+        poolclass=classe_pool(f"{papel}_async", AsyncAdaptedQueuePool),
+        pool_size=config['pool_size'],
+        max_overflow=config['max_overflow'],
+        pool_timeout=config['pool_timeout'],
+        pool_recycle=config['pool_recycle'],
+        pool_pre_ping=True,
+        connect_args={'server_settings': {'statement_timeout': str(config['statement_timeout_ms'])}},
+    )
+    return instrumentar_engine(engine_async, f"{papel}_async")
+
 Base : Any = declarative_base()
 class OperadorasAtivas(Base):
     """Tabela de Dados Cadastrais das Operadoras de plano de saúde"""
@@ -30,15 +86,44 @@ class OperadorasAtivas(Base):
 class DespesasConsolidadas(Base):
     """Tabela para armazenar os dados do CSV de despesas consolidadas"""
     __tablename__ = 'despesas_consolidadas'
+    __table_args__ = (
+        # Chave natural: uma linha por operadora/conta/trimestre, recargas atualizam no lugar em vez de duplicar
+        Index('uq_despesas_chave_natural', 'reg_ans', 'cd_conta_contabil', 'ano', 'trimestre', unique=True),
+    )
     id = Column(Integer, primary_key=True, autoincrement=True)
     reg_ans = Column(String)
     cd_conta_contabil = Column(String)
     vl_saldo_final = Column(Numeric(18, 2)) #Suporta números com 18 digitos (Trilhão) e limita a duas casas decimais
     ano = Column(Integer)
     trimestre = Column(Integer)
+    periodo = Column(Integer, Computed('ano * 10 + trimestre', persisted=True)) # Ex: 20253, calculado pelo banco
+
+class ArquivoProcessado(Base):
+    """Manifesto dos arquivos da ANS já carregados, permite pular o que não mudou desde a última execução"""
+    __tablename__ = 'arquivos_processados'
+    url = Column(String, primary_key=True)
+    tamanho = Column(BigInteger)
+    last_modified = Column(String)
+    etag = Column(String)
+    hash_conteudo = Column(String) # sha256 do arquivo baixado
+    linhas = Column(Integer) # Linhas de despesas (ou operadoras) extraídas do arquivo
+    ano = Column(Integer)
+    trimestre = Column(Integer)
+    processado_em = Column(DateTime)
+
+class VersaoDados(Base):
+    """Token da versão dos dados, incrementado pelo ETL a cada carga e usado para invalidar o cache da API"""
+    __tablename__ = 'versao_dados'
+    id = Column(Integer, primary_key=True)
+    versao = Column(BigInteger, nullable=False)
+    atualizado_em = Column(DateTime(timezone=True))
 
 def criar_tabelas():
     Base.metadata.create_all(bind=engine)
+    if engine.dialect.name == 'postgresql':
+        # Índices, particionamento e demais ajustes que o create_all não faz (migracoes.py)
+        aplicar_migracoes(engine)
+        criar_agregados(engine)
     print("Tabelas criadas com sucesso no banco 'intuitive_care'!")
 
 if __name__ == "__main__":
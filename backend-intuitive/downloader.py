@@ -0,0 +1,239 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+from typing import NamedTuple, Optional
+import requests
+from crawler import criar_sessao
+
+# Fica fora de temp_downloads (apagada no fim de cada execução), os arquivos servem para as próximas execuções
+DIRETORIO_CACHE = os.getenv('ETL_CACHE_DIR', str(Path.cwd() / 'cache_downloads'))
+# ETL_CACHE_DIR vazio ou '0' desliga o cache, os downloads não passam pelo disco (pipeline.baixar_conteudo)
+CACHE_ATIVO = DIRETORIO_CACHE not in ('', '0')
+# Limite do cache em disco, os arquivos usados há mais tempo saem primeiro
+CACHE_MAX_BYTES = int(os.getenv('ETL_CACHE_MAX_MB', '2048')) * 1024 * 1024
+TIMEOUT_DOWNLOAD = int(os.getenv('ETL_TIMEOUT_DOWNLOAD', '120'))
+# Quantas vezes uma transferência interrompida é retomada (Range) antes de desistir
+TENTATIVAS = int(os.getenv('ETL_TENTATIVAS_DOWNLOAD', '5'))
+TAMANHO_BLOCO = 1024 * 1024
+
+# Conexão caída no meio do corpo da resposta, dá para continuar de onde parou
+ERROS_TRANSFERENCIA = (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError)
+
+
+class Download(NamedTuple):
+    """Arquivo baixado (ou revalidado) e guardado no cache"""
+    url: str
+    caminho: str  # Arquivo no cache, somente leitura (pode ser removido pela limpeza do cache)
+    sha256: str
+    tamanho: int
+    etag: Optional[str]
+    last_modified: Optional[str]
+    do_cache: bool  # True quando o servidor respondeu 304 e nada foi baixado
+
+
+class Downloader:
+    """
+    Downloads do FTP da ANS com sessão HTTP compartilhada (keep-alive, pool e retry do crawler),
+    gravando em disco em blocos, sem o arquivo inteiro em memória.
+    - Cache por conteúdo: cada arquivo fica em objetos/<sha256>, e o indice.json liga a URL ao sha256,
+      ETag e Last-Modified. Na próxima execução o GET vai com If-None-Match/If-Modified-Since e um 304
+      devolve o arquivo do cache. URLs diferentes com o mesmo conteúdo ocupam o espaço uma vez só.
+    - Retomada: a transferência vai para parciais/ e, se a conexão cair, continua com Range/If-Range
+      do byte onde parou (na mesma execução ou na próxima). Se o arquivo mudou no servidor, o If-Range faz o
+      servidor mandar tudo de novo.
+    - O cache é limitado a `max_bytes`, removendo os arquivos usados há mais tempo.
+    Pode ser usado por várias threads ao mesmo tempo, desde que não baixem a mesma URL juntas.
+    O arquivo de um Download devolvido por `baixar` fica reservado (a limpeza não apaga) até `liberar(download)`.
+    """
+
+    def __init__(self, diretorio=DIRETORIO_CACHE, max_bytes=CACHE_MAX_BYTES, sessao=None,
+                 timeout=TIMEOUT_DOWNLOAD, tentativas=TENTATIVAS):
+        self.diretorio = Path(diretorio)
+        self._objetos = self.diretorio / 'objetos'
+        self._parciais = self.diretorio / 'parciais'
+        self._objetos.mkdir(parents=True, exist_ok=True)
+        self._parciais.mkdir(parents=True, exist_ok=True)
+        if not os.access(self._parciais, os.W_OK) or not os.access(self._objetos, os.W_OK):
+            raise PermissionError(f"sem permissão de escrita em {self.diretorio}")
+        self._caminho_indice = self.diretorio / 'indice.json'
+        self.max_bytes = max_bytes
+        self.sessao = sessao or criar_sessao()
+        self.timeout = timeout
+        self.tentativas = tentativas
+        self._lock = threading.Lock()
+        self._em_uso = Counter()  # sha256 -> Downloads entregues e ainda não liberados
+        self._indice = self._ler_indice()
+
+    def _ler_indice(self):
+        try:
+            with open(self._caminho_indice, encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _salvar_indice(self):
+        # Chamado com o lock. Arquivo temporário + os.replace, uma interrupção não deixa o índice pela metade
+        temporario = self._caminho_indice.with_suffix('.tmp')
+        with open(temporario, 'w', encoding='utf-8') as f:
+            json.dump(self._indice, f)
+        os.replace(temporario, self._caminho_indice)
+
+    def _objeto(self, sha256):
+        return self._objetos / sha256
+
+    def baixar(self, url, medicao=None):
+        """
+        Baixa `url` para o cache (ou só revalida, se já estiver lá) e retorna um Download.
+        `medicao` (instrumentacao.etapa) recebe os bytes que vieram pela rede.
+        Quem chama deve chamar `liberar(download)` depois de ler/copiar o arquivo.
+        """
+        with self._lock:
+            entrada = self._indice.get(url)
+        condicional = {}
+        if entrada and self._objeto(entrada['sha256']).exists():
+            if entrada.get('etag'):
+                condicional['If-None-Match'] = entrada['etag']
+            if entrada.get('last_modified'):
+                condicional['If-Modified-Since'] = entrada['last_modified']
+
+        for tentativa in range(1, self.tentativas + 1):
+            try:
+                return self._transferir(url, condicional, entrada, medicao)
+            except ERROS_TRANSFERENCIA as e:
+                if tentativa == self.tentativas:
+                    raise
+                print(f"Aviso: download de {url} interrompido ({e}), retomando (tentativa {tentativa + 1})")
+                time.sleep(min(0.5 * 2 ** tentativa, 10))
+
+    def _transferir(self, url, condicional, entrada, medicao):
+        parcial = self._parciais / hashlib.sha1(url.encode('utf-8')).hexdigest()
+        meta_parcial = parcial.with_suffix('.json')
+        recebidos = parcial.stat().st_size if parcial.exists() else 0
+        meta = {}
+        if recebidos:
+            try:
+                with open(meta_parcial, encoding='utf-8') as f:
+                    meta = json.load(f)
+            except (OSError, ValueError):
+                recebidos = 0
+
+        cabecalhos = dict(condicional)
+        # Só retoma se houver como conferir que o arquivo no servidor ainda é o mesmo
+        validador = meta.get('etag') or meta.get('last_modified')
+        if recebidos and validador:
+            cabecalhos['Range'] = f"bytes={recebidos}-"
+            cabecalhos['If-Range'] = validador
+
+        with self.sessao.get(url, headers=cabecalhos, stream=True, timeout=self.timeout) as resposta:
+            if resposta.status_code == 304:
+                download = self._do_cache(url, entrada)
+                if download is not None:
+                    return download
+                # Objeto removido do cache entre a consulta e a resposta: baixa de novo, sem condicional
+                return self._transferir(url, {}, None, medicao)
+            if resposta.status_code == 416:
+                # Parcial maior que o arquivo atual: descarta e baixa do início
+                parcial.unlink()
+                return self._transferir(url, condicional, entrada, medicao)
+            resposta.raise_for_status()
+
+            continuar = resposta.status_code == 206
+            if continuar:
+                etag, last_modified = meta.get('etag'), meta.get('last_modified')
+            else:
+                etag, last_modified = resposta.headers.get('ETag'), resposta.headers.get('Last-Modified')
+                with open(meta_parcial, 'w', encoding='utf-8') as f:
+                    json.dump({"url": url, "etag": etag, "last_modified": last_modified}, f)
+
+            sha = hashlib.sha256()
+            if continuar:
+                with open(parcial, 'rb') as f:
+                    for bloco in iter(lambda: f.read(TAMANHO_BLOCO), b''):
+                        sha.update(bloco)
+            with open(parcial, 'ab' if continuar else 'wb') as f:
+                for bloco in resposta.iter_content(chunk_size=TAMANHO_BLOCO):
+                    f.write(bloco)
+                    sha.update(bloco)
+                    if medicao is not None:
+                        medicao.bytes += len(bloco)
+
+            esperado = _tamanho_total(resposta)
+            tamanho = parcial.stat().st_size
+            if esperado is not None and tamanho < esperado:
+                # Servidor fechou a conexão antes do fim sem erro: tenta de novo a partir daqui
+                raise requests.exceptions.ChunkedEncodingError(f"recebidos {tamanho} de {esperado} bytes")
+
+        return self._guardar(url, parcial, meta_parcial, sha.hexdigest(), tamanho, etag, last_modified)
+
+    def _do_cache(self, url, entrada):
+        with self._lock:
+            if not self._objeto(entrada['sha256']).exists():
+                return None
+            entrada['acessado'] = time.time()
+            self._indice[url] = entrada
+            self._em_uso[entrada['sha256']] += 1
+            self._salvar_indice()
+        return Download(url, str(self._objeto(entrada['sha256'])), entrada['sha256'], entrada['tamanho'],
+                        entrada.get('etag'), entrada.get('last_modified'), True)
+
+    def _guardar(self, url, parcial, meta_parcial, sha256, tamanho, etag, last_modified):
+        objeto = self._objeto(sha256)
+        with self._lock:
+            if objeto.exists():
+                parcial.unlink()  # Mesmo conteúdo já guardado por outra URL ou execução
+            else:
+                os.replace(parcial, objeto)
+            meta_parcial.unlink(missing_ok=True)
+            self._indice[url] = {"sha256": sha256, "tamanho": tamanho, "etag": etag,
+                                 "last_modified": last_modified, "acessado": time.time()}
+            self._em_uso[sha256] += 1
+            self._limpar()
+            self._salvar_indice()
+        return Download(url, str(objeto), sha256, tamanho, etag, last_modified, False)
+
+    def liberar(self, download):
+        """O arquivo de `download` já foi lido/copiado e volta a poder sair na limpeza do cache."""
+        with self._lock:
+            self._em_uso[download.sha256] -= 1
+            if self._em_uso[download.sha256] <= 0:
+                del self._em_uso[download.sha256]
+
+    def _limpar(self):
+        """
+        Remove os arquivos usados há mais tempo até o cache caber em max_bytes (com o lock).
+        Arquivos de Downloads ainda não liberados ficam, mesmo que o cache passe do limite por um tempo.
+        """
+        objetos = {}
+        for url, entrada in self._indice.items():
+            tamanho, acessado, urls = objetos.get(entrada['sha256'], (entrada['tamanho'], 0, []))
+            objetos[entrada['sha256']] = (tamanho, max(acessado, entrada['acessado']), urls + [url])
+
+        total = sum(tamanho for tamanho, _, _ in objetos.values())
+        for sha256, (tamanho, _, urls) in sorted(objetos.items(), key=lambda item: item[1][1]):
+            if total <= self.max_bytes:
+                break
+            if sha256 in self._em_uso:
+                continue
+            self._objeto(sha256).unlink(missing_ok=True)
+            for url in urls:
+                del self._indice[url]
+            total -= tamanho
+
+    def tamanho_cache(self):
+        with self._lock:
+            return sum({e['sha256']: e['tamanho'] for e in self._indice.values()}.values())
+
+
+def _tamanho_total(resposta):
+    """Tamanho completo do arquivo pelo Content-Range (206) ou Content-Length (200). None se não der para saber."""
+    if resposta.headers.get('Content-Encoding'):
+        return None  # Content-Length seria do corpo comprimido
+    faixa = resposta.headers.get('Content-Range')
+    if faixa and '/' in faixa and not faixa.endswith('/*'):
+        return int(faixa.rsplit('/', 1)[1])
+    tamanho = resposta.headers.get('Content-Length')
+    return int(tamanho) if tamanho and resposta.status_code == 200 else None
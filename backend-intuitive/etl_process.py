@@ -1,47 +1,161 @@
 import pandas as pd
 import re
+from sqlalchemy import text
 from database import engine
-from decimal import Decimal
-# Lib para bater os CNPJs e ver se são reais (Item 2.1)
-from validate_docbr import CNPJ
+from bulk_loader import copiar_dataframe
+from migracoes import garantir_particoes_despesas
+# Limpeza de valores e validação de CNPJ em lote, sem apply linha a linha
+from limpeza import valores_para_centavos, centavos_para_texto
+from indice_operadoras import obter_indice, COLUNAS_CADASTRO
+from instrumentacao import coletor, etapa
+# Encoding e separador detectados uma vez por arquivo, sem o loop de tentativas
+from leitor_csv import ler_csv, ler_cabecalho, ler_com_dialeto, motor_leitura, TIPO_TEXTO
+
+# Chave natural de despesas_consolidadas (índice único uq_despesas_chave_natural)
+CHAVE_DESPESAS = ['reg_ans', 'cd_conta_contabil', 'ano', 'trimestre']
+
+
+def _identificar_colunas(colunas):
+    """Identifica as colunas de conta, valor, registro ANS e data pelo nome (Item 3.6/3.7)."""
+    col_conta = next((c for c in colunas if 'CONTA' in c), None)
+    col_valor = next(
+        (c for c in colunas if 'VALOR' in c or 'SALDO' in c), None)
+    col_reg_ans = next(
+        (c for c in colunas if 'REG' in c and 'ANS' in c), None)
+    col_data = next((c for c in colunas if 'DATA' in c), None)
+    return col_conta, col_valor, col_reg_ans, col_data
+
+
+def _colunas_leitura(cabecalho):
+    """
+    Escolhe pelo cabeçalho as colunas usadas e o tipo de cada uma, o resto do arquivo nem é carregado.
+    Conta, registro ANS e data se repetem muito e viram categoria. O valor fica como texto compacto até virar centavos.
+    Retorna (colunas em maiúsculas, usecols, dtype) ou (None, None, None) sem as colunas de conta e valor.
+    """
+    originais = {c.upper(): c for c in cabecalho}
+    colunas = _identificar_colunas(list(originais))
+    col_conta, col_valor, col_reg_ans, col_data = colunas
+    if not col_conta or not col_valor:
+        return None, None, None
+    tipos = {col_conta: 'category', col_valor: TIPO_TEXTO, col_reg_ans: 'category', col_data: 'category'}
+    tipos = {originais[c]: tipo for c, tipo in tipos.items() if c}
+    return colunas, list(tipos), tipos
 
 
-def processar_e_carregar_despesas(path_csv, df_cadastral=None):
-    """Lê o arquivo e decide se ele tem dados de despesas (prefixo 411) para processar."""
+def _por_categoria(serie, transformar):
+    """
+    Aplica `transformar` (operações .str) só nos valores distintos de uma coluna categórica e espalha o resultado.
+    Devolve texto comum (object), como antes da leitura com categorias.
+    """
+    categorias = serie.cat.categories
+    return serie.map(dict(zip(categorias, transformar(categorias.astype(str))))).astype(object)
 
-    # Garante que nome_arquivo esteja sempre definido, somente para reutilizar a variável
-    nome_arquivo = path_csv.split('\\')[-1]
 
-    encodings = ['utf-8', 'latin1', 'cp1252']
-    df = None
+def _filtrar_bloco(df, col_conta, col_valor, col_reg_ans, col_data, nome_arquivo):
+    """Aplica em um bloco do CSV o filtro 411, a limpeza de valores e a normalização do registro ANS."""
 
-    for enc in encodings:
-        try:
-            # Lendo como string pra não perder zeros à esquerda ou ter erros de leitura (Item 1.2)
-            df = pd.read_csv(path_csv, sep=';', encoding=enc, dtype=str)
-            break
-        except Exception:
-            continue
+    # Filtro pelo prefixo 411 de indenizações e sinistros, testado uma vez por código de conta distinto
+    contas = df[col_conta].cat.categories
+    df_filtrado = df[df[col_conta].isin(contas[contas.str.startswith('411')])].copy()
+    if df_filtrado.empty:
+        return df_filtrado
+    df_filtrado[col_conta] = df_filtrado[col_conta].astype(str)
 
-    if df is None:
-        return None
+    # Limpeza de valores em centavos inteiros, para evitar inconsistências que existiriam usando float
+    df_filtrado['valor_centavos'] = valores_para_centavos(df_filtrado[col_valor])
 
-    # Normalização das colunas  com mapping para encontra-las com consistência
-    colunas_map = {col: col.upper() for col in df.columns}
-    df = df.rename(columns=colunas_map)
+    # Apaga valores negativos e 0 (item 1.3)
+    df_filtrado = df_filtrado[df_filtrado['valor_centavos'] > 0].copy()
 
-    # Identificando a coluna de conta e de valor (Item 3.6/3.7)
-    col_conta = next((c for c in df.columns if 'CONTA' in c), None)
-    col_valor = next(
-        (c for c in df.columns if 'VALOR' in c or 'SALDO' in c), None)
-    col_reg_ans = next(
-        (c for c in df.columns if 'REG' in c and 'ANS' in c), None)
+    # Extração de data pelas colunas e trimestres pelo nome do  Arquivo, já que pelos arquivos estava retornando erroneamente
+    # Se for apenas o ano (ex: 2025), o to_datetime pode falhar. Tratamos aqui:
+    # Poucas datas distintas por arquivo, o ano é extraído uma vez por data
+    df_filtrado['ano'] = _por_categoria(
+        df_filtrado[col_data], lambda datas: datas.str.extract(r'(\d{4})')[0]) if col_data else None
+    # Trimestre extraído do nome do arquivo (3T2025 -> 3) se não houver na coluna
+    tri_match = re.search(r'(\d)T', nome_arquivo)
+    df_filtrado['trimestre'] = tri_match.group(1) if tri_match else "1"
 
-    if not col_conta or not col_valor:
+    df_filtrado = df_filtrado.dropna(subset=['ano', 'trimestre'])
+
+    # Normalização da coluna reg_ans para ler 6 digitos sem espaço ou decimais
+    if col_reg_ans:
+        df_filtrado[col_reg_ans] = _por_categoria(
+            df_filtrado[col_reg_ans],
+            lambda registros: registros.str.strip().str.replace(r'\.0$', '', regex=True).str.zfill(6)).astype(str)
+
+    return df_filtrado
+
+
+def _ler_e_filtrar(path_csv, dialeto, nome_arquivo, chunksize=None):
+    """
+    Lê o CSV (inteiro ou em blocos de `chunksize` linhas) e devolve só as linhas 411 já limpas.
+    No modo em blocos apenas um bloco fica em memória por vez, o resto do arquivo é descartado logo após o filtro.
+    Retorna (df_filtrado, colunas) ou (None, None) se o arquivo não tiver as colunas de conta e valor.
+    """
+    # Colunas descobertas só pelo cabeçalho, a leitura completa traz apenas as 4 usadas
+    colunas, usar, tipos = _colunas_leitura(ler_cabecalho(path_csv, dialeto))
+    if colunas is None:
+        return None, None
+
+    # Tudo como texto/categoria pra não perder zeros à esquerda ou ter erros de leitura (Item 1.2)
+    # Leitura do texto (e descompactação, para membros de ZIP) medida separada do filtro
+    if chunksize:
+        leitor = ler_csv(path_csv, dialeto, usecols=usar, dtype=tipos, chunksize=chunksize)
+        blocos = coletor.medir_iteracao('leitura_csv', leitor)
+    else:
+        with etapa('leitura_csv') as medicao:
+            leitor = ler_csv(path_csv, dialeto, usecols=usar, dtype=tipos, engine=motor_leitura())
+            medicao.linhas = len(leitor)
+        blocos = [leitor]
+
+    partes = []
+    try:
+        for bloco in blocos:
+            # Normalização das colunas  com mapping para encontra-las com consistência
+            bloco.columns = bloco.columns.str.upper()
+
+            with etapa('filtro_411') as medicao:
+                parte = _filtrar_bloco(bloco, *colunas, nome_arquivo)
+                medicao.linhas = len(parte)
+            # Bloco sem linhas 411 volta sem valor_centavos, no concat ele transformaria os centavos em float
+            if not parte.empty:
+                partes.append(parte)
+    finally:
+        if chunksize:
+            leitor.close()
+
+    if not partes:
+        # Nenhum bloco com linhas 411 (ou cabeçalho sem linhas, que no modo em blocos pode não gerar bloco nenhum)
+        return pd.DataFrame(columns=[c for c in colunas if c]), colunas
+    return pd.concat(partes, ignore_index=True), colunas
+
+
+def ler_despesas_brutas(path_csv, chunksize=None, nome_arquivo=None):
+    """
+    Primeira etapa da transformação: lê o CSV e devolve só as linhas 411 limpas, antes do join com o cadastro.
+    `path_csv` pode ser um caminho ou um arquivo aberto (ex: membro de um ZIP), nesse caso informe `nome_arquivo`.
+    Com `chunksize` o arquivo é lido em blocos, mantendo a memória estável independente do tamanho do CSV.
+    Retorna as colunas reg_ans, cd_conta_contabil, valor_centavos, ano e trimestre, ou None sem dados 411.
+    É o que vai para o staging (despesas_brutas), de onde dá para refazer o join sem ler o texto de novo.
+    """
+
+    # Garante que nome_arquivo esteja sempre definido, somente para reutilizar a variável
+    if nome_arquivo is None:
+        nome_arquivo = path_csv.split('\\')[-1]
+
+    # Encoding (UTF-8, UTF-8 com BOM ou Latin-1) e separador vêm de uma amostra do início, o arquivo é lido uma vez só
+    try:
+        df_filtrado, colunas = ler_com_dialeto(
+            path_csv, lambda dialeto: _ler_e_filtrar(path_csv, dialeto, nome_arquivo, chunksize))
+    except Exception as e:
+        print(f"Erro ao ler {nome_arquivo}: {e}")
+        return None
+
+    if df_filtrado is None or colunas is None:
         return None
 
-    # Filtro pelo prefixo 411 de indenizações e sinistros
-    df_filtrado = df[df[col_conta].str.startswith('411', na=False)].copy()
+    col_conta, col_valor, col_reg_ans, col_data = colunas
 
     # Debug para controlar o volume de linhas que estão passando pelas validações
     print(
@@ -50,69 +164,51 @@ def processar_e_carregar_despesas(path_csv, df_cadastral=None):
     if df_filtrado.empty:
         return None
 
-    # Limpeza de valores utilizando Decimal, para evitar inconsistências que existiriam usando float
-    def limpar_valor(val):
-        try:
-            return Decimal(str(val).replace(',', '.'))
-        except Exception:
-            return Decimal('0.00')
-
-    df_filtrado['valor_limpo'] = df_filtrado[col_valor].apply(
-        limpar_valor)  # type: ignore
+    # Nomes fixos, independente de como a ANS nomeou as colunas no arquivo
+    renomear = {col_reg_ans: 'reg_ans', col_conta: 'cd_conta_contabil'}
+    colunas_brutas = [c for c in (col_reg_ans, col_conta) if c] + ['valor_centavos', 'ano', 'trimestre']
+    return df_filtrado[colunas_brutas].rename(columns=renomear)
 
-    # Apaga valores negativos e 0 (item 1.3)
-    df_filtrado = df_filtrado[df_filtrado['valor_limpo'] > 0].copy()
 
-    # Extração de data pelas colunas e trimestres pelo nome do  Arquivo, já que pelos arquivos estava retornando erroneamente
-    col_data = next((c for c in df.columns if 'DATA' in c), None)
-    if col_data:
-        # Se for apenas o ano (ex: 2025), o to_datetime pode falhar. Tratamos aqui:
-        df_filtrado['ano'] = df_filtrado[col_data].str.extract(r'(\d{4})')[0]
-        # Trimestre extraído do nome do arquivo (3T2025 -> 3) se não houver na coluna
-        tri_match = re.search(r'(\d)T', nome_arquivo)
-        df_filtrado['trimestre'] = tri_match.group(1) if tri_match else "1"
-
-    df_filtrado = df_filtrado.dropna(subset=['ano', 'trimestre'])
+def cruzar_cadastro(df_brutas, df_cadastral=None, nome_arquivo=''):
+    """
+    Segunda etapa: join com o cadastro de operadoras e validação de CNPJ, sem gravar no banco.
+    `df_cadastral` pode ser o DataFrame do cadastro ou o IndiceOperadoras já montado (o que o pipeline usa).
+    Retorna o DataFrame pronto para carga ou None se nada restar.
+    """
+    df_filtrado = df_brutas
+    indice = obter_indice(df_cadastral)
 
     # Join com Cadastro de Operadoras Ativas
-    if df_cadastral is not None and col_reg_ans:
-        # Normalização da coluna reg_ans para ler 6 digitos sem espaço ou decimais
-        df_filtrado[col_reg_ans] = df_filtrado[col_reg_ans].astype(
-            str).str.strip().str.replace(r'\.0$', '', regex=True).str.zfill(6)
-
+    if indice is not None and 'reg_ans' in df_filtrado.columns:
         # Trazendo CNPJ e Nome da operadora para o consolidado (Item 1.3)
-        df_filtrado = pd.merge(
-            df_filtrado,
-            df_cadastral[['registro_ans', 'cnpj', 'razao_social', 'uf']],
-            left_on=col_reg_ans,
-            right_on='registro_ans',
-            how='inner'
-        )
-
-        # Evita somar a conta 411 (pai) com a 4111 (filha)
-        df = df[df['CD_CONTA_CONTABIL'] == '411'].copy()
-
-        # Remove linhas idênticas que podem surgir depois de processar vários arquivos
-        df_filtrado = df_filtrado.drop_duplicates(
-            subset=[col_reg_ans, col_conta, 'valor_limpo', 'ano', 'trimestre'])
-
-        # Validação de CNPJ com lib validate_docbr(Item 2.1)
-        validador = CNPJ()
-
-        def validar_cnpj_limpo(valor):
-            if pd.isna(valor):
-                return False
-            cnpj_limpo = re.sub(r'\D', '', str(valor))
-            return validador.validate(cnpj_limpo)
-
-        # Substitui a coluna cnpj com cnpjs válidos e roda o validar_cnpj_limpo para debug
-        df_filtrado['cnpj_valido'] = df_filtrado['cnpj'].apply(
-            validar_cnpj_limpo)
-        df_filtrado = df_filtrado[df_filtrado['cnpj_valido'] == True].copy()
+        with etapa('merge_cadastro') as medicao:
+            # Posição de cada despesa no cadastro, as de operadoras sem cadastro ficam de fora (inner join)
+            posicoes = indice.posicoes(df_filtrado['reg_ans'])
+            encontradas = posicoes >= 0
+            df_filtrado = df_filtrado[encontradas].reset_index(drop=True)
+            posicoes = posicoes[encontradas]
+            for coluna in COLUNAS_CADASTRO:
+                df_filtrado[coluna] = indice.coluna(coluna, posicoes)
+
+            # Remove linhas idênticas que podem surgir depois de processar vários arquivos
+            unicas = ~df_filtrado.duplicated(
+                subset=['reg_ans', 'cd_conta_contabil', 'valor_centavos', 'ano', 'trimestre']).to_numpy()
+            df_filtrado = df_filtrado[unicas]
+            posicoes = posicoes[unicas]
+            medicao.linhas = len(df_filtrado)
+
+        # Validade do CNPJ já calculada no índice, uma vez por operadora do cadastro (Item 2.1)
+        with etapa('validacao_cnpj', linhas=len(df_filtrado)):
+            df_filtrado = df_filtrado[indice.cnpj_valido(posicoes)].assign(cnpj_valido=True)
 
         # Debug de CNPJS
         print(f"DEBUG: Linhas após a validação de CNPJ: {len(df_filtrado)}")
 
+    # Texto com 2 casas só depois do join, para as linhas que sobraram
+    df_filtrado = df_filtrado.copy()
+    df_filtrado['valor_limpo'] = centavos_para_texto(df_filtrado['valor_centavos'])
+
     if not df_filtrado.empty:
         print(
             f"\n✅ {nome_arquivo}: {len(df_filtrado)} registros cruzados com sucesso!")
@@ -122,37 +218,91 @@ def processar_e_carregar_despesas(path_csv, df_cadastral=None):
     else:
         print(f"\n⚠️ {nome_arquivo}: Nenhum dado restou após o Join/Validação.")
 
-    # Salvando no Postgres em massa
-    if not df_filtrado.empty:
-        try:
-            df_db = df_filtrado[[col_reg_ans, col_conta, 'valor_limpo', 'ano', 'trimestre']].rename(columns={
-                col_reg_ans: 'reg_ans', col_conta: 'cd_conta_contabil', 'valor_limpo': 'vl_saldo_final'
-            })
-            df_db.to_sql('despesas_consolidadas', con=engine,
-                         if_exists='append', index=False, chunksize=1000)
-            return df_filtrado
-        except Exception as e:
-            print(f"Erro na carga: {e}")
-            return None
-    return None
+    if df_filtrado.empty:
+        return None
+
+    return df_filtrado
+
+
+def transformar_despesas(path_csv, df_cadastral=None, chunksize=None, nome_arquivo=None):
+    """
+    Lê o arquivo e decide se ele tem dados de despesas (prefixo 411) para processar, sem gravar no banco.
+    Junta as duas etapas (ler_despesas_brutas + cruzar_cadastro).
+    Retorna o DataFrame pronto para carga (colunas reg_ans e cd_conta_contabil padronizadas) ou None.
+    """
+    if nome_arquivo is None:
+        nome_arquivo = path_csv.split('\\')[-1]
+    df_brutas = ler_despesas_brutas(path_csv, chunksize, nome_arquivo)
+    if df_brutas is None:
+        return None
+    return cruzar_cadastro(df_brutas, df_cadastral, nome_arquivo)
+
+
+def carregar_despesas(df_filtrado):
+    """
+    Grava no Postgres as despesas já transformadas. Retorna o próprio DataFrame ou None em caso de erro.
+    A carga é um upsert pela chave natural e substitui o trimestre inteiro, então reprocessar um arquivo não duplica linhas.
+    Por isso as linhas de um trimestre vêm todas na mesma chamada (ex: todos os CSVs de um ZIP juntos).
+    """
+    try:
+        # Uma linha por chave natural, se a conta vier repetida no arquivo fica o maior valor
+        df_db = df_filtrado.sort_values('valor_centavos').drop_duplicates(subset=CHAVE_DESPESAS, keep='last')
+        df_db = df_db[['reg_ans', 'cd_conta_contabil', 'valor_limpo', 'ano', 'trimestre']].rename(columns={
+            'valor_limpo': 'vl_saldo_final'
+        })
+        with etapa('carga_banco', linhas=len(df_db)):
+            # Partição do ano precisa existir antes da carga (tabela particionada por ano)
+            garantir_particoes_despesas(engine, df_db['ano'].unique())
+            copiar_dataframe(df_db, 'despesas_consolidadas', modo='upsert',
+                             chaves=CHAVE_DESPESAS, escopo=['ano', 'trimestre'])
+        return df_filtrado
+    except Exception as e:
+        print(f"Erro na carga: {e}")
+        return None
+
+
+def ler_despesas_trimestre(ano, trimestre):
+    """
+    Recupera do banco um trimestre já carregado (arquivo pulado pelo manifesto), no mesmo formato de transformar_despesas.
+    Assim os arquivos finais continuam completos mesmo quando o trimestre não é reprocessado.
+    """
+    sql = text("""
+        SELECT d.reg_ans, d.cd_conta_contabil, d.vl_saldo_final, d.ano, d.trimestre,
+               o.registro_ans, o.cnpj, o.razao_social, o.uf
+        FROM despesas_consolidadas d
+        JOIN operadoras_ativas o ON d.reg_ans = o.registro_ans
+        WHERE d.ano = :ano AND d.trimestre = :trimestre
+    """)
+    df = pd.read_sql(sql, engine, params={"ano": int(ano), "trimestre": int(trimestre)})
+    df['valor_centavos'] = valores_para_centavos(df.pop('vl_saldo_final').astype(str))
+    df['valor_limpo'] = centavos_para_texto(df['valor_centavos'])
+    # Mesmos tipos (texto) que saem da leitura do CSV
+    df['ano'] = df['ano'].astype(str)
+    df['trimestre'] = df['trimestre'].astype(str)
+    return df
+
+
+def ler_operadoras():
+    """Cadastro de operadoras já carregado no banco, usado quando o arquivo da ANS não mudou."""
+    return pd.read_sql(text("SELECT registro_ans, cnpj, razao_social, uf, modalidade FROM operadoras_ativas"), engine)
+
+
+def processar_e_carregar_despesas(path_csv, df_cadastral=None, chunksize=None, nome_arquivo=None):
+    """Transforma o arquivo de despesas e, se houver dados 411, salva no Postgres em massa."""
+    df_filtrado = transformar_despesas(path_csv, df_cadastral, chunksize, nome_arquivo)
+    if df_filtrado is None:
+        return None
+    return carregar_despesas(df_filtrado)
 
 
 def carregar_operadoras(path_csv):
     """Lê o Relatorio_cadastro de operadoras ativas e prepara a base de nomes e CNPJs (Item 2.2)."""
-    encodings = ['utf-8-sig', 'utf-8', 'latin1',
-                 'cp1252']  # Utf-8 retornava caracteres desconhecidos, mesmo sendo recomendado no item 3.3 utf-8-sig funciona normalmente
-    df_cad = None
-
-    for enc in encodings:  # testa encodings
-        try:
-            df_cad = pd.read_csv(path_csv, sep=';', encoding=enc, dtype=str)
-            # Se o número de colunas criadas pelo pandas for menor que 2, lê o arquivo com o outro encoding da lista encodings
-            if df_cad.shape[1] < 2:
-                df_cad = pd.read_csv(
-                    path_csv, sep=',', encoding=enc, dtype=str)
-            break
-        except Exception:
-            continue
+    # Encoding e separador (';' ou ',') detectados no cabeçalho. Utf-8 com BOM era o que funcionava no item 3.3
+    try:
+        df_cad = ler_com_dialeto(path_csv, lambda dialeto: ler_csv(path_csv, dialeto, dtype=str))
+    except Exception as e:
+        print(f"Erro ao ler o cadastro de operadoras: {e}")
+        df_cad = None
 
     if df_cad is not None:
         df_cad.columns = df_cad.columns.str.strip().str.lower().str.replace(
@@ -176,7 +326,6 @@ def carregar_operadoras(path_csv):
             str).str.strip().str.replace(r'\.0$', '', regex=True).str.zfill(6)
 
         df_clean = df_clean.drop_duplicates(subset=['registro_ans'])
-        df_clean.to_sql('operadoras_ativas', con=engine,
-                        if_exists='replace', index=False)
+        copiar_dataframe(df_clean, 'operadoras_ativas', modo='replace')
         return df_clean
     return None
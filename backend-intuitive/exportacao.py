@@ -0,0 +1,61 @@
+import codecs
+import os
+import zipfile
+from pathlib import Path
+import pandas as pd
+
+# Compressão dos ZIPs finais. deflated é o formato que qualquer descompactador abre,
+# nível 1 é bem mais rápido que o padrão (6) com arquivo um pouco maior. stored não comprime nada
+METODOS = {
+    'deflated': zipfile.ZIP_DEFLATED,
+    'stored': zipfile.ZIP_STORED,
+    'bzip2': zipfile.ZIP_BZIP2,
+    'lzma': zipfile.ZIP_LZMA,
+}
+COMPRESSAO = os.getenv('ETL_ZIP_COMPRESSAO', 'deflated')
+NIVEL_COMPRESSAO = int(os.getenv('ETL_ZIP_NIVEL')) if os.getenv('ETL_ZIP_NIVEL') else None
+# Linhas formatadas por vez pelo to_csv antes de irem para o compressor
+LINHAS_POR_BLOCO = 100_000
+
+
+def _blocos(dados):
+    if isinstance(dados, pd.DataFrame):
+        return [dados]
+    return dados
+
+
+def exportar_zip(destino, membros, compressao=COMPRESSAO, nivel=NIVEL_COMPRESSAO):
+    """
+    Grava um ZIP com um CSV (';', UTF-8 com BOM) por membro, escrevendo as linhas direto no membro comprimido.
+    Não existe CSV solto em disco nem uma segunda passada para comprimir.
+    `membros` é uma lista de (nome_csv, dados), e `dados` é um DataFrame ou um iterável de DataFrames
+    (ex: um trimestre por vez), que vão para o mesmo CSV com um único cabeçalho.
+    O ZIP é montado num arquivo temporário ao lado do destino e só substitui o destino (os.replace) quando
+    está completo. Quem abre a pasta nunca vê um ZIP pela metade.
+    Retorna (linhas, bytes do ZIP).
+    """
+    if compressao not in METODOS:
+        raise ValueError(f"compressão desconhecida: {compressao} (use {', '.join(METODOS)})")
+    destino = Path(destino)
+    temporario = destino.with_name(f".{destino.name}.tmp")
+    linhas = 0
+    try:
+        with zipfile.ZipFile(temporario, 'w', compression=METODOS[compressao], compresslevel=nivel) as zipf:
+            for nome, dados in membros:
+                # force_zip64: o tamanho final do membro não é conhecido antes de terminar de escrever
+                with zipf.open(nome, 'w', force_zip64=True) as membro:
+                    membro.write(codecs.BOM_UTF8)
+                    cabecalho = True
+                    for df in _blocos(dados):
+                        # Blocos de texto grandes para o compressor, sem um write por linha
+                        for inicio in range(0, max(len(df), 1), LINHAS_POR_BLOCO):
+                            bloco = df.iloc[inicio:inicio + LINHAS_POR_BLOCO]
+                            membro.write(bloco.to_csv(sep=';', index=False, header=cabecalho).encode('utf-8'))
+                            cabecalho = False
+                        linhas += len(df)
+        os.replace(temporario, destino)
+    except BaseException:
+        if temporario.exists():
+            temporario.unlink()
+        raise
+    return linhas, destino.stat().st_size
@@ -1,3 +1,4 @@
+import io
 import os
 import zipfile
 import shutil
@@ -48,67 +49,39 @@ def extrair_zip(caminho_projeto):
     except Exception as e:
         print(f"Erro ao extrair ZIP: {e}")
 
-def limpar_temporarios(caminho_base_temp):
+def ler_csvs_zip(origem):
     """
-    1. Descobre onde é o Desktop Real.
-    2. Cria uma pasta 'Output_Intuitive' no Desktop.
-    3. Move os ZIPs prontos para lá.
-    4. Deleta a pasta temporária de trabalho.
+    Percorre os CSVs de um ZIP sem extrair nada para o disco.
+    `origem` pode ser o conteúdo do ZIP em bytes ou o caminho do arquivo.
+    Gera (nome_arquivo, arquivo_aberto) e cada membro é descompactado em streaming durante a leitura.
     """
-    base_path = Path(caminho_base_temp)
-    data_path = base_path / 'data'
-    
-    # Pega o destino correto (Desktop)
-    desktop_root = Path(get_desktop_real())
-    
-    # Cria a pasta final organizada
-    pasta_final = desktop_root / "Output_Intuitive"
-    pasta_final.mkdir(parents=True, exist_ok=True)
-
-    arquivos_finais = ['consolidado_despesas.zip', 'Teste_Erik.zip']
+    fonte = io.BytesIO(origem) if isinstance(origem, (bytes, bytearray)) else origem
+    with zipfile.ZipFile(fonte, 'r') as zip_ref:
+        for info in zip_ref.infolist():
+            if info.is_dir() or not info.filename.lower().endswith('.csv'):
+                continue
+            with zip_ref.open(info) as membro:
+                # Só o nome do arquivo, sem pastas internas do ZIP
+                yield os.path.basename(info.filename), membro
 
-    print(f"Finalizando: Organizando arquivos em: {pasta_final}")
-
-    for arquivo in arquivos_finais:
-        origem = data_path / arquivo
-        destino = pasta_final / arquivo
-        
-        if origem.exists():
-            # Move para dentro da pasta nova
-            shutil.move(str(origem), str(destino), copy_function=shutil.copy2)
+def pasta_saida():
+    """Pasta final dos ZIPs: 'Output_Intuitive' no Desktop (ou na pasta 'output' do projeto, no Docker)."""
+    pasta_final = Path(get_desktop_real()) / "Output_Intuitive"
+    pasta_final.mkdir(parents=True, exist_ok=True)
+    return pasta_final
 
-    # 4. Limpa a bagunça do projeto
-    if base_path.exists():
-        try:
-            shutil.rmtree(base_path)
-            print("Limpeza concluída! Pasta temporária removida.")
-        except Exception as e:
-            print(f"Aviso: Não foi possível deletar a pasta temporária completamente: {e}")
+def limpar_temporarios(caminho_base_temp):
     """
-    1. Descobre onde é o Desktop Real.
-    2. Move os ZIPs prontos da pasta temporária para o Desktop.
-    3. Deleta a pasta temporária com segurança.
+    Deleta a pasta temporária de trabalho.
+    Os ZIPs finais já são gravados direto na pasta 'Output_Intuitive' (ver pasta_saida e exportacao.py),
+    não há mais nada para mover daqui.
     """
     base_path = Path(caminho_base_temp)
-    data_path = base_path / 'data'
-    
-    # Pega o destino correto (Desktop)
-    desktop_path = Path(get_desktop_real())
-
-    arquivos_finais = ['consolidado_despesas.zip', 'Teste_Erik.zip']
-
-    print(f"Finalizando: Movendo arquivos para: {desktop_path}")
-
-    for arquivo in arquivos_finais:
-        origem = data_path / arquivo
-        destino = desktop_path / arquivo
-        
-        if origem.exists():
-            # Move e sobrescreve se necessário
-            shutil.move(str(origem), str(destino), copy_function=shutil.copy2)
 
+    # Limpa a bagunça do projeto
     if base_path.exists():
         try:
             shutil.rmtree(base_path)
+            print("Limpeza concluída! Pasta temporária removida.")
         except Exception as e:
-            print(f"Aviso: Não foi possível deletar a pasta temporária completamente: {e}")
\ No newline at end of file
+            print(f"Aviso: Não foi possível deletar a pasta temporária completamente: {e}")
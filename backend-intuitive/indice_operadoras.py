@@ -0,0 +1,127 @@
+import os
+import shutil
+import tempfile
+import numpy as np
+import pandas as pd
+from limpeza import validar_cnpjs
+
+# Colunas do cadastro que vão para as despesas no join (Item 1.3)
+COLUNAS_CADASTRO = ['registro_ans', 'cnpj', 'razao_social', 'uf']
+
+
+def _para_bytes(serie):
+    # Texto UTF-8 em largura fixa, guardado num array numpy comum (dá para abrir com mmap em outro processo)
+    return np.array(serie.fillna('').astype(str).str.encode('utf-8').tolist(), dtype=bytes)
+
+
+def _para_chaves(registros):
+    """Registro ANS como int64 (-1 se não for só dígitos), para a busca binária no lugar de um índice de texto."""
+    texto = pd.Series(registros, dtype=object).fillna('').astype(str)
+    numericos = texto.str.fullmatch(r'\d{1,18}').to_numpy(dtype=bool)
+    chaves = np.full(len(texto), -1, dtype='int64')
+    chaves[numericos] = texto[numericos].astype('int64').to_numpy()
+    return chaves
+
+
+class IndiceOperadoras:
+    """
+    Cadastro de operadoras em arrays, montado uma vez por execução para o join das despesas.
+    Cada registro ANS vira uma posição inteira. O join de um arquivo é só achar a posição de cada linha
+    e copiar CNPJ, razão social e UF dessas posições, sem refazer o hash join do pd.merge a cada arquivo.
+    A busca é binária (np.searchsorted) sobre os registros como int64 ordenados, e o texto fica em bytes de
+    largura fixa: só as linhas copiadas para as despesas são decodificadas.
+    A validade do CNPJ já vem calculada, um CNPJ do cadastro é validado uma vez só.
+    Os arrays podem ser gravados numa pasta (`compartilhar`) e abertos pelos workers com mmap (`abrir`),
+    assim os processos leem a mesma cópia do cadastro em vez de receber um DataFrame cada um.
+    """
+
+    def __init__(self, arrays, pasta=None):
+        # registro_ans, cnpj, razao_social, uf (bytes), cnpj_valido (bool),
+        # chaves (registros int64 ordenados) e ordem (posição no cadastro de cada chave)
+        self._arrays = arrays
+        self.pasta = pasta
+        self._pasta_propria = False
+
+    @classmethod
+    def do_cadastro(cls, df_cadastral):
+        """Monta o índice a partir do DataFrame de carregar_operadoras/ler_operadoras."""
+        df = df_cadastral.drop_duplicates(subset=['registro_ans'])
+        arrays = {coluna: _para_bytes(df[coluna]) for coluna in COLUNAS_CADASTRO}
+        arrays['cnpj_valido'] = validar_cnpjs(df['cnpj']).to_numpy(dtype=bool)
+        chaves = _para_chaves(df['registro_ans'])
+        arrays['ordem'] = np.argsort(chaves, kind='stable')
+        arrays['chaves'] = chaves[arrays['ordem']]
+        return cls(arrays)
+
+    @classmethod
+    def abrir(cls, pasta):
+        """Abre (somente leitura, via mmap) um índice gravado por `compartilhar`."""
+        arrays = {nome: np.load(os.path.join(pasta, f"{nome}.npy"), mmap_mode='r')
+                  for nome in COLUNAS_CADASTRO + ['cnpj_valido', 'chaves', 'ordem']}
+        return cls(arrays, pasta)
+
+    def compartilhar(self):
+        """Grava os arrays numa pasta temporária para os workers abrirem com `abrir`. Retorna a pasta."""
+        if self.pasta is None:
+            self.pasta = tempfile.mkdtemp(prefix='indice_operadoras_')
+            self._pasta_propria = True
+            for nome, array in self._arrays.items():
+                np.save(os.path.join(self.pasta, f"{nome}.npy"), array)
+        return self.pasta
+
+    def remover(self):
+        """Apaga a pasta criada por `compartilhar` (workers já encerrados). Índices abertos com `abrir` não apagam nada."""
+        if self._pasta_propria:
+            shutil.rmtree(self.pasta, ignore_errors=True)
+            self.pasta, self._pasta_propria = None, False
+
+    def __len__(self):
+        return len(self._arrays['registro_ans'])
+
+    def posicoes(self, reg_ans):
+        """Posição de cada registro ANS no cadastro, -1 para operadora fora do cadastro."""
+        # Poucos registros distintos por arquivo: a busca é feita uma vez por registro e espalhada nas linhas
+        codigos, distintos = pd.factorize(pd.Series(reg_ans, dtype=object))
+        distintos = pd.Series(distintos, dtype=object)
+        chaves = _para_chaves(distintos)
+        ordenadas = self._arrays['chaves']
+        if len(ordenadas) == 0:
+            return np.full(len(codigos), -1, dtype='int64')
+        ordem = np.asarray(self._arrays['ordem'])
+        i = np.minimum(np.searchsorted(ordenadas, chaves), len(ordenadas) - 1)
+        encontradas = (chaves >= 0) & (np.asarray(ordenadas[i]) == chaves)
+        achadas = np.where(encontradas, ordem[i], -1)
+        textos = distintos.astype(str).str.encode('utf-8').to_numpy(dtype=bytes)
+        # A chave inteira ignora zeros à esquerda ('123' = '000123'), o texto do registro tem que bater exatamente
+        confirmar = np.flatnonzero(encontradas)
+        achadas[confirmar[self._arrays['registro_ans'][achadas[confirmar]] != textos[confirmar]]] = -1
+        # Registros que não são só dígitos (raros) ficam no começo das chaves, com -1, e são comparados pelo texto
+        sem_chave = ordem[:np.searchsorted(ordenadas, 0)]
+        if len(sem_chave):
+            # Registro vazio no cadastro é ausente, não casa com nada
+            por_texto = {texto: posicao for texto, posicao in
+                         zip(self._arrays['registro_ans'][sem_chave].tolist(), sem_chave.tolist()) if texto}
+            for j in np.flatnonzero(chaves < 0):
+                achadas[j] = por_texto.get(textos[j], -1)
+        return np.where(codigos >= 0, achadas[codigos], -1)
+
+    def coluna(self, coluna, posicoes):
+        """Valores de uma coluna do cadastro nas `posicoes` (todas >= 0)."""
+        # Decodifica cada operadora copiada uma vez só. Texto vazio volta como ausente, como no DataFrame de origem
+        # (marcação por posição do cadastro em vez de np.unique, que ordenaria todas as linhas do arquivo)
+        usadas = np.zeros(len(self), dtype=bool)
+        usadas[posicoes] = True
+        unicas = np.flatnonzero(usadas)
+        valores = np.empty(len(self), dtype=object)
+        valores[unicas] = [valor.decode('utf-8') or None for valor in self._arrays[coluna][unicas]]
+        return valores[posicoes]
+
+    def cnpj_valido(self, posicoes):
+        return np.asarray(self._arrays['cnpj_valido'])[posicoes]
+
+
+def obter_indice(cadastro):
+    """Aceita o índice pronto ou o DataFrame do cadastro (monta o índice na hora)."""
+    if cadastro is None or isinstance(cadastro, IndiceOperadoras):
+        return cadastro
+    return IndiceOperadoras.do_cadastro(cadastro)
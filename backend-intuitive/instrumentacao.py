@@ -0,0 +1,178 @@
+import cProfile
+import contextlib
+import json
+import os
+import re
+import sys
+import threading
+import time
+import tracemalloc
+
+try:
+    import resource  # Só existe em Linux/macOS, no Windows o pico de memória fica de fora
+except ImportError:
+    resource = None
+
+# Pasta para os perfis por arquivo (cProfile + tracemalloc). Vazio = desligado, sem custo na carga
+PERFIL_DIR = os.getenv('ETL_PERFIL_DIR', '')
+
+
+def memoria_pico_bytes():
+    """Pico de memória residente do processo até agora, ou None sem o módulo resource."""
+    if resource is None:
+        return None
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux informa em KB, macOS em bytes
+    return pico if sys.platform == 'darwin' else pico * 1024
+
+
+class _Medicao:
+    """Quantidades informadas dentro do `with etapa(...)`: linhas e bytes processados pela chamada."""
+
+    def __init__(self, linhas=0, bytes_=0):
+        self.linhas = linhas
+        self.bytes = bytes_
+
+
+class Coletor:
+    """
+    Tempo, chamadas, linhas e bytes por etapa do ETL, mais o pico de memória de cada processo.
+    Seguro entre threads (downloads e escritor), e os workers do pool de processos devolvem um `resumo()`
+    que o processo principal junta com `incorporar`.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.limpar()
+
+    def limpar(self):
+        with self._lock:
+            self.etapas = {}
+            self.memoria = {}  # processo -> pico em bytes
+
+    def registrar(self, nome, segundos=0.0, linhas=0, bytes_=0, chamadas=1):
+        with self._lock:
+            etapa = self.etapas.setdefault(nome, {"chamadas": 0, "segundos": 0.0, "linhas": 0, "bytes": 0})
+            etapa["chamadas"] += chamadas
+            etapa["segundos"] += segundos
+            etapa["linhas"] += int(linhas or 0)
+            etapa["bytes"] += int(bytes_ or 0)
+
+    @contextlib.contextmanager
+    def etapa(self, nome, linhas=0, bytes_=0):
+        """Cronometra o bloco. Linhas/bytes podem ser informados antes ou preenchidos dentro: `with etapa(..) as m: m.linhas = n`."""
+        medicao = _Medicao(linhas, bytes_)
+        inicio = time.perf_counter()
+        try:
+            yield medicao
+        finally:
+            self.registrar(nome, time.perf_counter() - inicio, medicao.linhas, medicao.bytes)
+
+    def medir_iteracao(self, nome, iteravel):
+        """Repassa os itens de `iteravel` contando só o tempo de produzir cada um (ex: blocos do read_csv)."""
+        iterador = iter(iteravel)
+        while True:
+            inicio = time.perf_counter()
+            try:
+                item = next(iterador)
+            except StopIteration:
+                self.registrar(nome, time.perf_counter() - inicio, chamadas=0)
+                return
+            self.registrar(nome, time.perf_counter() - inicio, linhas=len(item))
+            yield item
+
+    def anotar_memoria(self, processo='principal'):
+        pico = memoria_pico_bytes()
+        if pico is not None:
+            with self._lock:
+                self.memoria[processo] = max(self.memoria.get(processo, 0), pico)
+
+    def resumo(self):
+        with self._lock:
+            return {"etapas": {nome: dict(valores) for nome, valores in self.etapas.items()},
+                    "memoria_pico_bytes": dict(self.memoria)}
+
+    def incorporar(self, resumo):
+        """Soma as etapas de outro coletor (worker) e guarda o maior pico de memória por processo."""
+        for nome, valores in resumo.get("etapas", {}).items():
+            self.registrar(nome, valores["segundos"], valores["linhas"], valores["bytes"], valores["chamadas"])
+        with self._lock:
+            for processo, pico in resumo.get("memoria_pico_bytes", {}).items():
+                self.memoria[processo] = max(self.memoria.get(processo, 0), pico)
+
+    def relatorio_json(self):
+        resumo = self.resumo()
+        for valores in resumo["etapas"].values():
+            valores["segundos"] = round(valores["segundos"], 4)
+        return json.dumps(resumo, ensure_ascii=False, indent=2)
+
+    def relatorio_prometheus(self):
+        """Texto no formato de exposição do Prometheus (para o node_exporter textfile ou pushgateway)."""
+        resumo = self.resumo()
+        linhas = []
+        for metrica, campo, tipo in (("etl_etapa_segundos_total", "segundos", "counter"),
+                                     ("etl_etapa_chamadas_total", "chamadas", "counter"),
+                                     ("etl_etapa_linhas_total", "linhas", "counter"),
+                                     ("etl_etapa_bytes_total", "bytes", "counter")):
+            linhas.append(f"# TYPE {metrica} {tipo}")
+            for nome, valores in sorted(resumo["etapas"].items()):
+                linhas.append(f'{metrica}{{etapa="{nome}"}} {valores[campo]}')
+        linhas.append("# TYPE etl_memoria_pico_bytes gauge")
+        for processo, pico in sorted(resumo["memoria_pico_bytes"].items()):
+            linhas.append(f'etl_memoria_pico_bytes{{processo="{processo}"}} {pico}')
+        return "\n".join(linhas) + "\n"
+
+    def imprimir(self):
+        """Tabela resumida no terminal, da etapa mais demorada para a mais rápida."""
+        resumo = self.resumo()
+        print(f"\n{'Etapa':<22}{'Chamadas':>10}{'Segundos':>11}{'Linhas':>12}{'MB':>10}")
+        for nome, v in sorted(resumo["etapas"].items(), key=lambda item: -item[1]["segundos"]):
+            print(f"{nome:<22}{v['chamadas']:>10}{v['segundos']:>11.2f}{v['linhas']:>12}{v['bytes'] / 1e6:>10.1f}")
+        for processo, pico in sorted(resumo["memoria_pico_bytes"].items()):
+            print(f"Pico de memória ({processo}): {pico / 1e6:.0f} MB")
+
+    def salvar(self, caminho):
+        """Grava o relatório em JSON (.json) ou no texto do Prometheus (qualquer outra extensão)."""
+        conteudo = self.relatorio_json() if caminho.endswith('.json') else self.relatorio_prometheus()
+        with open(caminho, 'w', encoding='utf-8') as f:
+            f.write(conteudo)
+
+
+# Um coletor por processo: etapas do processo principal e, nos workers, as do arquivo em andamento
+coletor = Coletor()
+etapa = coletor.etapa
+
+
+@contextlib.contextmanager
+def perfil_arquivo(nome, pasta=None):
+    """
+    Com ETL_PERFIL_DIR definido grava, para o arquivo `nome`, o perfil do cProfile (.prof, abre no snakeviz/pstats)
+    e o pico de memória com as 25 linhas que mais retêm memória segundo o tracemalloc (.txt). Sem a variável não faz nada.
+    """
+    pasta = pasta if pasta is not None else os.getenv('ETL_PERFIL_DIR', PERFIL_DIR)
+    if not pasta:
+        yield
+        return
+
+    os.makedirs(pasta, exist_ok=True)
+    base = os.path.join(pasta, re.sub(r'[^\w.-]', '_', nome))
+    perfil = cProfile.Profile()
+    ja_rastreando = tracemalloc.is_tracing()
+    if not ja_rastreando:
+        tracemalloc.start()
+    tracemalloc.reset_peak()
+    perfil.enable()
+    try:
+        yield
+    finally:
+        perfil.disable()
+        perfil.dump_stats(f"{base}.prof")
+        _, pico = tracemalloc.get_traced_memory()
+        estatisticas = tracemalloc.take_snapshot().statistics('lineno')[:25]
+        if not ja_rastreando:
+            tracemalloc.stop()
+        with open(f"{base}.txt", 'w', encoding='utf-8') as f:
+            f.write(f"Pico de memória rastreada: {pico / 1e6:.1f} MB\nAinda alocado ao final, por linha:\n\n")
+            for linha in estatisticas:
+                f.write(f"{linha}\n")
+        print(f"Perfil de {nome} gravado em {base}.prof / .txt")
@@ -0,0 +1,170 @@
+import codecs
+import os
+import threading
+from collections import OrderedDict, namedtuple
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+    PYARROW = True
+except ImportError:  # Sem pyarrow a leitura usa o parser C do pandas, como antes
+    PYARROW = False
+
+# Bytes do início do arquivo usados para detectar encoding e separador
+TAMANHO_AMOSTRA = 64 * 1024
+DELIMITADORES = (';', ',', '\t', '|')
+# Arquivos da ANS que não são UTF-8 vêm em Latin-1 (mesma escolha do loop de encodings antigo)
+ENCODING_ALTERNATIVO = 'latin1'
+BOMS = ((codecs.BOM_UTF8, 'utf-8-sig'), (codecs.BOM_UTF16_LE, 'utf-16'), (codecs.BOM_UTF16_BE, 'utf-16'))
+
+# Texto compacto (Arrow) quando disponível, senão o object do pandas
+TIPO_TEXTO = 'string[pyarrow]' if PYARROW else object
+
+Dialeto = namedtuple('Dialeto', ['encoding', 'delimitador', 'bom'])
+
+_cache = OrderedDict()
+_lock = threading.Lock()
+MAX_CACHE = 256
+
+
+def _ler_amostra(fonte, tamanho):
+    """Primeiros bytes de um caminho ou arquivo aberto (volta o arquivo para o início)."""
+    if hasattr(fonte, 'read'):
+        fonte.seek(0)
+        amostra = fonte.read(tamanho)
+        fonte.seek(0)
+        return amostra if isinstance(amostra, bytes) else amostra.encode('utf-8')
+    with open(fonte, 'rb') as f:
+        return f.read(tamanho)
+
+
+def _detectar_encoding(amostra):
+    for bom, encoding in BOMS:
+        if amostra.startswith(bom):
+            return encoding, True
+    try:
+        # final=False: um caractere multibyte cortado no fim da amostra não conta como erro
+        codecs.getincrementaldecoder('utf-8')().decode(amostra, final=False)
+        return 'utf-8', False
+    except UnicodeDecodeError:
+        return ENCODING_ALTERNATIVO, False
+
+
+def _detectar_delimitador(cabecalho):
+    """Separador mais frequente na linha de cabeçalho, fora de aspas. ';' (padrão da ANS) em caso de empate/ausência."""
+    contagem = dict.fromkeys(DELIMITADORES, 0)
+    entre_aspas = False
+    for caractere in cabecalho:
+        if caractere == '"':
+            entre_aspas = not entre_aspas
+        elif not entre_aspas and caractere in contagem:
+            contagem[caractere] += 1
+    melhor = max(DELIMITADORES, key=lambda d: contagem[d])
+    return melhor if contagem[melhor] > contagem[';'] else ';'
+
+
+def _chave_padrao(fonte):
+    if isinstance(fonte, (str, os.PathLike)):
+        estado = os.stat(fonte)
+        return (os.fspath(fonte), estado.st_size, estado.st_mtime_ns)
+    return None
+
+
+def _guardar(chave, dialeto):
+    if chave is None:
+        return
+    with _lock:
+        _cache[chave] = dialeto
+        _cache.move_to_end(chave)
+        while len(_cache) > MAX_CACHE:
+            _cache.popitem(last=False)
+
+
+def detectar_dialeto(fonte, chave=None, tamanho_amostra=TAMANHO_AMOSTRA):
+    """
+    Encoding (com ou sem BOM) e separador de um CSV a partir de uma amostra do início, sem ler o arquivo todo.
+    `fonte` é um caminho ou arquivo aberto em binário (ex: membro de ZIP). O resultado fica em cache por `chave`
+    (padrão: caminho + tamanho + data de modificação; arquivos abertos só entram no cache com `chave`).
+    """
+    chave = chave if chave is not None else _chave_padrao(fonte)
+    if chave is not None:
+        with _lock:
+            if chave in _cache:
+                _cache.move_to_end(chave)
+                return _cache[chave]
+
+    amostra = _ler_amostra(fonte, tamanho_amostra)
+    encoding, bom = _detectar_encoding(amostra)
+    texto = amostra.decode(encoding, errors='ignore')
+    cabecalho = texto.lstrip('\ufeff').split('\n', 1)[0]
+    dialeto = Dialeto(encoding, _detectar_delimitador(cabecalho), bom)
+    _guardar(chave, dialeto)
+    return dialeto
+
+
+def motor_leitura(chunksize=None):
+    """Engine do read_csv: pyarrow (multithread) quando instalado. Leitura em blocos só existe no parser C."""
+    return 'pyarrow' if PYARROW and not chunksize else 'c'
+
+
+def _ler_pyarrow(fonte, dialeto, usecols=None, dtype=None):
+    """
+    Leitura pelo parser CSV do pyarrow (multithread). Todas as colunas como texto, sem inferência de tipo,
+    e as pedidas como 'category' viram dicionário (Categorical no pandas) sem passar por objetos Python.
+    """
+    dtype = dtype or {}
+    # O pyarrow já descarta o BOM, com 'utf-8-sig' ele converteria o arquivo inteiro em Python
+    encoding = 'utf-8' if dialeto.encoding == 'utf-8-sig' else dialeto.encoding
+    try:
+        tabela = pa_csv.read_csv(
+            fonte,
+            read_options=pa_csv.ReadOptions(encoding=encoding),
+            parse_options=pa_csv.ParseOptions(delimiter=dialeto.delimitador),
+            convert_options=pa_csv.ConvertOptions(
+                include_columns=usecols, column_types={c: pa.string() for c in usecols or dtype}))
+    except pa.ArrowInvalid as e:
+        if 'UTF8' in str(e).upper():
+            raise UnicodeDecodeError(encoding, b'', 0, 1, str(e))
+        raise
+    categorias = pa.dictionary(pa.int32(), pa.string())
+    tabela = tabela.cast(pa.schema([
+        pa.field(c, categorias if dtype.get(c) == 'category' else pa.string()) for c in tabela.column_names]))
+    textos = pd.StringDtype('pyarrow')
+    return tabela.to_pandas(types_mapper=lambda tipo: textos if tipo == pa.string() else None)
+
+
+def ler_csv(fonte, dialeto, engine='c', **kwargs):
+    """
+    pd.read_csv com o encoding e o separador do `dialeto`. Os demais argumentos vão direto (dtype, chunksize...).
+    Com engine='pyarrow' (ver motor_leitura) só `usecols` e `dtype` são aceitos.
+    """
+    if hasattr(fonte, 'seek'):
+        fonte.seek(0)
+    if engine == 'pyarrow':
+        return _ler_pyarrow(fonte, dialeto, **kwargs)
+    return pd.read_csv(fonte, sep=dialeto.delimitador, encoding=dialeto.encoding, **kwargs)
+
+
+def ler_cabecalho(fonte, dialeto):
+    """Só os nomes das colunas (primeira linha), para escolher o que ler antes da leitura completa."""
+    return list(ler_csv(fonte, dialeto, nrows=0, dtype=str).columns)
+
+
+def ler_com_dialeto(fonte, ler, chave=None):
+    """
+    Detecta o dialeto de `fonte` e chama `ler(dialeto)` uma vez, que deve fazer a leitura (ex: via ler_csv).
+    Se a amostra parecia UTF-8 mas o arquivo tem bytes Latin-1 mais adiante, repete uma única vez em Latin-1
+    e corrige o cache, para a próxima leitura da mesma fonte já sair certa.
+    """
+    dialeto = detectar_dialeto(fonte, chave)
+    try:
+        return ler(dialeto)
+    except UnicodeDecodeError:
+        if dialeto.encoding == ENCODING_ALTERNATIVO:
+            raise
+    print(f"Aviso: {dialeto.encoding} falhou no meio do arquivo, relendo em {ENCODING_ALTERNATIVO}")
+    dialeto = dialeto._replace(encoding=ENCODING_ALTERNATIVO)
+    _guardar(chave if chave is not None else _chave_padrao(fonte), dialeto)
+    return ler(dialeto)
@@ -0,0 +1,99 @@
+import numpy as np
+import pandas as pd
+from decimal import Decimal, ROUND_HALF_UP
+
+# Formato comum dos arquivos da ANS: até 13 dígitos inteiros e até 2 casas decimais (ex: -1234,56).
+# Nesse intervalo a conversão via float64 multiplicada por 100 e arredondada é sempre exata.
+PADRAO_VALOR_SIMPLES = r'[-+]?\d{1,13}(?:[.,]\d{0,2})?'
+
+# Limite do Numeric(18,2) em centavos: acima disso o valor não cabe no banco (nem no int64) e é tratado como inválido
+LIMITE_CENTAVOS = 10 ** 18
+
+# Pesos dos dígitos verificadores do CNPJ
+PESOS_DV1 = np.array([5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2])
+PESOS_DV2 = np.array([6, 5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2])
+
+# Resultado da validação por CNPJ já limpo, a mesma operadora se repete milhares de vezes nos arquivos
+_cache_cnpj = {}
+
+
+def _centavos_decimal(valor):
+    """Caminho lento com Decimal, usado só para valores fora do padrão simples. Inválidos (e fora do Numeric(18,2)) viram 0."""
+    try:
+        texto = str(valor).strip()
+        # Quando há vírgula decimal os pontos são separadores de milhar (ex: 1.234,567)
+        if ',' in texto:
+            texto = texto.replace('.', '').replace(',', '.')
+        numero = Decimal(texto)
+        if not numero.is_finite():
+            return 0
+        centavos = int(numero.quantize(Decimal('0.01'), rounding=ROUND_HALF_UP) * 100)
+        # Uma célula estourada não pode derrubar a leitura do arquivo inteiro
+        return centavos if abs(centavos) < LIMITE_CENTAVOS else 0
+    except Exception:
+        return 0
+
+
+def valores_para_centavos(serie):
+    """
+    Converte valores no formato brasileiro ("1234,56", "-10,5", "1.234,56") em centavos inteiros (int64).
+    Trabalha com a coluna inteira de uma vez e mantém a exatidão do Numeric(18,2).
+    A terceira casa decimal, quando existe, é arredondada como o Postgres faz ao gravar no Numeric(18,2).
+    """
+    texto = serie.fillna('').astype(str).str.strip()
+    simples = texto.str.fullmatch(PADRAO_VALOR_SIMPLES).fillna(False).astype(bool)
+
+    numeros = texto.where(simples, '0').str.replace(',', '.', regex=False).astype('float64')
+    centavos = np.rint(numeros.to_numpy() * 100).astype('int64')
+
+    # Valores fora do padrão (separador de milhar, mais casas, notação científica) vão para o Decimal.
+    # Atribuição no array numpy: pela Series com máscara o pandas pode passar por float e perder os últimos dígitos
+    if not simples.all():
+        centavos[~simples.to_numpy()] = texto[~simples].map(_centavos_decimal).to_numpy(dtype='int64')
+
+    return pd.Series(centavos, index=serie.index)
+
+
+def centavos_para_texto(centavos):
+    """Formata centavos como texto decimal exato ("1234.56"), pronto para gravar no Numeric(18,2)."""
+    absoluto = centavos.abs()
+    sinal = pd.Series(np.where(centavos < 0, '-', ''), index=centavos.index)
+    return sinal + (absoluto // 100).astype(str) + '.' + (absoluto % 100).astype(str).str.zfill(2)
+
+
+def _validar_lote(cnpjs):
+    """Confere os dígitos verificadores de uma lista de CNPJs (só dígitos) com operações de matriz."""
+    cnpjs = np.asarray(cnpjs, dtype=object)
+    resultado = np.zeros(len(cnpjs), dtype=bool)
+
+    tamanho_ok = np.fromiter((len(c) == 14 for c in cnpjs), dtype=bool, count=len(cnpjs))
+    if not tamanho_ok.any():
+        return resultado
+
+    matriz = np.frombuffer(''.join(cnpjs[tamanho_ok]).encode('ascii'), dtype=np.uint8)
+    matriz = matriz.reshape(-1, 14).astype(np.int64) - 48
+
+    dv1 = (matriz[:, :12] @ PESOS_DV1) % 11
+    dv1 = np.where(dv1 < 2, 0, 11 - dv1)
+    dv2 = (matriz[:, :13] @ PESOS_DV2) % 11
+    dv2 = np.where(dv2 < 2, 0, 11 - dv2)
+
+    # Mesma regra do validate_docbr: sequências repetidas (ex: 00000000000000) são inválidas
+    repetidos = (matriz == matriz[:, :1]).all(axis=1)
+
+    resultado[tamanho_ok] = (dv1 == matriz[:, 12]) & (dv2 == matriz[:, 13]) & ~repetidos
+    return resultado
+
+
+def validar_cnpjs(serie):
+    """
+    Valida uma coluna de CNPJs de uma vez (Item 2.1), com o mesmo resultado do validate_docbr.
+    Cada CNPJ distinto é calculado uma única vez e fica guardado em cache para os próximos arquivos.
+    """
+    digitos = serie.fillna('').astype(str).str.replace(r'[^0-9]', '', regex=True)
+
+    novos = [c for c in pd.unique(digitos) if c not in _cache_cnpj]
+    if novos:
+        _cache_cnpj.update(zip(novos, _validar_lote(novos).tolist()))
+
+    return digitos.map(_cache_cnpj).astype(bool)
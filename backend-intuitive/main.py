@@ -1,17 +1,85 @@
+import argparse
+import io
 import os
-import requests
-import pandas as pd
-import zipfile
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from file_manager import setup_diretorio, limpar_temporarios
-from etl_process import processar_e_carregar_despesas, carregar_operadoras
-from database import criar_tabelas
+# Pool de conexões do ETL (database.config_pool), precisa vir antes de qualquer import que carregue database.py
+os.environ.setdefault('DB_PAPEL', 'etl')
+from crawler import criar_sessao, descobrir_cadastro, descobrir_trimestres, PADRAO_TRIMESTRE
+from file_manager import setup_diretorio, limpar_temporarios, pasta_saida
+from exportacao import exportar_zip
+import manifest
+from etl_process import carregar_operadoras, ler_operadoras
+from pipeline import (executar_pipeline, baixar_conteudo, reprocessar_staging, agregar_staging,
+                      MAX_DOWNLOADS, MAX_PROCESSOS)
+import staging
+from database import criar_tabelas, engine
+from agregados import atualizar_agregados
+from cache import incrementar_versao_dados
+from agregacao import AgregadorIncremental
+from checkpoint import Checkpoint, CAMINHO_CHECKPOINT
+from instrumentacao import coletor, etapa
+
+# Quantidade de linhas lidas por vez dos CSVs de despesas, mantém a memória estável em arquivos grandes
+CHUNKSIZE_DESPESAS = int(os.getenv('ETL_CHUNKSIZE', '100000'))
+
+
+def _periodo(texto):
+    """Trimestre no formato dos arquivos da ANS (3T2025) -> (2025, 3)."""
+    encontrado = PADRAO_TRIMESTRE.fullmatch(texto.strip())
+    if not encontrado:
+        raise argparse.ArgumentTypeError(f"trimestre inválido: {texto} (use o formato 3T2025)")
+    return int(encontrado.group(2)), int(encontrado.group(1))
+
+
+def ler_argumentos(argv=None):
+    parser = argparse.ArgumentParser(description="ETL das despesas das operadoras (dados abertos da ANS)")
+    parser.add_argument('--trimestres', type=int, default=3,
+                        help="quantidade de arquivos trimestrais mais recentes com despesas 411 (padrão 3)")
+    parser.add_argument('--inicio', type=_periodo, help="primeiro trimestre do intervalo, ex: 1T2020 (ignora --trimestres)")
+    parser.add_argument('--fim', type=_periodo, help="último trimestre do intervalo, ex: 3T2025 (padrão: o mais recente)")
+    parser.add_argument('--max-downloads', type=int, default=MAX_DOWNLOADS, help="downloads simultâneos")
+    parser.add_argument('--max-processos', type=int, default=MAX_PROCESSOS, help="processos de extração/transformação")
+    parser.add_argument('--checkpoint', default=CAMINHO_CHECKPOINT, help="arquivo de progresso para retomar a carga")
+    parser.add_argument('--reiniciar', action='store_true', help="ignora o checkpoint e começa do zero")
+    parser.add_argument('--reprocessar', action='store_true',
+                        help="refaz join e carga a partir do staging Parquet, sem baixar nem ler os CSVs trimestrais")
+    parser.add_argument('--metricas', default=os.getenv('ETL_METRICAS'),
+                        help="grava tempo/linhas/bytes por etapa e pico de memória (.json, ou texto do Prometheus)")
+    parser.add_argument('--perfil', default=os.getenv('ETL_PERFIL_DIR'),
+                        help="pasta para um perfil cProfile + tracemalloc de cada CSV processado")
+    args = parser.parse_args(argv)
+    if args.trimestres < 1:
+        parser.error("--trimestres precisa ser pelo menos 1")
+    if args.inicio and args.fim and args.inicio > args.fim:
+        parser.error("--inicio depois de --fim")
+    return args
+
+
+def selecionar_arquivos(arquivos_ans, args):
+    """Arquivos dentro do intervalo --inicio/--fim e quantos precisam ter dados 411 para a execução ser completa."""
+    if args.inicio is None and args.fim is None:
+        return arquivos_ans, args.trimestres
+    inicio = args.inicio or (0, 0)
+    fim = args.fim or (9999, 4)
+    selecionados = [a for a in arquivos_ans if inicio <= (a.ano, a.trimestre or 0) <= fim]
+    return selecionados, len(selecionados)
+
+
+def selecionar_periodos_staging(args):
+    """Mesma seleção de selecionar_arquivos, sobre os trimestres com linhas brutas no staging (--reprocessar)."""
+    periodos = staging.periodos_disponiveis(staging.BRUTAS)
+    if args.inicio is None and args.fim is None:
+        return periodos[:args.trimestres], args.trimestres
+    inicio = args.inicio or (0, 0)
+    fim = args.fim or (9999, 4)
+    selecionados = [(a, t) for a, t in periodos if inicio <= (int(a), int(t)) <= fim]
+    return selecionados, len(selecionados)
+
 
 if __name__ == "__main__":
+    args = ler_argumentos()
+    if args.perfil:
+        # Lido pelos workers do pool de processos (instrumentacao.perfil_arquivo)
+        os.environ['ETL_PERFIL_DIR'] = args.perfil
     criar_tabelas()
     base_path = setup_diretorio()
     data_path = os.path.join(base_path, 'data')
@@ -19,112 +87,127 @@ if __name__ == "__main__":
 
     lista_dfs_despesas = [] # Lista vazia para reservar os 3 trimestres finais
 
-    chrome_options = Options()
-    chrome_options.add_argument("--headless")  # Modo headless para uma velocidade maior da automação
-
-    driver = webdriver.Chrome(options=chrome_options) # Usa o chrome como browser do selenium
-
-    wait = WebDriverWait(driver, 15)
-    base_url = "https://dadosabertos.ans.gov.br/FTP/PDA/"
+    # Sessão HTTP única (keep-alive) para ler os índices de diretório da ANS, sem precisar de navegador
+    sessao = criar_sessao()
+    # Pode apontar para um espelho local do FTP da ANS (ex: servidor HTTP de testes)
+    base_url = os.getenv('ANS_BASE_URL', "https://dadosabertos.ans.gov.br/FTP/PDA/")
+    checkpoint = None
+    # Houve escrita no banco nesta execução (cadastro ou algum trimestre)? Sem escrita as views e o cache da API ficam
+    cadastro_gravado = False
+    gravados = []
 
     try:
         # 1. Encontrando o cadastro de operadoras primeiro para popular o join final e então adicionar os dados 
         print("Carregando Cadastro de Operadoras de planos de saude ativas...")
-        driver.get(base_url + "operadoras_de_plano_de_saude_ativas/")
-        link_cadop = wait.until(EC.presence_of_element_located((By.XPATH, "//a[contains(@href, '.csv')]"))).get_attribute("href") # Busca pela extensão do arquivo, já que os nomes são inconsistentes
+        with etapa('descoberta_arquivos'):
+            link_cadop = descobrir_cadastro(base_url, sessao) # Busca pela extensão do arquivo, já que os nomes são inconsistentes
         
-        path_cad = os.path.join(data_path, "Relatorio_cadop.csv")
-        with open(path_cad, 'wb') as f: f.write(requests.get(link_cadop).content) #type:ignore
-        df_cadastral = carregar_operadoras(path_cad)
-
-        # 2. BUSCAR OS 3 TRIMESTRES MAIS RECENTES
-        driver.get(base_url + "demonstracoes_contabeis/")
-        anos = sorted([el.get_attribute("href") for el in wait.until(EC.presence_of_all_elements_located((By.XPATH, "//a[contains(@href, '20')]")))], reverse=True) #type: ignore
-
-        trimestres_validados = 0
-        for ano_url in anos:
-            if trimestres_validados >= 3: break
-            driver.get(ano_url)
-            zips = sorted([el.get_attribute("href") for el in driver.find_elements(By.XPATH, "//a[contains(@href, '.zip')]")], reverse=True) #type: ignore
-            
-            for url_zip in zips:
-                if trimestres_validados >= 3: break
-                
-                # Download e Extração
-                nome_arquivo_zip = url_zip.split('/')[-1]
-                caminho_zip = os.path.join(data_path, nome_arquivo_zip)
-
-                with open(caminho_zip, 'wb') as f: 
-                    f.write(requests.get(url_zip).content)
-                
-                with zipfile.ZipFile(caminho_zip, 'r') as zip_ref:
-                    zip_ref.extractall(data_path)
-                os.remove(caminho_zip)
-
-                # Lê todos os zips para checar um por um se há prefixo 411 de indenizações
-                arquivos_extraidos = [f for f in os.listdir(data_path) if f.endswith('.csv') and 'Relatorio_cadop' not in f] 
-                
-                for nome_f in arquivos_extraidos:
-                    caminho_f = os.path.join(data_path, nome_f)
-
-                    # O etl_process vai dizer se o arquivo tem 411 ou não
-                    df_proc = processar_e_carregar_despesas(caminho_f, df_cadastral=df_cadastral)
-                    
-                    if df_proc is not None:
-                        lista_dfs_despesas.append(df_proc)
-                        trimestres_validados += 1
-                        print(f"Sucesso: Dados de despesas encontrados em {nome_f}")
-
-                    # Remove o CSV processado para não processar de novo
-                    if os.path.exists(caminho_f):
-                        os.remove(caminho_f)
-
-        # Se houver 3 dfs que foram validados para entrar na lista_dfs_despesas, concatena os 3 (Itens 1.3 e 2.3)
-        if len(lista_dfs_despesas) >= 3:
-            df_final = pd.concat(lista_dfs_despesas)
-            
-            # Converte para float para garantir a ordenação numérica correta
-            df_final['valor_float'] = pd.to_numeric(df_final['valor_limpo'], errors='coerce') 
-
-            # Ordena do maior para o menor valor, com isso deu para perceber que os valores eram incrementais e que estavam poluindo a base
-            df_final = df_final.sort_values(by='valor_float', ascending=False)
-            
-            # Remove duplicatas considerando CNPJ, Trimestre e Ano
-            # Como está ordenado decrescente, o keep='first' mantém o MAIOR valor de cada trimestre
-            df_final = df_final.drop_duplicates(subset=['cnpj', 'trimestre', 'ano'], keep='first')
-
-            path_csv_consolidado = os.path.join(data_path, 'consolidado_despesas.csv')
-            path_zip_consolidado = os.path.join(data_path, 'consolidado_despesas.zip')
-    
-            # CSV Consolidado (Garante precisão enviando o valor original) 
-            colunas_finais = ['cnpj', 'razao_social', 'trimestre', 'ano', 'valor_limpo']
-            df_final[colunas_finais].to_csv(path_csv_consolidado, sep=';', index=False, encoding='utf-8-sig')
-
-            with zipfile.ZipFile(path_zip_consolidado, 'w', zipfile.ZIP_DEFLATED) as zipf:
-                # O arcname garante que só o arquivo entre no zip, sem pastas
-                zipf.write(path_csv_consolidado, arcname='consolidado_despesas.csv')
-
-            os.remove(path_csv_consolidado) # deleta o arquivo consolidado_despesas.csv solto
-            
-            df_agregado = df_final.groupby(['razao_social', 'uf']).agg(
-                total_despesas=('valor_float', 'sum'),
-                media_trimestral=('valor_float', 'mean'),
-                desvio_padrao=('valor_float', 'std') 
-            ).reset_index()
-            df_agregado = df_agregado.sort_values(by='total_despesas', ascending=False) # ascending=False já que foi solicitado ordem decrescente (item 2.3)
-
-            path_csv_agregado = os.path.join(data_path, 'despesas_agregadas.csv')
-            path_zip_final = os.path.join(data_path, 'Teste_Erik.zip')
-
-            df_agregado.to_csv(os.path.join(data_path, 'despesas_agregadas.csv'), sep=';', index=False, encoding='utf-8-sig')
-           
-            with zipfile.ZipFile(path_zip_final, 'w', zipfile.ZIP_DEFLATED) as zipf:
-                zipf.write(path_csv_agregado, arcname='despesas_agregadas.csv' ) 
-
-            os.remove(path_csv_agregado) # deleta o arquivo despesas_agregadas.csv solto
+        # Se o cadastro não mudou desde a última execução, reaproveita o que já está no banco
+        registro_cad = manifest.buscar_registro(link_cadop)
+        try:
+            remoto_cad = manifest.consultar_remoto(link_cadop)
+        except Exception:
+            remoto_cad = None # Sem HEAD o cadastro é baixado de novo
+        df_cadastral = ler_operadoras() if manifest.arquivo_inalterado(registro_cad, remoto_cad) else None
+
+        if df_cadastral is None or df_cadastral.empty:
+            # O cadastro é pequeno e fica em memória, só vai para o disco se passar de ETL_LIMITE_MEMORIA_MB
+            conteudo_cad = baixar_conteudo(link_cadop, data_path)
+            with etapa('carga_cadastro') as medicao:
+                df_cadastral = carregar_operadoras(io.BytesIO(conteudo_cad) if isinstance(conteudo_cad, bytes) else conteudo_cad)
+                medicao.linhas = len(df_cadastral) if df_cadastral is not None else 0
+            if df_cadastral is not None:
+                cadastro_gravado = True
+                manifest.registrar(link_cadop, remoto_cad, manifest.calcular_hash(conteudo_cad), len(df_cadastral))
+        else:
+            print("Cadastro de operadoras sem alterações, usando a base já carregada.")
+
+        agregador = AgregadorIncremental()
+        if args.reprocessar:
+            # Só o cadastro muda: join e carga refeitos a partir das linhas brutas do staging, sem a ANS
+            if not staging.DISPONIVEL:
+                raise SystemExit("--reprocessar precisa do pyarrow (staging Parquet)")
+            periodos, limite = selecionar_periodos_staging(args)
+            print(f"Reprocessando {len(periodos)} trimestres a partir do staging")
+            with etapa('reprocessamento_staging'):
+                carregados = reprocessar_staging(df_cadastral, periodos)
+            gravados.extend(carregados)
+            # Os CSVs finais vêm do staging, só as colunas do agregador e as partições reprocessadas
+            lista_dfs_despesas = agregar_staging(carregados, agregador)
+        else:
+            # 2. BUSCAR OS TRIMESTRES (3 mais recentes por padrão, ou o intervalo/quantidade pedido na linha de comando)
+            # Todos os ZIPs trimestrais, do mais recente para o mais antigo (anos listados em paralelo)
+            with etapa('descoberta_arquivos'):
+                arquivos_ans = descobrir_trimestres(base_url, sessao)
+            print(f"{len(arquivos_ans)} arquivos trimestrais encontrados no diretório da ANS")
+            arquivos_ans, limite = selecionar_arquivos(arquivos_ans, args)
+
+            # Progresso salvo a cada trimestre gravado, uma execução interrompida retoma de onde parou
+            checkpoint = Checkpoint(args.checkpoint, retomar=not args.reiniciar, parametros={
+                "base_url": base_url,
+                "trimestres": limite,
+                "inicio": args.inicio and list(args.inicio),
+                "fim": args.fim and list(args.fim),
+            })
+
+            # Download, extração/leitura e carga rodam sobrepostos, o pipeline para ao encontrar `limite` arquivos com prefixo 411
+            # Cada trimestre carregado vai direto para o agregador e é descartado, só o consolidado fica em memória
+            lista_dfs_despesas = executar_pipeline((a.url for a in arquivos_ans), df_cadastral, data_path, limite=limite,
+                                                   chunksize=CHUNKSIZE_DESPESAS, ao_carregar=agregador.adicionar,
+                                                   max_downloads=args.max_downloads, max_processos=args.max_processos,
+                                                   checkpoint=checkpoint,
+                                                   ao_gravar=lambda url, linhas: gravados.append(url))
+
+        if cadastro_gravado or gravados:
+            # Resumos usados pelo /api/estatisticas passam a refletir a carga nova
+            with etapa('views_agregadas'):
+                atualizar_agregados(engine)
+            # Nova versão dos dados invalida o cache da API
+            incrementar_versao_dados()
+        else:
+            print("Nenhum dado novo carregado, views agregadas e cache da API mantidos.")
+
+        # Se todos os trimestres pedidos foram validados para entrar na lista_dfs_despesas, gera os arquivos finais (Itens 1.3 e 2.3)
+        # No modo intervalo vale o que existir dentro dele (alguns trimestres podem não ter 411)
+        minimo = limite if args.inicio is None and args.fim is None else 1
+        if lista_dfs_despesas and len(lista_dfs_despesas) >= minimo:
+            # Os CSVs são escritos direto dentro dos ZIPs, já na pasta final (exportacao.py)
+            pasta_final = pasta_saida()
+            with etapa('exportacao_csv') as medicao:
+                # Maior valor de cada CNPJ/Trimestre/Ano, já ordenado do maior para o menor
+                # (os valores dos arquivos são incrementais, o maior é o mais atual)
+                df_final = agregador.consolidado()
+
+                # CSV Consolidado (Garante precisão enviando o valor original)
+                colunas_finais = ['cnpj', 'razao_social', 'trimestre', 'ano', 'valor_limpo']
+                medicao.linhas, tamanho = exportar_zip(os.path.join(pasta_final, 'consolidado_despesas.zip'),
+                                                       [('consolidado_despesas.csv', df_final[colunas_finais])])
+                medicao.bytes += tamanho
+
+                # Total, média e desvio padrão por operadora/UF, calculados de forma incremental, em ordem decrescente (item 2.3)
+                df_agregado = agregador.agregado()
+                _, tamanho = exportar_zip(os.path.join(pasta_final, 'Teste_Erik.zip'),
+                                          [('despesas_agregadas.csv', df_agregado)])
+                medicao.bytes += tamanho
+
             limpar_temporarios(base_path)
 
             print("CSVs gerados e banco populado")
 
+        if checkpoint is not None:
+            checkpoint.finalizar()
+
+    except Exception:
+        # Sem views, versão nova nem CSVs de uma carga incompleta. O checkpoint fica para a próxima execução
+        if checkpoint is not None and checkpoint.concluidos:
+            print(f"Execução interrompida. {len(checkpoint.concluidos)} arquivos concluídos ficam em "
+                  f"{checkpoint.caminho}, rode de novo para retomar.")
+        raise
     finally:
-        driver.quit()
\ No newline at end of file
+        sessao.close()
+        # Tempo por etapa (downloads, leitura, filtro, join, validação, carga...) somando os workers
+        coletor.anotar_memoria()
+        coletor.imprimir()
+        if args.metricas:
+            coletor.salvar(args.metricas)
+            print(f"Métricas do ETL gravadas em {args.metricas}")
\ No newline at end of file
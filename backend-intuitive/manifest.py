@@ -0,0 +1,77 @@
+import hashlib
+from datetime import datetime
+import requests
+from sqlalchemy import text
+from database import engine
+
+TIMEOUT_HEAD = 30
+
+
+def consultar_remoto(url):
+    """Metadados do arquivo no servidor da ANS (HEAD), sem baixar o conteúdo."""
+    resposta = requests.head(url, allow_redirects=True, timeout=TIMEOUT_HEAD)
+    resposta.raise_for_status()
+    tamanho = resposta.headers.get('Content-Length')
+    return {
+        "tamanho": int(tamanho) if tamanho else None,
+        "last_modified": resposta.headers.get('Last-Modified'),
+        "etag": resposta.headers.get('ETag'),
+    }
+
+
+def calcular_hash(conteudo):
+    """sha256 do arquivo baixado, `conteudo` são bytes ou o caminho local."""
+    if isinstance(conteudo, (bytes, bytearray)):
+        return hashlib.sha256(conteudo).hexdigest()
+    sha = hashlib.sha256()
+    with open(conteudo, 'rb') as f:
+        for bloco in iter(lambda: f.read(1024 * 1024), b''):
+            sha.update(bloco)
+    return sha.hexdigest()
+
+
+def buscar_registro(url):
+    """Última execução registrada para a URL ou None."""
+    with engine.connect() as conn:
+        row = conn.execute(text("SELECT * FROM arquivos_processados WHERE url = :url"), {"url": url}).mappings().fetchone()
+    return dict(row) if row else None
+
+
+def arquivo_inalterado(registro, remoto):
+    """
+    Compara o que está no manifesto com o HEAD atual.
+    ETag tem prioridade, sem ele vale Last-Modified + tamanho. Sem nenhum dos dois o arquivo é tratado como alterado.
+    """
+    if registro is None or remoto is None:
+        return False
+    if remoto.get('etag') and registro.get('etag'):
+        return remoto['etag'] == registro['etag']
+    if remoto.get('last_modified') and registro.get('last_modified'):
+        return (remoto['last_modified'] == registro['last_modified']
+                and remoto.get('tamanho') == registro.get('tamanho'))
+    return False
+
+
+def registrar(url, remoto, hash_conteudo, linhas, ano=None, trimestre=None):
+    """Grava (ou atualiza) a URL no manifesto depois de uma carga concluída."""
+    remoto = remoto or {}
+    sql = text("""
+        INSERT INTO arquivos_processados (url, tamanho, last_modified, etag, hash_conteudo, linhas, ano, trimestre, processado_em)
+        VALUES (:url, :tamanho, :last_modified, :etag, :hash_conteudo, :linhas, :ano, :trimestre, :processado_em)
+        ON CONFLICT (url) DO UPDATE SET
+            tamanho = EXCLUDED.tamanho, last_modified = EXCLUDED.last_modified, etag = EXCLUDED.etag,
+            hash_conteudo = EXCLUDED.hash_conteudo, linhas = EXCLUDED.linhas, ano = EXCLUDED.ano,
+            trimestre = EXCLUDED.trimestre, processado_em = EXCLUDED.processado_em
+    """)
+    with engine.begin() as conn:
+        conn.execute(sql, {
+            "url": url,
+            "tamanho": remoto.get('tamanho'),
+            "last_modified": remoto.get('last_modified'),
+            "etag": remoto.get('etag'),
+            "hash_conteudo": hash_conteudo,
+            "linhas": linhas,
+            "ano": int(ano) if ano is not None else None,
+            "trimestre": int(trimestre) if trimestre is not None else None,
+            "processado_em": datetime.now(),
+        })
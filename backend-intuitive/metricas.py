@@ -0,0 +1,184 @@
+import bisect
+import threading
+import time
+from sqlalchemy import event
+from sqlalchemy.pool import QueuePool
+
+# Limites (segundos) dos histogramas, no formato de buckets do Prometheus
+BUCKETS_ESPERA_POOL = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+BUCKETS_CONSULTA = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histograma:
+    """Contagem acumulada por bucket, soma e quantidade de observações, seguro entre threads."""
+
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self._contagens = [0] * (len(self.buckets) + 1)  # último = +Inf
+        self.soma = 0.0
+        self.quantidade = 0
+        self._lock = threading.Lock()
+
+    def observar(self, valor):
+        with self._lock:
+            self._contagens[bisect.bisect_left(self.buckets, valor)] += 1
+            self.soma += valor
+            self.quantidade += 1
+
+    def acumulado(self):
+        """[(limite, observações <= limite)], terminando em ('+Inf', total)."""
+        with self._lock:
+            contagens = list(self._contagens)
+        total, linhas = 0, []
+        for limite, contagem in zip(self.buckets + ('+Inf',), contagens):
+            total += contagem
+            linhas.append((limite, total))
+        return linhas
+
+
+class _Registro:
+    """Histogramas por (métrica, rótulo) e as engines cujos pools são acompanhados."""
+
+    def __init__(self):
+        self.histogramas = {}
+        self.contadores = {}
+        self.engines = {}
+        self._lock = threading.Lock()
+
+    def histograma(self, metrica, rotulo, buckets):
+        with self._lock:
+            chave = (metrica, rotulo)
+            if chave not in self.histogramas:
+                self.histogramas[chave] = Histograma(buckets)
+            return self.histogramas[chave]
+
+    def incrementar(self, metrica, rotulo):
+        with self._lock:
+            self.contadores[(metrica, rotulo)] = self.contadores.get((metrica, rotulo), 0) + 1
+
+
+registro = _Registro()
+
+
+class _EsperaCheckout:
+    """Mede quanto tempo cada pedido de conexão esperou o pool (fila cheia = pool subdimensionado)."""
+    nome_pool = 'padrao'
+
+    def _do_get(self):
+        inicio = time.perf_counter()
+        try:
+            return super()._do_get()
+        except Exception:
+            registro.incrementar('db_pool_checkout_falhas_total', self.nome_pool)
+            raise
+        finally:
+            registro.histograma('db_pool_checkout_espera_segundos', self.nome_pool,
+                                BUCKETS_ESPERA_POOL).observar(time.perf_counter() - inicio)
+
+
+def classe_pool(nome, base=QueuePool):
+    """Subclasse de `base` que registra a espera por conexão com o rótulo `nome` (sobrevive ao engine.dispose())."""
+    return type(f"{base.__name__}Instrumentado", (_EsperaCheckout, base), {'nome_pool': nome})
+
+
+def instrumentar_engine(engine, nome):
+    """Latência por consulta (histograma por rótulo) e estado do pool da engine, exposto em /api/metrics."""
+    alvo = getattr(engine, 'sync_engine', engine)  # AsyncEngine -> eventos ficam na engine síncrona interna
+    registro.engines[nome] = alvo
+
+    @event.listens_for(alvo, 'before_cursor_execute')
+    def _inicio(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('inicio_consulta', []).append(time.perf_counter())
+
+    @event.listens_for(alvo, 'after_cursor_execute')
+    def _fim(conn, cursor, statement, parameters, context, executemany):
+        inicio = conn.info['inicio_consulta'].pop()
+        registro.histograma('db_consulta_segundos', (nome, rotulo_consulta(statement, context)),
+                            BUCKETS_CONSULTA).observar(time.perf_counter() - inicio)
+
+    @event.listens_for(alvo, 'handle_error')
+    def _erro(contexto):
+        pilha = contexto.connection.info.get('inicio_consulta') if contexto.connection is not None else None
+        if pilha:
+            pilha.pop()
+
+    return engine
+
+
+def rotulo_consulta(statement, context):
+    """Nome dado à consulta com .execution_options(consulta=...), senão o comando SQL (select, insert...)."""
+    rotulo = context.execution_options.get('consulta') if context is not None else None
+    if rotulo:
+        return rotulo
+    partes = statement.split(None, 1)
+    return partes[0].lower() if partes else 'vazio'
+
+
+def estado_pools():
+    """Conexões em uso, livres e excedentes de cada pool registrado."""
+    estados = {}
+    for nome, engine in registro.engines.items():
+        pool = engine.pool
+        if not hasattr(pool, 'checkedout'):
+            continue
+        estados[nome] = {
+            "tamanho": pool.size(),
+            "em_uso": pool.checkedout(),
+            "livres": pool.checkedin(),
+            "excedentes": max(pool.overflow(), 0),
+            "max_excedentes": getattr(pool, '_max_overflow', 0),
+        }
+    return estados
+
+
+def metricas_json():
+    histogramas = {}
+    for (metrica, rotulo), histograma in list(registro.histogramas.items()):
+        rotulo = '/'.join(rotulo) if isinstance(rotulo, tuple) else rotulo
+        histogramas.setdefault(metrica, {})[rotulo] = {
+            "quantidade": histograma.quantidade,
+            "soma_segundos": round(histograma.soma, 6),
+            "buckets": {str(limite): total for limite, total in histograma.acumulado()},
+        }
+    contadores = {}
+    for (metrica, rotulo), valor in list(registro.contadores.items()):
+        contadores.setdefault(metrica, {})[rotulo] = valor
+    return {"pools": estado_pools(), "histogramas": histogramas, "contadores": contadores}
+
+
+def _rotulos(rotulo):
+    if isinstance(rotulo, tuple):
+        pool, consulta = rotulo
+        return f'pool="{pool}",consulta="{consulta}"'
+    return f'pool="{rotulo}"'
+
+
+def metricas_prometheus():
+    """Texto no formato de exposição do Prometheus."""
+    linhas = []
+    for metrica, chave in (("db_pool_tamanho", "tamanho"), ("db_pool_em_uso", "em_uso"),
+                           ("db_pool_livres", "livres"), ("db_pool_excedentes", "excedentes")):
+        linhas.append(f"# TYPE {metrica} gauge")
+        for nome, estado in estado_pools().items():
+            linhas.append(f'{metrica}{{pool="{nome}"}} {estado[chave]}')
+
+    por_metrica = {}
+    for (metrica, rotulo), histograma in list(registro.histogramas.items()):
+        por_metrica.setdefault(metrica, []).append((rotulo, histograma))
+    for metrica, itens in sorted(por_metrica.items()):
+        linhas.append(f"# TYPE {metrica} histogram")
+        for rotulo, histograma in itens:
+            rotulos = _rotulos(rotulo)
+            for limite, total in histograma.acumulado():
+                linhas.append(f'{metrica}_bucket{{{rotulos},le="{limite}"}} {total}')
+            linhas.append(f"{metrica}_sum{{{rotulos}}} {histograma.soma:.6f}")
+            linhas.append(f"{metrica}_count{{{rotulos}}} {histograma.quantidade}")
+
+    contadores = {}
+    for (metrica, rotulo), valor in list(registro.contadores.items()):
+        contadores.setdefault(metrica, []).append((rotulo, valor))
+    for metrica, itens in sorted(contadores.items()):
+        linhas.append(f"# TYPE {metrica} counter")
+        for rotulo, valor in itens:
+            linhas.append(f"{metrica}{{{_rotulos(rotulo)}}} {valor}")
+    return "\n".join(linhas) + "\n"
@@ -0,0 +1,233 @@
+from sqlalchemy import text
+
+# Mudanças de schema do Postgres aplicadas em ordem, uma única vez por banco, depois do create_all.
+# Cada migração roda na sua transação e fica registrada em migracoes_schema. Todas são idempotentes,
+# então bancos que já tinham os ajustes antigos (feitos direto no criar_tabelas) passam por elas sem erro.
+
+TABELA_DESPESAS = 'despesas_consolidadas'
+PARTICAO_PADRAO = f'{TABELA_DESPESAS}_padrao'
+# Colunas gravadas (sem as geradas pelo banco, como periodo)
+COLUNAS_DESPESAS = "id, reg_ans, cd_conta_contabil, vl_saldo_final, ano, trimestre"
+
+
+def _chave_natural_despesas(conn):
+    """Bancos criados antes da chave natural: remove as duplicatas (fica a carga mais recente) e cria o índice único."""
+    existe = conn.execute(text(
+        "SELECT 1 FROM pg_indexes WHERE indexname = 'uq_despesas_chave_natural'")).scalar()
+    if existe:
+        return
+    conn.execute(text(f"""
+        DELETE FROM {TABELA_DESPESAS} WHERE id IN (
+            SELECT id FROM (
+                SELECT id, ROW_NUMBER() OVER (
+                    PARTITION BY reg_ans, cd_conta_contabil, ano, trimestre ORDER BY id DESC) AS ordem
+                FROM {TABELA_DESPESAS}
+            ) duplicadas
+            WHERE ordem > 1
+        )
+    """))
+    conn.execute(text(
+        f"CREATE UNIQUE INDEX uq_despesas_chave_natural ON {TABELA_DESPESAS} (reg_ans, cd_conta_contabil, ano, trimestre)"))
+
+
+def _busca_operadoras(conn):
+    # CNPJ só com dígitos, a busca funciona digitando com ou sem máscara
+    conn.execute(text("""
+        ALTER TABLE operadoras_ativas ADD COLUMN IF NOT EXISTS cnpj_digitos VARCHAR
+        GENERATED ALWAYS AS (regexp_replace(cnpj, '[^0-9]', '', 'g')) STORED
+    """))
+    # Ordem da paginação por cursor (keyset)
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_operadoras_razao_registro ON operadoras_ativas (razao_social, registro_ans)"))
+
+
+def _indices_trigrama(conn):
+    """
+    Busca por trecho do nome/CNPJ (ILIKE '%x%') usando índice de trigramas em vez de varrer a tabela.
+    pg_trgm é do contrib e nem toda instalação tem: sem ela a migração fica pendente e é tentada de novo na próxima execução.
+    """
+    disponivel = conn.execute(text("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")).scalar()
+    if not disponivel:
+        print("Aviso: pg_trgm indisponível, busca de operadoras sem índice de trigramas.")
+        return False
+    try:
+        with conn.begin_nested():
+            conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+    except Exception as e:
+        # Ex: usuário do banco sem permissão para criar extensões
+        print(f"Aviso: não foi possível habilitar pg_trgm: {getattr(e, 'orig', e)}")
+        return False
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_operadoras_razao_trgm ON operadoras_ativas USING gin (razao_social gin_trgm_ops)"))
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_operadoras_cnpj_digitos_trgm ON operadoras_ativas USING gin (cnpj_digitos gin_trgm_ops)"))
+
+
+def _indices_consultas(conn):
+    """Índices das consultas do repositório e do ETL sobre despesas e operadoras."""
+    comandos = [
+        # Histórico de uma operadora (join por reg_ans, ordenado por período): o índice cobre a consulta inteira
+        f"""CREATE INDEX IF NOT EXISTS ix_despesas_reg_ans_periodo ON {TABELA_DESPESAS}
+            (reg_ans, ano DESC, trimestre DESC) INCLUDE (vl_saldo_final, cd_conta_contabil)""",
+        # Filtro/agrupamento por período (leitura de um trimestre e limpeza do escopo no upsert do ETL)
+        f"CREATE INDEX IF NOT EXISTS ix_despesas_periodo ON {TABELA_DESPESAS} (ano, trimestre)",
+        # Filtro por conta contábil (ex: prefixo 411)
+        f"CREATE INDEX IF NOT EXISTS ix_despesas_conta ON {TABELA_DESPESAS} (cd_conta_contabil varchar_pattern_ops)",
+        # Detalhes e histórico da API são buscados pelo CNPJ
+        "CREATE INDEX IF NOT EXISTS ix_operadoras_cnpj ON operadoras_ativas (cnpj)",
+    ]
+    for comando in comandos:
+        conn.execute(text(comando))
+
+
+def _criar_particao_ano(conn, ano):
+    """
+    Partição de um ano. Linhas desse ano que tenham caído na partição padrão são movidas para ela antes do ATTACH.
+    """
+    nome = f"{TABELA_DESPESAS}_{int(ano)}"
+    conn.execute(text(f"CREATE TABLE {nome} (LIKE {TABELA_DESPESAS} INCLUDING DEFAULTS INCLUDING GENERATED)"))
+    conn.execute(text(f"""
+        WITH movidas AS (DELETE FROM {PARTICAO_PADRAO} WHERE ano = :ano RETURNING *)
+        INSERT INTO {nome} ({COLUNAS_DESPESAS}) SELECT {COLUNAS_DESPESAS} FROM movidas
+    """), {"ano": int(ano)})
+    conn.execute(text(
+        f"ALTER TABLE {TABELA_DESPESAS} ATTACH PARTITION {nome} FOR VALUES FROM ({int(ano)}) TO ({int(ano) + 1})"))
+
+
+def _particionar_despesas(conn):
+    """
+    Converte despesas_consolidadas em tabela particionada por faixa de ano (uma partição por ano + padrão).
+    Consultas de um período leem só a partição do ano. As views materializadas dependem da tabela, então são
+    removidas aqui e recriadas pelo criar_agregados logo depois das migrações.
+    """
+    particionada = conn.execute(text(
+        "SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid WHERE c.relname = :tabela"),
+        {"tabela": TABELA_DESPESAS}).scalar()
+    if particionada:
+        return
+
+    conn.execute(text("DROP MATERIALIZED VIEW IF EXISTS mv_despesas_uf"))
+    conn.execute(text("DROP MATERIALIZED VIEW IF EXISTS mv_despesas_operadora_trimestre"))
+
+    antiga = f"{TABELA_DESPESAS}_antiga"
+    conn.execute(text(f"ALTER TABLE {TABELA_DESPESAS} RENAME TO {antiga}"))
+    conn.execute(text(f"ALTER INDEX {TABELA_DESPESAS}_pkey RENAME TO {antiga}_pkey"))
+    # A sequência do id passa para a tabela nova, os ids existentes continuam valendo
+    conn.execute(text(f"ALTER SEQUENCE {TABELA_DESPESAS}_id_seq OWNED BY NONE"))
+    # Em tabela particionada a chave primária e os índices únicos precisam conter a coluna de partição (ano)
+    conn.execute(text(f"""
+        CREATE TABLE {TABELA_DESPESAS} (
+            id INTEGER NOT NULL DEFAULT nextval('{TABELA_DESPESAS}_id_seq'),
+            reg_ans VARCHAR,
+            cd_conta_contabil VARCHAR,
+            vl_saldo_final NUMERIC(18, 2),
+            ano INTEGER NOT NULL,
+            trimestre INTEGER,
+            PRIMARY KEY (id, ano)
+        ) PARTITION BY RANGE (ano)
+    """))
+    conn.execute(text(f"ALTER SEQUENCE {TABELA_DESPESAS}_id_seq OWNED BY {TABELA_DESPESAS}.id"))
+    conn.execute(text(f"CREATE TABLE {PARTICAO_PADRAO} PARTITION OF {TABELA_DESPESAS} DEFAULT"))
+
+    for ano in conn.execute(text(f"SELECT DISTINCT ano FROM {antiga} WHERE ano IS NOT NULL")).scalars():
+        conn.execute(text(
+            f"CREATE TABLE {TABELA_DESPESAS}_{int(ano)} PARTITION OF {TABELA_DESPESAS} "
+            f"FOR VALUES FROM ({int(ano)}) TO ({int(ano) + 1})"))
+
+    conn.execute(text(f"INSERT INTO {TABELA_DESPESAS} ({COLUNAS_DESPESAS}) "
+                      f"SELECT {COLUNAS_DESPESAS} FROM {antiga} WHERE ano IS NOT NULL"))
+    conn.execute(text(f"DROP TABLE {antiga}"))
+
+    # Índices criados na tabela-mãe valem para todas as partições, inclusive as futuras
+    conn.execute(text(
+        f"CREATE UNIQUE INDEX uq_despesas_chave_natural ON {TABELA_DESPESAS} (reg_ans, cd_conta_contabil, ano, trimestre)"))
+    _indices_consultas(conn)
+
+
+def _coluna_periodo(conn):
+    """
+    Período como coluna calculada e gravada pelo banco (ano * 10 + trimestre, ex: 20253), com índice.
+    As consultas filtram e ordenam por ela em vez de recalcular a expressão linha a linha.
+    A view mv_despesas_operadora_trimestre passa a expor o período, então as views são recriadas pelo criar_agregados.
+    """
+    conn.execute(text("DROP MATERIALIZED VIEW IF EXISTS mv_despesas_uf"))
+    conn.execute(text("DROP MATERIALIZED VIEW IF EXISTS mv_despesas_operadora_trimestre"))
+    conn.execute(text(f"""
+        ALTER TABLE {TABELA_DESPESAS} ADD COLUMN IF NOT EXISTS periodo INTEGER
+        GENERATED ALWAYS AS (ano * 10 + trimestre) STORED
+    """))
+    conn.execute(text(f"CREATE INDEX IF NOT EXISTS ix_despesas_periodo_calculado ON {TABELA_DESPESAS} (periodo, reg_ans)"))
+
+
+def _ordem_operadoras(conn):
+    """
+    A listagem ordena por COALESCE(razao_social, ''), registro_ans (operadoras sem razão social também aparecem
+    nas páginas por cursor). Índice na mesma expressão para a paginação continuar sem ordenar a tabela.
+    """
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_operadoras_ordem_listagem "
+        "ON operadoras_ativas ((COALESCE(razao_social, '')), registro_ans)"))
+    conn.execute(text("DROP INDEX IF EXISTS ix_operadoras_razao_registro"))
+
+
+# (versão, descrição, função). Uma função que retorna False não é registrada e roda de novo na próxima vez.
+MIGRACOES = [
+    (1, 'chave natural de despesas_consolidadas', _chave_natural_despesas),
+    (2, 'cnpj_digitos e índice da paginação de operadoras', _busca_operadoras),
+    (3, 'índices de trigrama da busca de operadoras', _indices_trigrama),
+    (4, 'índices de período, conta, histórico e cnpj', _indices_consultas),
+    (5, 'particionamento de despesas_consolidadas por ano', _particionar_despesas),
+    (6, 'coluna calculada periodo em despesas_consolidadas', _coluna_periodo),
+    (7, 'índice da ordem da listagem de operadoras com razão social ausente', _ordem_operadoras),
+]
+
+
+def aplicar_migracoes(engine):
+    """Aplica as migrações pendentes em ordem. Retorna as versões aplicadas nesta execução."""
+    with engine.begin() as conn:
+        conn.execute(text("""
+            CREATE TABLE IF NOT EXISTS migracoes_schema (
+                versao INTEGER PRIMARY KEY,
+                descricao VARCHAR NOT NULL,
+                aplicada_em TIMESTAMPTZ NOT NULL DEFAULT CURRENT_TIMESTAMP
+            )
+        """))
+        aplicadas = set(conn.execute(text("SELECT versao FROM migracoes_schema")).scalars())
+
+    novas = []
+    for versao, descricao, migracao in MIGRACOES:
+        if versao in aplicadas:
+            continue
+        with engine.begin() as conn:
+            # Migrações reescrevem tabelas inteiras, o statement_timeout da API (database.config_pool) não vale aqui
+            conn.execute(text("SET LOCAL statement_timeout = 0"))
+            # Evita duas instâncias (API e ETL subindo juntos) aplicando a mesma migração
+            conn.execute(text("SELECT pg_advisory_xact_lock(20250101)"))
+            if conn.execute(text("SELECT 1 FROM migracoes_schema WHERE versao = :v"), {"v": versao}).scalar():
+                continue
+            if migracao(conn) is False:
+                continue
+            conn.execute(text("INSERT INTO migracoes_schema (versao, descricao) VALUES (:v, :d)"),
+                         {"v": versao, "d": descricao})
+        print(f"Migração {versao:03d} aplicada: {descricao}")
+        novas.append(versao)
+    return novas
+
+
+def garantir_particoes_despesas(engine, anos):
+    """Cria as partições dos anos que vão ser carregados, antes da carga (o ETL chama a cada arquivo)."""
+    if engine.dialect.name != 'postgresql':
+        return
+    anos = {int(a) for a in anos}
+    with engine.begin() as conn:
+        particionada = conn.execute(text(
+            "SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid WHERE c.relname = :tabela"),
+            {"tabela": TABELA_DESPESAS}).scalar()
+        if not particionada:
+            return
+        existentes = set(conn.execute(text(
+            "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+            "JOIN pg_class p ON p.oid = i.inhparent WHERE p.relname = :tabela"), {"tabela": TABELA_DESPESAS}).scalars())
+        for ano in sorted(anos):
+            if f"{TABELA_DESPESAS}_{ano}" not in existentes:
+                _criar_particao_ano(conn, ano)
@@ -0,0 +1,396 @@
+import io
+import os
+import queue
+import shutil
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+import pandas as pd
+import manifest
+import staging
+from etl_process import ler_despesas_brutas, cruzar_cadastro, carregar_despesas, ler_despesas_trimestre
+from file_manager import ler_csvs_zip
+from limpeza import centavos_para_texto
+from instrumentacao import coletor, etapa, perfil_arquivo
+from indice_operadoras import IndiceOperadoras, obter_indice
+from crawler import criar_sessao
+from downloader import Downloader, CACHE_ATIVO, TAMANHO_BLOCO, TIMEOUT_DOWNLOAD
+from agregacao import COLUNAS as COLUNAS_AGREGADOR
+
+# Downloads são I/O de rede (threads), extração e pandas são CPU (processos)
+MAX_DOWNLOADS = int(os.getenv('ETL_MAX_DOWNLOADS', '4'))
+MAX_PROCESSOS = int(os.getenv('ETL_MAX_PROCESSOS', str(min(4, os.cpu_count() or 1))))
+# Tamanho máximo de um ZIP mantido em memória, acima disso o download vai para o disco
+LIMITE_MEMORIA = int(os.getenv('ETL_LIMITE_MEMORIA_MB', '256')) * 1024 * 1024
+
+# Índice do cadastro de operadoras de cada processo worker, aberto uma única vez pelo initializer do pool.
+# Os workers recebem só a pasta dos arrays e leem todos a mesma cópia (mmap), sem um DataFrame por processo
+_indice_operadoras = None
+_downloader = None
+_sessao = None
+_lock_downloader = threading.Lock()
+
+
+def _iniciar_worker(pasta_indice):
+    global _indice_operadoras
+    _indice_operadoras = IndiceOperadoras.abrir(pasta_indice) if pasta_indice else None
+
+
+def obter_downloader():
+    """
+    Downloader (sessão HTTP + cache em disco) e sessão compartilhados pelas threads de download do processo.
+    Com o cache desligado (ETL_CACHE_DIR vazio ou '0') ou sem como criar a pasta do cache, o Downloader é None
+    e os downloads usam só a sessão. Retorna (downloader, sessao).
+    """
+    global _downloader, _sessao
+    with _lock_downloader:
+        if _sessao is None:
+            _sessao = criar_sessao(max(MAX_DOWNLOADS, 1))
+            if CACHE_ATIVO:
+                try:
+                    _downloader = Downloader(sessao=_sessao)
+                except OSError as e:
+                    print(f"Aviso: cache de downloads indisponível ({e}), os arquivos serão baixados sem cache")
+        return _downloader, _sessao
+
+
+def _baixar_sem_cache(url, data_path, limite_memoria, sessao):
+    """
+    Download sem o cache em disco: o conteúdo fica em memória enquanto couber em `limite_memoria` bytes.
+    Acima disso o que já chegou é despejado em `data_path` e o restante segue direto para o disco.
+    Sem 304 nem retomada por Range, uma conexão que cair baixa o arquivo de novo na próxima execução.
+    """
+    buffer = io.BytesIO()
+    arquivo = None
+    caminho = os.path.join(data_path, url.split('/')[-1])
+    try:
+        with etapa('download') as medicao, sessao.get(url, stream=True, timeout=TIMEOUT_DOWNLOAD) as resposta:
+            resposta.raise_for_status()
+            for bloco in resposta.iter_content(chunk_size=TAMANHO_BLOCO):
+                if arquivo is None and buffer.tell() + len(bloco) > limite_memoria:
+                    arquivo = open(caminho, 'wb')
+                    arquivo.write(buffer.getvalue())
+                    buffer = None
+                (arquivo or buffer).write(bloco)
+                medicao.bytes += len(bloco)
+    finally:
+        if arquivo is not None:
+            arquivo.close()
+
+    return caminho if arquivo is not None else buffer.getvalue()
+
+
+def baixar_conteudo(url, data_path, limite_memoria=LIMITE_MEMORIA):
+    """
+    Baixa o arquivo em blocos para o cache de downloads (downloader.py), ou só revalida se ele já estiver lá.
+    Arquivos de até `limite_memoria` bytes voltam em memória. Acima disso o retorno é um caminho em `data_path`
+    (link para o arquivo do cache, sem copiar), que quem processa pode apagar.
+    Com o cache desligado os arquivos pequenos não tocam o disco (_baixar_sem_cache).
+    Retorna os bytes do arquivo ou, se passou do limite, o caminho local.
+    """
+    downloader, sessao = obter_downloader()
+    if downloader is None:
+        return _baixar_sem_cache(url, data_path, limite_memoria, sessao)
+    with etapa('download') as medicao:
+        download = downloader.baixar(url, medicao)
+    if download.do_cache:
+        print(f"{url.split('/')[-1]} sem alterações no servidor (304), usando o cache de downloads")
+
+    # O arquivo do cache fica reservado até ser lido/linkado, outra thread limpando o cache não o apaga
+    try:
+        if download.tamanho <= limite_memoria:
+            with open(download.caminho, 'rb') as f:
+                return f.read()
+
+        caminho = os.path.join(data_path, url.split('/')[-1])
+        if os.path.exists(caminho):
+            os.remove(caminho)
+        try:
+            os.link(download.caminho, caminho)
+        except OSError:
+            shutil.copyfile(download.caminho, caminho)  # Cache em outro sistema de arquivos
+        return caminho
+    finally:
+        downloader.liberar(download)
+
+
+def _gravar_staging(df, conjunto, nome_f):
+    # O staging é um atalho para reprocessar/exportar, falha nele não interrompe a carga
+    try:
+        with etapa('staging_parquet', linhas=len(df)):
+            staging.gravar(df, conjunto, nome_f)
+    except Exception as e:
+        print(f"Aviso: não foi possível gravar {nome_f} no staging ({conjunto}): {e}")
+
+
+def processar_zip(origem, chunksize=None):
+    """
+    Roda no pool de processos: lê os CSVs direto de dentro do ZIP e transforma cada um, sem tocar no banco.
+    `origem` são os bytes do ZIP ou o caminho do arquivo (quando o download passou do limite de memória).
+    As linhas 411 lidas do texto ficam no staging Parquet antes do join com o cadastro.
+    Retorna uma lista de (nome_csv, DataFrame ou None) na ordem dos arquivos.
+    """
+    resultados = []
+    try:
+        for nome_f, arquivo_csv in ler_csvs_zip(origem):
+            # Com ETL_PERFIL_DIR cada CSV ganha um perfil cProfile/tracemalloc próprio
+            with perfil_arquivo(nome_f):
+                df_brutas = ler_despesas_brutas(arquivo_csv, chunksize=chunksize, nome_arquivo=nome_f)
+                df_proc = None
+                if df_brutas is not None:
+                    _gravar_staging(df_brutas, staging.BRUTAS, nome_f)
+                    df_proc = cruzar_cadastro(df_brutas, _indice_operadoras, nome_f)
+            resultados.append((nome_f, df_proc))
+    finally:
+        if isinstance(origem, str) and os.path.exists(origem):
+            os.remove(origem)
+    return resultados
+
+
+def _processar_zip_medido(origem, chunksize=None):
+    """processar_zip no worker, devolvendo também as medições das etapas desse ZIP para o processo principal."""
+    coletor.limpar()
+    tamanho = len(origem) if isinstance(origem, (bytes, bytearray)) else os.path.getsize(origem)
+    with etapa('processar_zip', bytes_=tamanho):
+        resultados = processar_zip(origem, chunksize)
+    coletor.anotar_memoria('workers')
+    return resultados, coletor.resumo()
+
+
+def _verificar_manifesto(url):
+    """
+    Confere o manifesto antes do download. Se o arquivo não mudou (ETag/Last-Modified) e o trimestre
+    continua no banco, devolve o registro e os DataFrames lidos do banco. Caso contrário devolve None.
+    """
+    registro = manifest.buscar_registro(url)
+    try:
+        remoto = manifest.consultar_remoto(url)
+    except Exception as e:
+        print(f"Aviso: HEAD falhou para {url}, o arquivo será baixado: {e}")
+        remoto = None
+
+    if not manifest.arquivo_inalterado(registro, remoto):
+        return registro, remoto, None
+    return registro, remoto, _trimestre_do_banco(url, registro)
+
+
+def _trimestre_do_banco(url, registro):
+    """
+    DataFrames de um arquivo já carregado, ou None se o banco não tem mais os dados (força o reprocessamento).
+    Lê primeiro do staging Parquet, só o trimestre do arquivo. Sem staging consulta o banco e grava o trimestre
+    no staging para as próximas execuções.
+    """
+    if not registro['linhas']:
+        return []
+    nome = url.split('/')[-1]
+    df = staging.ler(staging.DESPESAS, periodos=[(registro['ano'], registro['trimestre'])])
+    if df is not None:
+        df['valor_limpo'] = centavos_para_texto(df['valor_centavos'])
+        return [(nome, df)]
+    df = ler_despesas_trimestre(registro['ano'], registro['trimestre'])
+    if df.empty:
+        return None
+    _gravar_staging(df, staging.DESPESAS, nome)
+    return [(nome, df)]
+
+
+def reprocessar_staging(df_cadastral, periodos=None):
+    """
+    Refaz o join com o cadastro e a carga a partir das linhas brutas no staging, sem baixar nem ler CSV.
+    Útil quando só o cadastro de operadoras mudou (main.py --reprocessar). `periodos` é uma lista de
+    (ano, trimestre), padrão todos. Um trimestre por vez em memória.
+    Retorna os (ano, trimestre) carregados.
+    """
+    carregados = []
+    indice = obter_indice(df_cadastral)
+    if periodos is None:
+        periodos = staging.periodos_disponiveis(staging.BRUTAS)
+    for ano, trimestre in periodos:
+        df_brutas = staging.ler(staging.BRUTAS, periodos=[(ano, trimestre)])
+        if df_brutas is None:
+            continue
+        nome = f"{trimestre}T{ano}"
+        df_proc = cruzar_cadastro(df_brutas, indice, nome)
+        if df_proc is not None and carregar_despesas(df_proc) is not None:
+            _gravar_staging(df_proc, staging.DESPESAS, nome)
+            print(f"Sucesso: {nome} reprocessado a partir do staging")
+            carregados.append((ano, trimestre))
+    return carregados
+
+
+def agregar_staging(periodos, agregador):
+    """
+    Entrega ao agregador (agregacao.AgregadorIncremental) as despesas carregadas de cada trimestre, lidas do staging
+    só com as colunas que ele usa e só a partição do trimestre. Retorna os (ano, trimestre) encontrados.
+    """
+    encontrados = []
+    for periodo in periodos:
+        df = staging.ler(staging.DESPESAS, colunas=COLUNAS_AGREGADOR, periodos=[periodo])
+        if df is not None:
+            agregador.adicionar(df)
+            encontrados.append(periodo)
+    return encontrados
+
+
+def executar_pipeline(urls_zip, df_cadastral, data_path, limite=3, chunksize=None,
+                      max_downloads=MAX_DOWNLOADS, max_processos=MAX_PROCESSOS, ao_carregar=None, checkpoint=None,
+                      ao_gravar=None):
+    """
+    Baixa, extrai, transforma e carrega os ZIPs de despesas com as etapas sobrepostas:
+    downloads num pool de threads, extração/pandas num pool de processos e um único escritor no banco.
+    Os ZIPs são consumidos na ordem de `urls_zip` (pode ser um gerador) até `limite` arquivos com dados 411.
+    Arquivos sem alteração desde a última execução (manifesto) não são baixados, os dados vêm do banco.
+    Retorna a lista de DataFrames (carregados agora ou já existentes), na mesma ordem.
+    Com `ao_carregar` cada DataFrame é entregue a essa função (na thread do escritor) e descartado em seguida,
+    a lista retornada passa a ter o que a função devolveu. Assim a memória não cresce com a quantidade de trimestres.
+    Com `checkpoint` (checkpoint.Checkpoint) cada arquivo carregado é marcado logo após o commit, e os já marcados
+    por uma execução interrompida não passam nem pelo HEAD, os dados vêm do staging/banco.
+    `ao_gravar(url, linhas)` é chamada para cada arquivo gravado no banco nesta execução (os pulados pelo
+    manifesto/checkpoint não contam), para quem chamou saber se houve carga nova.
+    Se o escritor falhar (banco, manifesto, checkpoint) nenhum arquivo novo é enviado e o erro sobe depois que
+    os pools encerram, quem chamou não recebe uma carga parcial como se estivesse completa.
+    """
+    fila = queue.Queue()
+    carregados = []
+    erros_escritor = []
+
+    def entregar(df_proc):
+        carregados.append(ao_carregar(df_proc) if ao_carregar else df_proc)
+
+    def escritor():
+        try:
+            gravar_fila()
+        except BaseException as e:
+            # Guarda o erro para executar_pipeline, a thread não pode morrer em silêncio com a fila ainda recebendo
+            print(f"Erro no escritor do banco, carga interrompida: {e}")
+            erros_escritor.append(e)
+
+    def gravar_fila():
+        # Único ponto de escrita no banco, evita disputa de conexões e mantém a ordem dos trimestres
+        while True:
+            item = fila.get()
+            if item is None:
+                break
+            url, tarefa, resultados, completo = item
+
+            if tarefa['pulado']:
+                for _, df_proc in resultados:
+                    entregar(df_proc)
+                # Conteúdo igual com cabeçalhos novos: atualiza o manifesto para pular direto no HEAD da próxima vez
+                if tarefa['hash'] is not None:
+                    registro = tarefa['registro']
+                    manifest.registrar(url, tarefa['remoto'], tarefa['hash'], registro['linhas'],
+                                       registro['ano'], registro['trimestre'])
+                if checkpoint and not checkpoint.concluido(url):
+                    registro = tarefa['registro']
+                    checkpoint.marcar(url, registro['linhas'], registro['ano'], registro['trimestre'])
+                continue
+
+            # Uma carga só com todos os CSVs do ZIP: a carga substitui os trimestres que recebe (escopo ano/trimestre),
+            # carregando CSV a CSV o segundo arquivo de um trimestre apagaria as linhas que o primeiro acabou de gravar
+            linhas, ano, trimestre, falhou = 0, None, None, False
+            if resultados and carregar_despesas(pd.concat([df for _, df in resultados], ignore_index=True)) is None:
+                falhou, resultados = True, []
+            for nome_f, df_proc in resultados:
+                entregar(df_proc)
+                _gravar_staging(df_proc, staging.DESPESAS, nome_f)
+                linhas += len(df_proc)
+                ano, trimestre = df_proc['ano'].iloc[0], df_proc['trimestre'].iloc[0]
+                print(f"Sucesso: Dados de despesas encontrados em {nome_f}")
+            if linhas and ao_gravar:
+                ao_gravar(url, linhas)
+
+            # Só entra no manifesto o arquivo que foi carregado por inteiro
+            if completo and not falhou:
+                manifest.registrar(url, tarefa['remoto'], tarefa['hash'], linhas, ano, trimestre)
+                if checkpoint:
+                    checkpoint.marcar(url, linhas, ano, trimestre)
+
+    thread_escritor = threading.Thread(target=escritor, name='escritor-db')
+    thread_escritor.start()
+
+    # Cadastro indexado e validado uma vez por execução, compartilhado com os workers
+    indice = obter_indice(df_cadastral)
+    downloads = ThreadPoolExecutor(max_workers=max_downloads)
+    processos = ProcessPoolExecutor(max_workers=max_processos, initializer=_iniciar_worker,
+                                    initargs=(indice.compartilhar() if indice is not None else None,))
+
+    def baixar_e_agendar(url):
+        tarefa = {"pulado": False, "hash": None, "resultados": None, "futuro": None}
+        # Já carregado antes da interrupção da execução anterior
+        registro = checkpoint.concluido(url) if checkpoint else None
+        if registro is not None:
+            existentes = _trimestre_do_banco(url, registro)
+            if existentes is not None:
+                tarefa.update(pulado=True, resultados=existentes, registro=registro, remoto=None)
+                return tarefa
+
+        tarefa['registro'], tarefa['remoto'], existentes = _verificar_manifesto(url)
+        if existentes is not None:
+            tarefa.update(pulado=True, resultados=existentes)
+            return tarefa
+
+        conteudo = baixar_conteudo(url, data_path)
+        tarefa['hash'] = manifest.calcular_hash(conteudo)
+
+        # Servidor mudou os cabeçalhos mas o conteúdo é o mesmo já carregado
+        registro = tarefa['registro']
+        if registro and registro['hash_conteudo'] == tarefa['hash']:
+            existentes = _trimestre_do_banco(url, registro)
+            if existentes is not None:
+                if isinstance(conteudo, str):
+                    os.remove(conteudo)
+                tarefa.update(pulado=True, resultados=existentes)
+                return tarefa
+
+        # A thread de download fica livre assim que o arquivo chega, o processamento segue no outro pool
+        tarefa['futuro'] = processos.submit(_processar_zip_medido, conteudo, chunksize)
+        return tarefa
+
+    urls = iter(urls_zip)
+    janela = deque()
+    # Adiantamos alguns ZIPs além do que os pools conseguem processar ao mesmo tempo
+    tamanho_janela = max_downloads + max_processos
+
+    def encher_janela():
+        while len(janela) < tamanho_janela:
+            url = next(urls, None)
+            if url is None:
+                break
+            janela.append((url, downloads.submit(baixar_e_agendar, url)))
+
+    enviados = 0
+    try:
+        encher_janela()
+        while janela and enviados < limite and not erros_escritor:
+            url, futuro = janela.popleft()
+            try:
+                tarefa = futuro.result()
+                if tarefa['pulado']:
+                    resultados = tarefa['resultados']
+                else:
+                    resultados, medicoes = tarefa['futuro'].result()
+                    coletor.incorporar(medicoes)
+            except Exception as e:
+                print(f"Erro ao processar {url}: {e}")
+                continue
+
+            validos = [(nome_f, df_proc) for nome_f, df_proc in resultados if df_proc is not None]
+            restantes = limite - enviados
+            fila.put((url, tarefa, validos[:restantes], len(validos) <= restantes))
+            enviados += min(len(validos), restantes)
+
+            encher_janela()
+    finally:
+        for _, futuro in janela:
+            futuro.cancel()
+        downloads.shutdown(wait=True, cancel_futures=True)
+        processos.shutdown(wait=True, cancel_futures=True)
+        if indice is not None:
+            indice.remover()
+        fila.put(None)
+        thread_escritor.join()
+
+    if erros_escritor:
+        raise erros_escritor[0]
+    return carregados
@@ -1,241 +1,326 @@
+import re
+import json
+import base64
 from sqlalchemy import text
 from database import SessionLocal
+from cache import CacheLRU
+
+# SQL e conversão das linhas ficam fora da classe para serem compartilhados com o repositório assíncrono
+# (repository_async.py), as duas APIs devolvem exatamente o mesmo JSON.
+# O execution_options(consulta=...) é o rótulo do histograma de latência em /api/metrics (metricas.py).
+
+SQL_MAIOR_CRESCIMENTO = text("""
+WITH periodos AS (
+    SELECT
+        COALESCE(CAST(:inicio AS INTEGER), MIN(periodo)) as min_periodo,
+        COALESCE(CAST(:fim AS INTEGER), MAX(periodo)) as max_periodo
+    FROM mv_despesas_operadora_trimestre
+),
+crescimento AS (
+    SELECT
+        m.reg_ans,
+        SUM(m.total) FILTER (WHERE m.periodo = p.min_periodo) as total_inicial,
+        SUM(m.total) FILTER (WHERE m.periodo = p.max_periodo) as total_final
+    FROM periodos p
+    JOIN mv_despesas_operadora_trimestre m ON m.periodo IN (p.min_periodo, p.max_periodo)
+    GROUP BY m.reg_ans
+)
+SELECT
+    o.registro_ans,
+    o.razao_social,
+    c.total_inicial,
+    c.total_final,
+    ROUND(((c.total_final - c.total_inicial) / c.total_inicial) * 100, 2) as crescimento_percentual
+FROM crescimento c
+JOIN operadoras_ativas o ON c.reg_ans = o.registro_ans
+WHERE c.total_inicial > 0 AND c.total_final IS NOT NULL
+ORDER BY crescimento_percentual DESC
+LIMIT 5;
+""").execution_options(consulta="maior_crescimento")
+
+SQL_ACIMA_MEDIA = text("""
+WITH analise_performance AS (
+    SELECT
+        reg_ans,
+        total > AVG(total) OVER (PARTITION BY periodo) as acima_da_media
+    FROM mv_despesas_operadora_trimestre
+    WHERE periodo BETWEEN COALESCE(CAST(:inicio AS INTEGER), 0) AND COALESCE(CAST(:fim AS INTEGER), 99999)
+)
+SELECT COUNT(*) as qtd_operadoras_top_gastos
+FROM (
+    SELECT reg_ans
+    FROM analise_performance
+    GROUP BY reg_ans
+    HAVING COUNT(*) FILTER (WHERE acima_da_media) >= 2
+) operadoras_filtradas;
+""").execution_options(consulta="acima_media")
+
+SQL_DETALHES = text("SELECT * FROM operadoras_ativas WHERE cnpj = :cnpj").execution_options(consulta="detalhes_operadora")
+
+SQL_HISTORICO = text("""
+    SELECT d.ano, d.trimestre, d.vl_saldo_final, d.cd_conta_contabil
+    FROM despesas_consolidadas d
+    JOIN operadoras_ativas o ON d.reg_ans = o.registro_ans
+    WHERE o.cnpj = :cnpj
+    ORDER BY d.ano DESC, d.trimestre DESC
+""").execution_options(consulta="historico_despesas")
+
+# Versão dos dados publicada pelo ETL (ver cache.py), lida na mesma conexão da listagem
+SQL_VERSAO_DADOS = text("SELECT versao FROM versao_dados WHERE id = 1").execution_options(consulta="versao_dados")
+
+# Ordem da listagem. Razão social ausente entra como texto vazio (primeiro), assim o cursor e o OFFSET veem as
+# mesmas linhas: numa comparação de tupla com NULL a linha nunca seria "maior" que o cursor. Índice na migração 7
+ORDEM_OPERADORAS = "COALESCE(razao_social, '')"
+
+def codificar_cursor(razao_social, registro_ans):
+    """Cursor opaco da paginação keyset: última (razao_social, registro_ans) entregue."""
+    return base64.urlsafe_b64encode(json.dumps([razao_social or '', registro_ans]).encode()).decode()
+
+def decodificar_cursor(cursor):
+    try:
+        razao_social, registro_ans = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return razao_social or '', registro_ans
+    except Exception:
+        raise ValueError("Cursor de paginação inválido")
+
+def chave_periodo(texto):
+    """Trimestre no formato dos arquivos da ANS (3T2025) -> chave da coluna periodo (20253). ValueError se inválido."""
+    encontrado = re.fullmatch(r'\s*([1-4])T(\d{4})\s*', texto or '', re.IGNORECASE)
+    if not encontrado:
+        raise ValueError(f"Período inválido: {texto} (use o formato 3T2025)")
+    return int(encontrado.group(2)) * 10 + int(encontrado.group(1))
+
+def sql_despesas_por_uf(inicio=None, fim=None):
+    """Sem período lê a view mv_despesas_uf, com período agrega só os trimestres do intervalo."""
+    if inicio is None and fim is None:
+        origem = "mv_despesas_uf"
+    else:
+        origem = """(
+            SELECT o.uf, SUM(m.total) AS despesa_total, COUNT(DISTINCT m.reg_ans) AS qtd_operadoras
+            FROM mv_despesas_operadora_trimestre m
+            JOIN operadoras_ativas o ON m.reg_ans = o.registro_ans
+            WHERE m.periodo BETWEEN COALESCE(CAST(:inicio AS INTEGER), 0) AND COALESCE(CAST(:fim AS INTEGER), 99999)
+            GROUP BY o.uf
+        ) despesas_uf"""
+
+    return text(f"""
+    SELECT
+        uf,
+        despesa_total,
+        qtd_operadoras,
+        ROUND(despesa_total / qtd_operadoras, 2) as media_por_operadora
+    FROM {origem}
+    ORDER BY despesa_total DESC
+    LIMIT 5;
+    """).execution_options(consulta="despesas_por_uf")
+
+def montar_busca_operadoras(page, limit, termo_busca=None, cursor=None):
+    """
+    Monta a listagem de operadoras (Item 4.2 e 4.3). Retorna (sql, params, sql_contagem, params_contagem).
+    Com cursor a página começa depois da última (razao_social, registro_ans) entregue, sem OFFSET.
+    """
+    # Base da query
+    query_str = "SELECT registro_ans, cnpj, razao_social, modalidade, uf FROM operadoras_ativas"
+    condicoes = []
+    params = {}
+
+    # Adiciona filtro de busca se houver (Item 4.3), os dois lados usam índice de trigramas
+    if termo_busca:
+        busca = ["razao_social ILIKE :busca"]
+        params["busca"] = f"%{termo_busca}%"
+        digitos = re.sub(r'[^0-9]', '', termo_busca)
+        if digitos:
+            busca.append("cnpj_digitos LIKE :busca_cnpj")
+            params["busca_cnpj"] = f"%{digitos}%"
+        condicoes.append(f"({' OR '.join(busca)})")
+
+    filtro = f" WHERE {' AND '.join(condicoes)}" if condicoes else ""
+    params_contagem = dict(params)
+
+    if cursor:
+        razao_cursor, registro_cursor = decodificar_cursor(cursor)
+        condicoes.append(f"({ORDEM_OPERADORAS}, registro_ans) > (:razao_cursor, :registro_cursor)")
+        params["razao_cursor"] = razao_cursor
+        params["registro_cursor"] = registro_cursor
+        params["offset"] = 0
+    else:
+        params["offset"] = (page - 1) * limit
+
+    if condicoes:
+        query_str += f" WHERE {' AND '.join(condicoes)}"
+    # registro_ans desempata razões sociais iguais, o cursor precisa de uma ordem única
+    query_str += f" ORDER BY {ORDEM_OPERADORAS}, registro_ans LIMIT :limit OFFSET :offset"
+    params["limit"] = limit + 1 # Uma linha a mais para saber se existe próxima página
+
+    return (text(query_str).execution_options(consulta="listar_operadoras"), params,
+            text(f"SELECT COUNT(*) FROM operadoras_ativas{filtro}").execution_options(consulta="contar_operadoras"),
+            params_contagem)
+
+def chave_contagem(versao, params_contagem):
+    """Total por versão dos dados e termo de busca: uma carga nova do ETL já conta de novo."""
+    return f"{versao or 0}:{sorted(params_contagem.items())!r}"
+
+def linha_crescimento(row):
+    return {
+        "registro_ans": row.registro_ans,
+        "razao_social": row.razao_social,
+        "total_inicial": float(row.total_inicial),
+        "total_final": float(row.total_final),
+        "crescimento_percentual": float(row.crescimento_percentual)
+    }
+
+def linha_uf(row):
+    return {
+        "uf": row.uf,
+        "despesa_total": float(row.despesa_total),
+        "qtd_operadoras": int(row.qtd_operadoras),
+        "media_por_operadora": float(row.media_por_operadora)
+    }
+
+def linha_operadora(row):
+    return {
+        "registro_ans": row.registro_ans,
+        "cnpj": row.cnpj,
+        "razao_social": row.razao_social,
+        "modalidade": row.modalidade,
+        "uf": row.uf
+    }
+
+def linha_despesa(row):
+    return {
+        "ano": row.ano,
+        "trimestre": row.trimestre,
+        "valor": float(row.vl_saldo_final),
+        "conta": row.cd_conta_contabil
+    }
+
+def pagina_operadoras(result, page, limit, total):
+    """Resposta da listagem com metadados (item 4.2) e o cursor da próxima página, se houver."""
+    next_cursor = None
+    if len(result) > limit:
+        ultima = result[limit - 1]
+        next_cursor = codificar_cursor(ultima.razao_social, ultima.registro_ans)
+    operadoras = [linha_operadora(row) for row in result[:limit]]
+    return {"data": operadoras, "total": total, "page": page, "limit": limit, "next_cursor": next_cursor}
 
 class OperadoraRepository():
     def __init__(self):
         self.db = SessionLocal
-    
-    def get_maior_crescimento(self):
-        """Query de maior crescimento percentual de despesas"""
-
-        sql = text("""
-        WITH periodos AS (
-            SELECT 
-                MIN(ano * 10 + trimestre) as min_periodo,
-                MAX(ano * 10 + trimestre) as max_periodo
-            FROM despesas_consolidadas
-        ),
-        despesas_inicio AS (
-            SELECT d.reg_ans, SUM(d.vl_saldo_final) as total_inicial
-            FROM despesas_consolidadas d
-            JOIN periodos p ON (d.ano * 10 + d.trimestre) = p.min_periodo
-            GROUP BY d.reg_ans
-            HAVING SUM(d.vl_saldo_final) > 0
-        ),
-        despesas_fim AS (
-            SELECT d.reg_ans, SUM(d.vl_saldo_final) as total_final
-            FROM despesas_consolidadas d
-            JOIN periodos p ON (d.ano * 10 + d.trimestre) = p.max_periodo
-            GROUP BY d.reg_ans
-        )
-        SELECT 
-            o.registro_ans,
-            o.razao_social,
-            di.total_inicial,
-            df.total_final,
-            ROUND(((df.total_final - di.total_inicial) / di.total_inicial) * 100, 2) as crescimento_percentual
-        FROM despesas_inicio di
-        JOIN despesas_fim df ON di.reg_ans = df.reg_ans
-        JOIN operadoras_ativas o ON di.reg_ans = o.registro_ans
-        ORDER BY crescimento_percentual DESC
-        LIMIT 5;
-        """)
-        
-        db = None 
+        # Totais da busca por termo, o cadastro só muda quando o ETL roda
+        self._cache_contagem = CacheLRU(max_itens=256)
+
+    def get_maior_crescimento(self, inicio=None, fim=None):
+        """
+        Query de maior crescimento percentual de despesas entre dois períodos (padrão: o primeiro e o último carregados).
+        `inicio`/`fim` são chaves de período (ano * 10 + trimestre, ver chave_periodo). Lê da view só as linhas dos dois
+        períodos comparados, pelo índice de periodo, e monta inicial/final numa única passada.
+        """
+        db = None
         try:
             db = self.db()
-            result = db.execute(sql).fetchall() # Converte o resultado (lista de tuplas) em lista de dicionários para a API
-
-            return [
-                {
-                    "registro_ans": row.registro_ans,
-                    "razao_social": row.razao_social,
-                    "total_inicial": float(row.total_inicial),
-                    "total_final": float(row.total_final),
-                    "crescimento_percentual": float(row.crescimento_percentual)
-                } 
-                for row in result
-            ]
+            result = db.execute(SQL_MAIOR_CRESCIMENTO, {"inicio": inicio, "fim": fim}).fetchall() # Converte o resultado (lista de tuplas) em lista de dicionários para a API
+
+            return [linha_crescimento(row) for row in result]
         except Exception as e:
             print(f"Erro ao executar query de crescimento: {e}")
-            return []
+            raise
         finally:
             if db is not None:
                 db.close()
 
 
-    def get_despesas_por_uf(self):
+    def get_despesas_por_uf(self, inicio=None, fim=None):
         """
         Executa a Query 2: Distribuição por UF.
+        Sem período lê a view materializada mv_despesas_uf, atualizada pelo ETL ao final de cada carga.
+        Com `inicio`/`fim` agrega só os trimestres do intervalo a partir da view por operadora/trimestre.
         """
-        sql = text("""
-        SELECT 
-            o.uf,
-            SUM(d.vl_saldo_final) as despesa_total,
-            COUNT(DISTINCT d.reg_ans) as qtd_operadoras,
-            ROUND(SUM(d.vl_saldo_final) / COUNT(DISTINCT d.reg_ans), 2) as media_por_operadora
-        FROM despesas_consolidadas d
-        JOIN operadoras_ativas o ON d.reg_ans = o.registro_ans
-        GROUP BY o.uf
-        ORDER BY despesa_total DESC
-        LIMIT 5;
-        """)
-        
         db = None
         try:
             db = self.db()
-            result = db.execute(sql).fetchall()
-
-            return [
-                {
-                    "uf": row.uf,
-                    "despesa_total": float(row.despesa_total),
-                    "qtd_operadoras": int(row.qtd_operadoras),
-                    "media_por_operadora": float(row.media_por_operadora)
-                }
-                for row in result
-            ]
+            result = db.execute(sql_despesas_por_uf(inicio, fim), {"inicio": inicio, "fim": fim}).fetchall()
+
+            return [linha_uf(row) for row in result]
         except Exception as e:
             print(f"Erro na query por UF: {e}")
-            return []
+            raise
         finally:
             if db is not None:
                 db.close()
 
 
-    def get_operadoras_acima_media(self):
+    def get_operadoras_acima_media(self, inicio=None, fim=None):
         """
-        Executa a Query 3: Operadoras consistentemente acima da média.
+        Executa a Query 3: Operadoras acima da média do mercado em pelo menos 2 trimestres (do intervalo, se informado).
+        A média de cada trimestre vem de uma window function, numa única leitura da view.
         """
-        sql = text("""
-        WITH despesas_por_trimestre AS (
-            SELECT reg_ans, ano, trimestre, SUM(vl_saldo_final) as total_operadora
-            FROM despesas_consolidadas
-            GROUP BY reg_ans, ano, trimestre
-        ),
-        media_geral_trimestre AS (
-            SELECT ano, trimestre, AVG(total_operadora) as media_mercado
-            FROM despesas_por_trimestre
-            GROUP BY ano, trimestre
-        ),
-        analise_performance AS (
-            SELECT 
-                d.reg_ans,
-                CASE WHEN d.total_operadora > m.media_mercado THEN 1 ELSE 0 END as acima_da_media
-            FROM despesas_por_trimestre d
-            JOIN media_geral_trimestre m ON d.ano = m.ano AND d.trimestre = m.trimestre
-        )
-        SELECT COUNT(*) as qtd_operadoras_top_gastos
-        FROM (
-            SELECT reg_ans
-            FROM analise_performance
-            GROUP BY reg_ans
-            HAVING SUM(acima_da_media) >= 2
-        ) operadoras_filtradas;
-        """)
-        
         db = None
         try:
             db = self.db()
-            result = db.execute(sql).scalar() # scalar() pega o único valor retornado
+            result = db.execute(SQL_ACIMA_MEDIA, {"inicio": inicio, "fim": fim}).scalar() # scalar() pega o único valor retornado
 
             return {"qtd_operadoras_consistentes": result}
         except Exception as e:
             print(f"Erro na query de consistência: {e}")
-            return {"qtd_operadoras_consistentes": 0}
+            raise
         finally:
             if db is not None:
                 db.close()
-                
-    def get_todas_operadoras(self, page=1, limit=10, termo_busca=None):
-        """Busca operadoras com paginação e filtro opcional (Item 4.2 e 4.3)"""
-        offset = (page - 1) * limit
-        
-        # Base da query
-        query_str = "SELECT registro_ans, cnpj, razao_social, modalidade, uf FROM operadoras_ativas"
-        params = {}
-        
-        # Adiciona filtro de busca se houver (Item 4.3)
-        if termo_busca:
-            query_str += " WHERE razao_social ILIKE :busca OR cnpj ILIKE :busca"
-            params["busca"] = f"%{termo_busca}%"
-        
-        query_str += " ORDER BY razao_social LIMIT :limit OFFSET :offset"
-        params["limit"] = limit
-        params["offset"] = offset
-        
-        # Query para contar total (para metadados da paginação)
-        count_query_str = "SELECT COUNT(*) FROM operadoras_ativas"
-        if termo_busca:
-            count_query_str += " WHERE razao_social ILIKE :busca OR cnpj ILIKE :busca"
+
+    def _contar_operadoras(self, db, sql_contagem, params):
+        """
+        Total para os metadados da paginação, guardado em cache por versão dos dados e termo de busca
+        em vez de recontar a cada página.
+        """
+        chave = chave_contagem(db.execute(SQL_VERSAO_DADOS).scalar(), params)
+        encontrado, total = self._cache_contagem.get(chave)
+        if not encontrado:
+            total = db.execute(sql_contagem, params).scalar()
+            self._cache_contagem.set(chave, total)
+        return total
+
+    def get_todas_operadoras(self, page=1, limit=10, termo_busca=None, cursor=None):
+        """
+        Busca operadoras com paginação e filtro opcional (Item 4.2 e 4.3).
+        Com `cursor` (devolvido em next_cursor) a paginação é por keyset: o tempo não cresce com a profundidade da página.
+        Sem cursor continua valendo page/limit (OFFSET), para compatibilidade com o frontend.
+        """
+        sql, params, sql_contagem, params_contagem = montar_busca_operadoras(page, limit, termo_busca, cursor)
 
         db = None
         try:
             db = self.db()
             # Busca dados
-            result = db.execute(text(query_str), params).fetchall()
-            operadoras = [
-                {
-                    "registro_ans": row.registro_ans,
-                    "cnpj": row.cnpj,
-                    "razao_social": row.razao_social,
-                    "uf": row.uf,
-                    "modalidade": row.modalidade
-                } for row in result
-            ]
-            
+            result = db.execute(sql, params).fetchall()
             # Busca total para paginação
-            total = db.execute(text(count_query_str), params).scalar()
-            
-            return {"data": operadoras, "total": total, "page": page, "limit": limit}
+            total = self._contar_operadoras(db, sql_contagem, params_contagem)
+
+            return pagina_operadoras(result, page, limit, total)
         except Exception as e:
             print(f"Erro ao buscar operadoras: {e}")
-            return {"data": [], "total": 0}
+            raise
         finally:
             if db: db.close()
 
     def get_operadora_detalhes(self, cnpj_busca):
         """Busca detalhes de uma operadora específica pelo CNPJ"""
-        sql = text("SELECT * FROM operadoras_ativas WHERE cnpj = :cnpj")
-        
         db = None
         try:
             db = self.db()
-            row = db.execute(sql, {"cnpj": cnpj_busca}).fetchone()
-            
+            row = db.execute(SQL_DETALHES, {"cnpj": cnpj_busca}).fetchone()
+
             if row:
-                return {
-                    "registro_ans": row.registro_ans,
-                    "cnpj": row.cnpj,
-                    "razao_social": row.razao_social,
-                    "modalidade": row.modalidade,
-                    "uf": row.uf
-                }
+                return linha_operadora(row)
             return None
         finally:
             if db: db.close()
 
     def get_despesas_historico(self, cnpj_busca):
         """Busca histórico de despesas de uma operadora pelo CNPJ"""
-        sql = text("""
-            SELECT d.ano, d.trimestre, d.vl_saldo_final, d.cd_conta_contabil
-            FROM despesas_consolidadas d
-            JOIN operadoras_ativas o ON d.reg_ans = o.registro_ans
-            WHERE o.cnpj = :cnpj
-            ORDER BY d.ano DESC, d.trimestre DESC
-        """)
-        
         db = None
         try:
             db = self.db()
-            result = db.execute(sql, {"cnpj": cnpj_busca}).fetchall()
-            return [
-                {
-                    "ano": row.ano,
-                    "trimestre": row.trimestre,
-                    "valor": float(row.vl_saldo_final),
-                    "conta": row.cd_conta_contabil
-                } for row in result
-            ]
+            result = db.execute(SQL_HISTORICO, {"cnpj": cnpj_busca}).fetchall()
+            return [linha_despesa(row) for row in result]
         finally:
             if db: db.close()
@@ -0,0 +1,76 @@
+from repository import (
+    SQL_MAIOR_CRESCIMENTO, SQL_ACIMA_MEDIA, SQL_DETALHES, SQL_HISTORICO, SQL_VERSAO_DADOS,
+    sql_despesas_por_uf, montar_busca_operadoras, chave_contagem, pagina_operadoras,
+    linha_crescimento, linha_uf, linha_operadora, linha_despesa,
+)
+from cache import CacheLRU
+
+
+class OperadoraRepositoryAsync():
+    """
+    Mesmas consultas e respostas do OperadoraRepository, sobre uma AsyncEngine (asyncpg).
+    Cada método pega a própria conexão do pool, então as consultas de uma rota podem rodar juntas com asyncio.gather.
+    """
+
+    def __init__(self, engine):
+        self.engine = engine
+        self._cache_contagem = CacheLRU(max_itens=256)
+
+    async def _buscar(self, sql, params):
+        async with self.engine.connect() as conn:
+            result = await conn.execute(sql, params)
+            return result.fetchall()
+
+    async def get_maior_crescimento(self, inicio=None, fim=None):
+        try:
+            result = await self._buscar(SQL_MAIOR_CRESCIMENTO, {"inicio": inicio, "fim": fim})
+            return [linha_crescimento(row) for row in result]
+        except Exception as e:
+            print(f"Erro ao executar query de crescimento: {e}")
+            raise
+
+    async def get_despesas_por_uf(self, inicio=None, fim=None):
+        try:
+            result = await self._buscar(sql_despesas_por_uf(inicio, fim), {"inicio": inicio, "fim": fim})
+            return [linha_uf(row) for row in result]
+        except Exception as e:
+            print(f"Erro na query por UF: {e}")
+            raise
+
+    async def get_operadoras_acima_media(self, inicio=None, fim=None):
+        try:
+            result = await self._buscar(SQL_ACIMA_MEDIA, {"inicio": inicio, "fim": fim})
+            return {"qtd_operadoras_consistentes": result[0][0]}
+        except Exception as e:
+            print(f"Erro na query de consistência: {e}")
+            raise
+
+    async def get_todas_operadoras(self, page=1, limit=10, termo_busca=None, cursor=None):
+        """Listagem paginada (page/limit ou cursor), ver OperadoraRepository.get_todas_operadoras."""
+        sql, params, sql_contagem, params_contagem = montar_busca_operadoras(page, limit, termo_busca, cursor)
+
+        try:
+            async with self.engine.connect() as conn:
+                result = (await conn.execute(sql, params)).fetchall()
+
+                versao = (await conn.execute(SQL_VERSAO_DADOS)).scalar()
+                chave = chave_contagem(versao, params_contagem)
+                encontrado, total = self._cache_contagem.get(chave)
+                if not encontrado:
+                    total = (await conn.execute(sql_contagem, params_contagem)).scalar()
+                    self._cache_contagem.set(chave, total)
+
+            return pagina_operadoras(result, page, limit, total)
+        except Exception as e:
+            print(f"Erro ao buscar operadoras: {e}")
+            raise
+
+    async def get_operadora_detalhes(self, cnpj_busca):
+        result = await self._buscar(SQL_DETALHES, {"cnpj": cnpj_busca})
+        if result:
+            return linha_operadora(result[0])
+        return None
+
+    async def get_despesas_historico(self, cnpj_busca):
+        result = await self._buscar(SQL_HISTORICO, {"cnpj": cnpj_busca})
+        return [linha_despesa(row) for row in result]
@@ -0,0 +1,112 @@
+import os
+import glob
+from pathlib import Path
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+    DISPONIVEL = True
+except ImportError:  # Sem pyarrow o ETL segue só com o banco, como antes
+    DISPONIVEL = False
+
+# Fica fora de temp_downloads, que é apagada no fim de cada execução
+DIRETORIO_STAGING = os.getenv('ETL_STAGING_DIR', str(Path.cwd() / 'staging'))
+
+# Conjuntos gravados pelo ETL:
+# despesas_brutas -> linhas 411 já limpas, antes do join com o cadastro (reprocessar sem baixar/ler o CSV de novo)
+# despesas        -> resultado do join/validação, o mesmo que foi carregado no banco
+BRUTAS = 'despesas_brutas'
+DESPESAS = 'despesas'
+
+if DISPONIVEL:
+    # Partições no formato ano=2025/trimestre=3, com tipos fixos para a leitura não depender de inferência
+    PARTICIONAMENTO = ds.partitioning(pa.schema([('ano', pa.int16()), ('trimestre', pa.int8())]), flavor='hive')
+
+    # Valores em centavos inteiros, UF e conta como dicionário (categóricos no pandas)
+    TIPOS_COLUNAS = {
+        'reg_ans': pa.string(),
+        'cd_conta_contabil': pa.dictionary(pa.int32(), pa.string()),
+        'valor_centavos': pa.int64(),
+        'registro_ans': pa.string(),
+        'cnpj': pa.string(),
+        'razao_social': pa.string(),
+        'uf': pa.dictionary(pa.int8(), pa.string()),
+    }
+
+
+def _diretorio_particao(conjunto, ano, trimestre, base):
+    return os.path.join(base, conjunto, f"ano={int(ano)}", f"trimestre={int(trimestre)}")
+
+
+def _tabela_arrow(df):
+    colunas = [c for c in TIPOS_COLUNAS if c in df.columns]
+    tabela = pa.Table.from_pandas(df[colunas], preserve_index=False)
+    return tabela.cast(pa.schema([(c, TIPOS_COLUNAS[c]) for c in colunas]))
+
+
+def gravar(df, conjunto, nome_origem, base=DIRETORIO_STAGING):
+    """
+    Grava as linhas de um arquivo de origem nas partições ano/trimestre do conjunto.
+    Cada origem ocupa um arquivo próprio dentro da partição (parte-<origem>.parquet), então gravar de novo
+    o mesmo arquivo substitui só a parte dele. A escrita é num .tmp renomeado no final (os.replace).
+    Retorna a quantidade de linhas gravadas (0 sem pyarrow).
+    """
+    if not DISPONIVEL or df is None or df.empty:
+        return 0
+
+    nome_parte = f"parte-{os.path.splitext(os.path.basename(nome_origem))[0]}.parquet"
+    for (ano, trimestre), grupo in df.groupby(['ano', 'trimestre'], observed=True):
+        destino = _diretorio_particao(conjunto, ano, trimestre, base)
+        os.makedirs(destino, exist_ok=True)
+        # Temporário com prefixo '.', ignorado pela leitura do dataset enquanto não é renomeado
+        temporario = os.path.join(destino, f".{nome_parte}.tmp")
+        pq.write_table(_tabela_arrow(grupo), temporario, compression='zstd')
+        os.replace(temporario, os.path.join(destino, nome_parte))
+    return len(df)
+
+
+def _filtro_periodos(periodos):
+    """Expressão (ano, trimestre) IN periodos, resolvida pelos nomes das pastas sem abrir os arquivos."""
+    expressao = None
+    for ano, trimestre in periodos:
+        termo = (ds.field('ano') == int(ano)) & (ds.field('trimestre') == int(trimestre))
+        expressao = termo if expressao is None else expressao | termo
+    return expressao
+
+
+def ler(conjunto, colunas=None, periodos=None, base=DIRETORIO_STAGING):
+    """
+    Lê o conjunto como DataFrame. `colunas` limita o que sai do disco (leitura colunar) e `periodos`,
+    lista de (ano, trimestre), descarta as partições fora do filtro antes da leitura.
+    ano e trimestre voltam como texto, igual ao que sai da leitura do CSV. None se não houver dados.
+    """
+    if not DISPONIVEL or not os.path.isdir(os.path.join(base, conjunto)):
+        return None
+
+    dataset = ds.dataset(os.path.join(base, conjunto), format='parquet', partitioning=PARTICIONAMENTO)
+    filtro = _filtro_periodos(periodos) if periodos is not None else None
+    if periodos is not None and filtro is None:
+        return None
+
+    tabela = dataset.to_table(columns=colunas, filter=filtro)
+    if tabela.num_rows == 0:
+        return None
+
+    df = tabela.to_pandas()
+    for coluna in ('ano', 'trimestre'):
+        if coluna in df.columns:
+            df[coluna] = df[coluna].astype(str)
+    return df
+
+
+def periodos_disponiveis(conjunto, base=DIRETORIO_STAGING):
+    """(ano, trimestre) de todas as partições gravadas no conjunto, do mais recente para o mais antigo."""
+    periodos = []
+    for caminho in glob.glob(os.path.join(base, conjunto, 'ano=*', 'trimestre=*')):
+        if glob.glob(os.path.join(caminho, '*.parquet')):
+            ano = os.path.basename(os.path.dirname(caminho)).split('=')[1]
+            trimestre = os.path.basename(caminho).split('=')[1]
+            periodos.append((ano, trimestre))
+    return sorted(periodos, key=lambda p: (int(p[0]), int(p[1])), reverse=True)
+
@@ -0,0 +1,55 @@
+import os
+import sys
+
+import pytest
+
+# Os módulos do backend são planos (import limpeza, import pipeline...), como quando o ETL/API rodam desta pasta
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Testes que precisam de Postgres usam um banco descartável: TEST_DATABASE_URL (o schema public é recriado).
+# Tem que valer antes do primeiro import de database.py, que monta a engine a partir de DATABASE_URL
+TEST_DATABASE_URL = os.getenv('TEST_DATABASE_URL')
+if TEST_DATABASE_URL:
+    os.environ['DATABASE_URL'] = TEST_DATABASE_URL
+
+ANOS_TESTE = (2023, 2024, 2025)
+OPERADORAS_TESTE = 3000
+
+
+@pytest.fixture(scope='session')
+def banco_postgres():
+    """
+    Banco de teste com o schema completo (create_all + migrações + views), particionado por ano,
+    e uma massa pequena de operadoras/despesas em ANOS_TESTE. Pula os testes sem TEST_DATABASE_URL.
+    """
+    if not TEST_DATABASE_URL or not TEST_DATABASE_URL.startswith('postgresql'):
+        pytest.skip("TEST_DATABASE_URL (Postgres) não definido")
+    from sqlalchemy import text
+    from database import engine, criar_tabelas
+    from migracoes import garantir_particoes_despesas
+    from agregados import atualizar_agregados
+
+    with engine.begin() as conn:
+        conn.execute(text("DROP SCHEMA public CASCADE"))
+        conn.execute(text("CREATE SCHEMA public"))
+    criar_tabelas()
+    garantir_particoes_despesas(engine, ANOS_TESTE)
+
+    with engine.begin() as conn:
+        # Algumas operadoras sem razão social, para a paginação por cursor ter NULLs no meio
+        conn.execute(text("""
+            INSERT INTO operadoras_ativas (registro_ans, cnpj, razao_social, modalidade, uf)
+            SELECT lpad(i::text, 6, '0'), lpad((i * 7919)::text, 14, '0'),
+                   CASE WHEN i % 50 = 0 THEN NULL ELSE 'Operadora ' || (i % 700) END,
+                   'Medicina de Grupo', (ARRAY['SP', 'RJ', 'MG', 'RS'])[1 + i % 4]
+            FROM generate_series(1, :n) i
+        """), {"n": OPERADORAS_TESTE})
+        conn.execute(text("""
+            INSERT INTO despesas_consolidadas (reg_ans, cd_conta_contabil, vl_saldo_final, ano, trimestre)
+            SELECT lpad(i::text, 6, '0'), '4111' || c, (i * 13 + t * 7 + c) * 10.5, a, t
+            FROM generate_series(1, 800) i, generate_series(1, 4) t, generate_series(1, 2) c, unnest(CAST(:anos AS int[])) a
+        """), {"anos": list(ANOS_TESTE)})
+    atualizar_agregados(engine)
+    with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+        conn.execute(text("ANALYZE"))
+    return engine
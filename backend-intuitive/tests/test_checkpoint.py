@@ -0,0 +1,47 @@
+import json
+import os
+
+import pytest
+
+from checkpoint import Checkpoint
+
+PARAMETROS = {"trimestres": 3}
+
+
+def test_retoma_o_que_foi_marcado(tmp_path):
+    caminho = str(tmp_path / 'etl_checkpoint.json')
+    Checkpoint(caminho, PARAMETROS).marcar('http://ans/1T2025.zip', 135, 2025, 1)
+
+    retomado = Checkpoint(caminho, PARAMETROS)
+    assert retomado.concluido('http://ans/1T2025.zip')['linhas'] == 135
+    # Outra configuração não herda o progresso
+    assert Checkpoint(caminho, {"trimestres": 12}).concluidos == {}
+
+
+def test_falha_na_gravacao_nao_marca_nem_corrompe(tmp_path, monkeypatch):
+    caminho = str(tmp_path / 'etl_checkpoint.json')
+    checkpoint = Checkpoint(caminho, PARAMETROS)
+    checkpoint.marcar('http://ans/1T2025.zip', 135, 2025, 1)
+    with open(caminho, encoding='utf-8') as f:
+        antes = f.read()
+
+    def replace_interrompido(origem, destino):
+        raise OSError("disco cheio")
+
+    monkeypatch.setattr(os, 'replace', replace_interrompido)
+    with pytest.raises(OSError):
+        checkpoint.marcar('http://ans/2T2025.zip', 140, 2025, 2)
+    monkeypatch.undo()
+
+    # Arquivo anterior intacto, sem temporário sobrando, e a memória diz o mesmo que o disco
+    with open(caminho, encoding='utf-8') as f:
+        assert f.read() == antes
+    assert os.listdir(tmp_path) == ['etl_checkpoint.json']
+    assert checkpoint.concluido('http://ans/2T2025.zip') is None
+    assert list(json.loads(antes)['concluidos']) == list(checkpoint.concluidos)
+
+
+def test_arquivo_ilegivel_comeca_do_zero(tmp_path):
+    caminho = tmp_path / 'etl_checkpoint.json'
+    caminho.write_text('{"parametros": {"trimestres": 3}, "concluidos": {"http://ans/1T', encoding='utf-8')
+    assert Checkpoint(str(caminho), PARAMETROS).concluidos == {}
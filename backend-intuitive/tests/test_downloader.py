@@ -0,0 +1,52 @@
+import os
+import socket
+from types import SimpleNamespace
+
+import pytest
+import requests
+
+from benchmarks.espelho_ans import servir
+from downloader import Downloader, TAMANHO_BLOCO
+
+TAMANHO = 3 * TAMANHO_BLOCO
+# Depois do primeiro bloco gravado, para sobrar o que retomar
+CORTE = TAMANHO_BLOCO + TAMANHO_BLOCO // 2
+
+
+def _porta_livre():
+    with socket.socket() as s:
+        s.bind(('localhost', 0))
+        return s.getsockname()[1]
+
+
+@pytest.fixture
+def espelho(tmp_path):
+    """Espelho local com um ZIP de 3 MB cuja primeira resposta cai depois de CORTE bytes."""
+    pasta = tmp_path / 'espelho'
+    pasta.mkdir()
+    conteudo = os.urandom(TAMANHO)
+    (pasta / '1T2025.zip').write_bytes(conteudo)
+    porta = _porta_livre()
+    servidor = servir(pasta, porta, cortar_apos=CORTE, em_segundo_plano=True)
+    yield f"http://localhost:{porta}/1T2025.zip", conteudo
+    servidor.shutdown()
+    servidor.server_close()
+
+
+def test_conexao_cortada_retoma_com_range(espelho, tmp_path):
+    url, conteudo = espelho
+    downloader = Downloader(tmp_path / 'cache', sessao=requests.Session(), tentativas=3)
+
+    medicao = SimpleNamespace(bytes=0)
+    download = downloader.baixar(url, medicao)
+    with open(download.caminho, 'rb') as f:
+        assert f.read() == conteudo
+    downloader.liberar(download)
+    # Retomou do que já estava em parciais/: cada byte passou pela rede uma vez só
+    assert medicao.bytes == TAMANHO
+    assert not os.listdir(tmp_path / 'cache' / 'parciais')
+
+    # Próxima execução: 304, nada passa pela rede
+    medicao = SimpleNamespace(bytes=0)
+    download = Downloader(tmp_path / 'cache', sessao=requests.Session()).baixar(url, medicao)
+    assert download.do_cache and medicao.bytes == 0
@@ -0,0 +1,125 @@
+import re
+from decimal import Decimal
+
+import pandas as pd
+import pytest
+
+import etl_process
+from benchmarks.fixtures_ans import gerar_conjunto
+from etl_process import ler_despesas_brutas, cruzar_cadastro
+from indice_operadoras import IndiceOperadoras
+from validate_docbr import CNPJ
+
+CABECALHO = '"DATA";"REG_ANS";"CD_CONTA_CONTABIL";"DESCRICAO";"VL_SALDO_INICIAL";"VL_SALDO_FINAL"\n'
+
+
+def _linha(reg_ans, conta, valor):
+    return f'"2025-07-01";"{reg_ans}";"{conta}";"Descrição";"{valor}";"0"\n'
+
+
+def test_bloco_sem_linhas_411_nao_vira_centavos_em_float(tmp_path):
+    caminho = tmp_path / '3T2025.csv'
+    # Último bloco (chunksize=2) só com conta fora do 411
+    caminho.write_text(CABECALHO + _linha('300001', '411', '10,25') + _linha('300002', '4111', '1234,56')
+                       + _linha('300003', '311', '5,00'), encoding='utf-8')
+    df = ler_despesas_brutas(str(caminho), chunksize=2, nome_arquivo='3T2025.csv')
+    assert df['valor_centavos'].dtype == 'int64'
+    assert df['valor_centavos'].tolist() == [1025, 123456]
+
+
+# Transformação original (antes da leitura em blocos, do índice do cadastro e dos centavos), sem a carga no banco.
+# Serve de referência: a versão atual tem que produzir as mesmas linhas
+def _cadastro_original(path_csv):
+    for enc in ['utf-8-sig', 'utf-8', 'latin1', 'cp1252']:
+        try:
+            df_cad = pd.read_csv(path_csv, sep=';', encoding=enc, dtype=str)
+            break
+        except Exception:
+            continue
+    df_cad.columns = df_cad.columns.str.strip().str.lower().str.replace(' ', '_')
+    mapeamento = {
+        next(c for c in df_cad.columns if 'registro' in c and ('operadora' in c or 'ans' in c) and 'data' not in c): 'registro_ans',
+        next(c for c in df_cad.columns if 'cnpj' in c): 'cnpj',
+        next(c for c in df_cad.columns if 'razao' in c or 'social' in c): 'razao_social',
+        next(c for c in df_cad.columns if 'uf' in c): 'uf',
+    }
+    df_clean = df_cad.rename(columns=mapeamento)[list(mapeamento.values())].copy()
+    df_clean['registro_ans'] = df_clean['registro_ans'].astype(str).str.strip().str.replace(
+        r'\.0$', '', regex=True).str.zfill(6)
+    return df_clean.drop_duplicates(subset=['registro_ans'])
+
+
+def _despesas_originais(path_csv, nome_arquivo, df_cadastral):
+    for enc in ['utf-8', 'latin1', 'cp1252']:
+        try:
+            df = pd.read_csv(path_csv, sep=';', encoding=enc, dtype=str)
+            break
+        except Exception:
+            continue
+    df = df.rename(columns={col: col.upper() for col in df.columns})
+    col_conta = next(c for c in df.columns if 'CONTA' in c)
+    col_valor = next(c for c in df.columns if 'VALOR' in c or 'SALDO' in c)
+    col_reg_ans = next(c for c in df.columns if 'REG' in c and 'ANS' in c)
+    col_data = next(c for c in df.columns if 'DATA' in c)
+
+    df_filtrado = df[df[col_conta].str.startswith('411', na=False)].copy()
+
+    def limpar_valor(val):
+        try:
+            return Decimal(str(val).replace(',', '.'))
+        except Exception:
+            return Decimal('0.00')
+
+    df_filtrado['valor_limpo'] = df_filtrado[col_valor].apply(limpar_valor)
+    df_filtrado = df_filtrado[df_filtrado['valor_limpo'] > 0].copy()
+    df_filtrado['ano'] = df_filtrado[col_data].str.extract(r'(\d{4})')[0]
+    tri_match = re.search(r'(\d)T', nome_arquivo)
+    df_filtrado['trimestre'] = tri_match.group(1) if tri_match else "1"
+    df_filtrado = df_filtrado.dropna(subset=['ano', 'trimestre'])
+
+    df_filtrado[col_reg_ans] = df_filtrado[col_reg_ans].astype(str).str.strip().str.replace(
+        r'\.0$', '', regex=True).str.zfill(6)
+    df_filtrado = pd.merge(df_filtrado, df_cadastral[['registro_ans', 'cnpj', 'razao_social', 'uf']],
+                           left_on=col_reg_ans, right_on='registro_ans', how='inner')
+    df_filtrado = df_filtrado.drop_duplicates(subset=[col_reg_ans, col_conta, 'valor_limpo', 'ano', 'trimestre'])
+
+    validador = CNPJ()
+    df_filtrado = df_filtrado[df_filtrado['cnpj'].apply(
+        lambda v: False if pd.isna(v) else validador.validate(re.sub(r'\D', '', str(v))))]
+
+    return pd.DataFrame({
+        'reg_ans': df_filtrado[col_reg_ans], 'cd_conta_contabil': df_filtrado[col_conta],
+        'valor_centavos': [int(v * 100) for v in df_filtrado['valor_limpo']],
+        'ano': df_filtrado['ano'], 'trimestre': df_filtrado['trimestre'],
+        'cnpj': df_filtrado['cnpj'], 'razao_social': df_filtrado['razao_social'], 'uf': df_filtrado['uf'],
+    })
+
+
+def _linhas(df):
+    colunas = ['reg_ans', 'cd_conta_contabil', 'valor_centavos', 'ano', 'trimestre', 'cnpj', 'razao_social', 'uf']
+    return sorted(tuple(str(v) for v in linha) for linha in df[colunas].itertuples(index=False))
+
+
+@pytest.fixture(scope='module')
+def fixtures_ans(tmp_path_factory):
+    """Três trimestres sintéticos pequenos (UTF-8, Latin-1 e UTF-8 com BOM) e o cadastro."""
+    return gerar_conjunto(tmp_path_factory.mktemp('fixtures_ans'), trimestres=3, linhas_trimestre=5000,
+                          operadoras=120)
+
+
+@pytest.mark.parametrize('chunksize', [None, 700])
+def test_transformacao_igual_a_original_linha_a_linha(fixtures_ans, chunksize, monkeypatch):
+    caminho_cadastro, arquivos = fixtures_ans
+    # Só a leitura do cadastro, sem gravar operadoras_ativas
+    monkeypatch.setattr(etl_process, 'copiar_dataframe', lambda *args, **kwargs: None)
+    cadastro = etl_process.carregar_operadoras(caminho_cadastro)
+    cadastro_original = _cadastro_original(caminho_cadastro)
+    colunas = ['registro_ans', 'cnpj', 'razao_social', 'uf']
+    assert cadastro[colunas].values.tolist() == cadastro_original[colunas].values.tolist()
+
+    indice = IndiceOperadoras.do_cadastro(cadastro)
+    for nome, caminho, _ in arquivos:
+        atual = cruzar_cadastro(ler_despesas_brutas(caminho, chunksize, nome), indice, nome)
+        original = _despesas_originais(caminho, nome, cadastro_original)
+        assert len(original) > 0
+        assert _linhas(atual) == _linhas(original)
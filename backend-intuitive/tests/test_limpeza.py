@@ -0,0 +1,51 @@
+import re
+
+import numpy as np
+import pandas as pd
+from validate_docbr import CNPJ
+
+from benchmarks.fixtures_ans import cnpjs_validos
+from limpeza import valores_para_centavos, centavos_para_texto, validar_cnpjs, _centavos_decimal, LIMITE_CENTAVOS
+
+
+def test_valores_formato_brasileiro():
+    serie = pd.Series(['1234,56', '-10,5', '1.234,56', '1.234,565', '7', None, 'abc'])
+    assert valores_para_centavos(serie).tolist() == [123456, -1050, 123456, 123457, 700, 0, 0]
+
+
+def test_valor_fora_do_numeric_vira_zero_sem_derrubar_o_lote():
+    serie = pd.Series(['1,5', '99999999999999999999,00', '1e30'])
+    assert valores_para_centavos(serie).tolist() == [150, 0, 0]
+
+
+def test_maior_valor_do_numeric_preservado():
+    serie = pd.Series(['9999999999999999,99', '-9999999999999999,99'])
+    centavos = valores_para_centavos(serie)
+    assert centavos.tolist() == [LIMITE_CENTAVOS - 1, -(LIMITE_CENTAVOS - 1)]
+    assert centavos_para_texto(centavos).tolist() == ['9999999999999999.99', '-9999999999999999.99']
+
+
+def test_caminho_vetorizado_igual_ao_decimal():
+    # Mesma resposta do caminho lento (Decimal, linha a linha) para o formato simples e para os desvios dele
+    rng = np.random.default_rng(7)
+    inteiros = rng.integers(0, 10 ** 13, 2000)
+    valores = [f"{n},{c:02d}" for n, c in zip(inteiros, rng.integers(0, 100, 2000))]
+    valores += [f"-{n}.{c}" for n, c in zip(inteiros[:300], rng.integers(0, 10, 300))]
+    valores += [str(n) for n in inteiros[:300]]
+    valores += ['1.234.567,89', '0,005', '2,675', '-0,125', '1e3', ' 12,30 ', '+7,1', '', 'NaN', 'inf', '12,3,4']
+    serie = pd.Series(valores)
+    esperado = [_centavos_decimal(v) for v in valores]
+    assert valores_para_centavos(serie).tolist() == esperado
+
+
+def test_validacao_de_cnpj_igual_ao_validate_docbr():
+    validos = cnpjs_validos(np.random.default_rng(3).integers(0, 10, size=(500, 12)))
+    invalidos = [c[:-1] + str((int(c[-1]) + 1) % 10) for c in validos[:200]]
+    formatados = [f"{c[:2]}.{c[2:5]}.{c[5:8]}/{c[8:12]}-{c[12:]}" for c in validos[:100]]
+    outros = ['00000000000000', '11111111111111', '1234567800019', '123456780001999', '', None, 'abc']
+    serie = pd.Series(validos + invalidos + formatados + outros)
+
+    validador = CNPJ()
+    esperado = [False if pd.isna(v) else validador.validate(re.sub(r'\D', '', str(v))) for v in serie]
+    assert validar_cnpjs(serie).tolist() == esperado
+    assert sum(esperado) == 600
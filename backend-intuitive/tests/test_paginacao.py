@@ -0,0 +1,44 @@
+"""Listagem de operadoras: as páginas por cursor (keyset) trazem as mesmas linhas, na mesma ordem, que as por OFFSET."""
+import pytest
+
+from conftest import OPERADORAS_TESTE
+
+# Menor que as 60 operadoras sem razão social do fixture: alguns cursores caem no meio delas
+LIMITE = 25
+
+
+def _por_offset(repo, termo_busca=None):
+    linhas, pagina = [], 1
+    while True:
+        dados = repo.get_todas_operadoras(pagina, LIMITE, termo_busca)['data']
+        if not dados:
+            return linhas
+        linhas += [d['registro_ans'] for d in dados]
+        pagina += 1
+
+
+def _por_cursor(repo, termo_busca=None):
+    linhas, cursor = [], None
+    while True:
+        resposta = repo.get_todas_operadoras(1, LIMITE, termo_busca, cursor)
+        linhas += [d['registro_ans'] for d in resposta['data']]
+        cursor = resposta['next_cursor']
+        if cursor is None:
+            return linhas
+
+
+@pytest.fixture(scope='module')
+def repo(banco_postgres):
+    from repository import OperadoraRepository
+    return OperadoraRepository()
+
+
+def test_cursor_percorre_todas_as_operadoras_como_o_offset(repo):
+    por_cursor = _por_cursor(repo)
+    assert len(por_cursor) == len(set(por_cursor)) == OPERADORAS_TESTE
+    assert por_cursor == _por_offset(repo)
+
+
+def test_cursor_com_busca(repo):
+    por_cursor = _por_cursor(repo, 'Operadora 1')
+    assert por_cursor and por_cursor == _por_offset(repo, 'Operadora 1')
@@ -0,0 +1,102 @@
+"""
+Regressão dos planos de execução (EXPLAIN) das consultas do repositório e do ETL, sobre o banco do fixture
+banco_postgres. Cada consulta enviada ao banco é analisada com enable_seqscan=off: se ainda assim aparecer
+Seq Scan numa tabela monitorada, não existe índice que atenda a consulta. Consultas de um período precisam
+ler uma única partição de despesas.
+"""
+import pytest
+from sqlalchemy import event, text
+
+from migracoes import TABELA_DESPESAS
+
+# Tabelas grandes, onde Seq Scan numa consulta seletiva é regressão (partições entram pelo prefixo)
+TABELAS_MONITORADAS = (TABELA_DESPESAS, 'operadoras_ativas', 'mv_despesas_operadora_trimestre')
+
+
+def capturar_sql(engine, funcao, *args):
+    """Chama `funcao` e devolve os (sql, parâmetros) enviados ao banco durante a chamada."""
+    capturados = []
+
+    def ao_executar(conn, cursor, statement, parameters, context, executemany):
+        # Só as consultas da aplicação, sem as do catálogo que o pandas/SQLAlchemy fazem por conta própria
+        if statement.lstrip().upper().startswith(('SELECT', 'WITH')) and 'pg_catalog' not in statement:
+            capturados.append((statement, parameters))
+
+    event.listen(engine, 'before_cursor_execute', ao_executar)
+    try:
+        funcao(*args)
+    finally:
+        event.remove(engine, 'before_cursor_execute', ao_executar)
+    return capturados
+
+
+def _nos(plano):
+    yield plano
+    for filho in plano.get('Plans', []):
+        yield from _nos(filho)
+
+
+def analisar(engine, sql, parametros):
+    """(tipo do nó, relação) de cada nó do plano, com seq scan desabilitado."""
+    with engine.connect() as conn:
+        conn.execute(text("SET enable_seqscan = off"))
+        cursor = conn.connection.cursor()
+        cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", parametros)
+        plano = cursor.fetchone()[0][0]['Plan']
+        conn.rollback()
+    return [(no['Node Type'], no.get('Relation Name')) for no in _nos(plano)]
+
+
+def planos(engine, funcao, *args):
+    consultas = capturar_sql(engine, funcao, *args)
+    assert consultas, "nenhuma consulta capturada"
+    return [analisar(engine, sql, parametros) for sql, parametros in consultas]
+
+
+@pytest.fixture(scope='module')
+def dados(banco_postgres):
+    from repository import OperadoraRepository
+    with banco_postgres.connect() as conn:
+        cnpj = conn.execute(text("""
+            SELECT o.cnpj FROM operadoras_ativas o
+            WHERE EXISTS (SELECT 1 FROM despesas_consolidadas d WHERE d.reg_ans = o.registro_ans) LIMIT 1
+        """)).scalar()
+        primeiro, ultimo = conn.execute(text("SELECT MIN(periodo), MAX(periodo) FROM despesas_consolidadas")).fetchone()
+        trigrama = bool(conn.execute(text("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")).scalar())
+    repo = OperadoraRepository()
+    cursor = repo.get_todas_operadoras(1, 10)['next_cursor']
+    return {"repo": repo, "cnpj": cnpj, "primeiro": primeiro, "ultimo": ultimo, "cursor": cursor, "trigrama": trigrama}
+
+
+CASOS = {
+    "get_maior_crescimento": lambda d: (d['repo'].get_maior_crescimento,),
+    "get_despesas_por_uf": lambda d: (d['repo'].get_despesas_por_uf,),
+    "get_operadoras_acima_media": lambda d: (d['repo'].get_operadoras_acima_media,),
+    "get_maior_crescimento (intervalo)": lambda d: (d['repo'].get_maior_crescimento, d['primeiro'], d['ultimo']),
+    "get_despesas_por_uf (intervalo)": lambda d: (d['repo'].get_despesas_por_uf, d['ultimo'], d['ultimo']),
+    "get_operadoras_acima_media (intervalo)": lambda d: (d['repo'].get_operadoras_acima_media, d['ultimo'], d['ultimo']),
+    "get_todas_operadoras (página)": lambda d: (d['repo'].get_todas_operadoras, 1, 10),
+    "get_todas_operadoras (cursor)": lambda d: (d['repo'].get_todas_operadoras, 1, 10, None, d['cursor']),
+    "get_todas_operadoras (busca)": lambda d: (d['repo'].get_todas_operadoras, 1, 10, d['cnpj'][:6]),
+    "get_operadora_detalhes": lambda d: (d['repo'].get_operadora_detalhes, d['cnpj']),
+    "get_despesas_historico": lambda d: (d['repo'].get_despesas_historico, d['cnpj']),
+}
+
+
+@pytest.mark.parametrize('nome', list(CASOS))
+def test_repositorio_usa_indice(banco_postgres, dados, nome):
+    if 'busca' in nome and not dados['trigrama']:
+        pytest.skip("pg_trgm não instalado")
+    funcao, *args = CASOS[nome](dados)
+    for nos in planos(banco_postgres, funcao, *args):
+        seq_scans = [relacao for tipo, relacao in nos
+                     if tipo == 'Seq Scan' and relacao and relacao.startswith(TABELAS_MONITORADAS)]
+        assert not seq_scans, f"Seq Scan em {seq_scans}"
+
+
+def test_consulta_de_um_trimestre_le_uma_particao(banco_postgres):
+    from etl_process import ler_despesas_trimestre
+    for nos in planos(banco_postgres, ler_despesas_trimestre, 2024, 3):
+        lidas = {relacao for _, relacao in nos if relacao and relacao.startswith(TABELA_DESPESAS)}
+        assert lidas == {f"{TABELA_DESPESAS}_2024"}
+        assert not [r for t, r in nos if t == 'Seq Scan' and r and r.startswith(TABELAS_MONITORADAS)]